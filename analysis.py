@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""Анализ позиции: лучшие линии полного хода для головоломок и разборов.
+
+Позиция берётся из сохранения (F5, .kcs) или из повтора (.kcr, --at N —
+после N-го действия). Поиск идёт лучом по действиям хода до его конца:
+на каждом шаге остаются beam лучших продолжений, одинаковые позиции,
+пришедшие разными путями, отбрасываются по общей таблице транспозиций.
+Первые действия хода делятся между процессами пула; позиция и итоги
+лежат в общей памяти (shm_store). Найденные линии дополнительно
+проверяются ответом встроенного ИИ за соперника — счёт линии считается
+после его хода.
+
+    python analysis.py quicksave.kcs --seconds 5 --top 5
+    python analysis.py replays/20250101-120000.kcr --at 140 --show
+
+--show открывает поле: линия подсвечивается, 1…9 — выбрать линию,
+←/→ — пройти её по действию, ESC — выход.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import knights_and_castles as kc
+import shm_store
+
+TOP = 5
+BEAM = 32
+SECONDS = 5.0
+REPLY_SHARE = 0.25   # доля времени на ответы соперника
+WIN_SCORE = 100000
+_LABELS = ("выбор", "ход", "прыжок", "выстрел", "руины", "заклинание", "оружие",
+           "следующий", "конец хода", "снять выбор", "сдача")
+_MARKS = {kc.ACT_SELECT: "sel", kc.ACT_MOVE: "move", kc.ACT_JUMP: "attack",
+          kc.ACT_SHOOT: "attack"}
+
+
+# ========================== ОЦЕНКА ==========================
+
+def unit_value(u):
+    return 10 * u.hp + 4 * max(0, u.armor) + 3 * u.damage
+
+
+def evaluate(game, player):
+    """Статическая оценка позиции за игрока player."""
+    if game.state == "game_over":
+        return 0 if game.winner is None else WIN_SCORE if game.winner == player else -WIN_SCORE
+    enemy = 3 - player
+    b = game.board
+    inv = game.inventory
+    score = sum(map(unit_value, b.player_units(player))) \
+        - sum(map(unit_value, b.player_units(enemy)))
+    score += 3 * (sum(n for _, n in inv[player].items()) - sum(n for _, n in inv[enemy].items()))
+    if game.fire_shield[player]:
+        score += 10
+    # Позиционно: ближе к врагу — лучше (как у ИИ, только слабее материала)
+    for u in b.player_units(player):
+        score -= b.nearest_unit(u.row, u.col, enemy)[1]
+    return score
+
+
+def describe(action):
+    code, a, b = action
+    if code in _MARKS:
+        return f"{_LABELS[code]} ({a},{b})"
+    if code == kc.ACT_SPELL:
+        return f"{_LABELS[code]} «{kc.SPELL_RECIPES[a]['name']}»"
+    if code == kc.ACT_CRAFT:
+        return f"{_LABELS[code]} «{kc.WEAPON_RECIPES[a]['name']}»"
+    return _LABELS[code]
+
+
+def strip_ai(state):
+    """Сохранение без флагов ИИ: при загрузке никто не начнёт планировать."""
+    data = bytearray(state)
+    data[kc._SAVE_FLAGS_AT] &= kc._FLAG_SHIELD1 | kc._FLAG_SHIELD2
+    return bytes(data)
+
+
+# ========================== ПОИСК ==========================
+
+def _reply(game, player):
+    """Ответ встроенного ИИ за соперника до конца его хода."""
+    ai = kc.AIPlayer(game, 3 - player)
+    ai.start_turn()
+    while game.state != "game_over" and game.current_player != player:
+        game.apply_action(ai.next_action(), record=False)
+
+
+def _useful(game):
+    """legal_actions без пустых действий: выбрать юнит и сразу закончить
+    его ход или весь ход — то же, что не выбирать."""
+    unit = game.selected_unit
+    if unit is None or unit.moves_left < unit.max_moves:
+        return game.legal_actions()
+    return [a for a in game.legal_actions() if a[0] not in (kc.ACT_NEXT, kc.ACT_END)]
+
+
+def search(root, roots, deadline, beam=BEAM, reply=True, tt=None):
+    """Луч по ходу из позиции root, начиная с первых действий roots.
+
+    Возвращает ([(счёт, линия, ключ конечной позиции)], узлов). Линия
+    заканчивается переходом хода к сопернику (или концом партии).
+    """
+    game = kc.Game(headless=True)
+    game.replay = None
+    game.load_state(root)
+    player = game.current_player
+    nodes = 0
+    done = []                     # (счёт, линия, сохранение в конце хода)
+    frontier = [([], root)]
+    first = True
+    reply_at = deadline - (deadline - time.perf_counter()) * REPLY_SHARE if reply else deadline
+    while frontier and time.perf_counter() < reply_at:
+        grown = []
+        for line, state in frontier:
+            game.load_state(state)
+            actions = roots if first else _useful(game)
+            for i, action in enumerate(actions):
+                if i:
+                    game.load_state(state)
+                game.apply_action(action, record=False)
+                nodes += 1
+                after = game.save_state()
+                if game.current_player != player or game.state == "game_over":
+                    done.append((evaluate(game, player), line + [action], after))
+                    continue
+                key = shm_store.position_key(after)
+                if tt is not None:
+                    if tt.get(key) is not None:
+                        continue      # сюда уже пришла другая линия
+                    tt.put(key, evaluate(game, player), len(line) + 1)
+                grown.append((evaluate(game, player), line + [action], after))
+            if time.perf_counter() >= reply_at:
+                break
+        first = False
+        grown.sort(key=lambda x: -x[0])
+        frontier = [(line, after) for _, line, after in grown[:beam]]
+    # Не успели — недосмотренные линии заканчиваем ходом прямо сейчас
+    for line, state in frontier:
+        game.load_state(state)
+        game.apply_action((kc.ACT_END, 0, 0), record=False)
+        nodes += 1
+        done.append((evaluate(game, player), line + [(kc.ACT_END, 0, 0)], game.save_state()))
+
+    done.sort(key=lambda x: -x[0])
+    result = []
+    seen = set()
+    for score, line, after in done:
+        key = shm_store.position_key(after)
+        if key in seen:
+            continue
+        seen.add(key)
+        if reply and time.perf_counter() < deadline:
+            game.load_state(after)
+            _reply(game, player)
+            nodes += 1
+            score = evaluate(game, player)
+        result.append((score, line, key))
+        if len(result) >= beam:
+            break
+    result.sort(key=lambda x: -x[0])
+    return result, nodes
+
+
+def _work(args):
+    store_name, tt_name, slot, roots, deadline, beam, reply = args
+    store = shm_store.PositionStore(name=store_name)
+    tt = shm_store.TranspositionTable(name=tt_name)
+    try:
+        lines, nodes = search(bytes(store.state(0)), roots, deadline, beam, reply, tt)
+        best = lines[0] if lines else (0, [shm_store.NO_ACTION])
+        store.publish(slot, best[0], nodes, best[1][0])
+        return lines
+    finally:
+        store.close()
+        tt.close()
+
+
+def analyse(state, seconds=SECONDS, top=TOP, beam=BEAM, workers=None, reply=True):
+    """Лучшие top линий хода из позиции state за seconds секунд.
+
+    Возвращает ([(счёт, линия)], узлов, секунд).
+    """
+    state = strip_ai(state)
+    game = kc.Game(headless=True)
+    game.load_state(state)
+    if game.state == "game_over":
+        return [], 0, 0.0
+    roots = _useful(game)
+    workers = max(1, min(workers or os.cpu_count(), len(roots)))
+    t = time.perf_counter()
+    # deadline — по perf_counter: у процессов пула общие монотонные часы
+    deadline = t + seconds
+    with shm_store.PositionStore(workers + 1, len(state)) as store, \
+            shm_store.TranspositionTable(18) as tt:
+        store.put(0, state)
+        jobs = [(store.name, tt.name, w + 1, roots[w::workers], deadline, beam, reply)
+                for w in range(workers)]
+        if workers > 1:
+            with ProcessPoolExecutor(workers) as pool:
+                found = [x for lines in pool.map(_work, jobs) for x in lines]
+        else:
+            found = _work(jobs[0])
+        nodes = sum(store.result(w + 1)[1] for w in range(workers))
+    elapsed = time.perf_counter() - t
+    found.sort(key=lambda x: -x[0])
+    lines = []
+    seen = set()
+    for score, line, key in found:
+        if key not in seen:
+            seen.add(key)
+            lines.append((score, line))
+    return lines[:top], nodes, elapsed
+
+
+# ========================== ПРОСМОТР ==========================
+
+class AnalysisViewer:
+    """Поле с подсвеченной линией: 1…9 — линия, ←/→ — по действию, ESC — выход."""
+
+    def __init__(self, game, state, lines, nodes, elapsed):
+        self.game = game
+        self.game.replay = None
+        self.state = state
+        self.lines = lines
+        self.stats = f"{nodes} узлов, {nodes / max(elapsed, 1e-9):.0f} узл/с"
+        self.line = 0
+        self.pos = 0
+        self.goto(0)
+
+    def goto(self, pos):
+        g = self.game
+        score, line = self.lines[self.line]
+        self.pos = max(0, min(pos, len(line)))
+        g.load_state(self.state)
+        for action in line[:self.pos]:
+            g.apply_action(action, record=False)
+        g.marks = [(a, b, _MARKS[code]) for code, a, b in line[self.pos:] if code in _MARKS]
+        nxt = describe(line[self.pos]) if self.pos < len(line) else "конец линии"
+        g.banner = (f"Линия {self.line + 1}/{len(self.lines)}: {score:+d}, "
+                    f"шаг {self.pos}/{len(line)} — {nxt} ({self.stats})")
+
+    def run(self):
+        import pygame
+        g = self.game
+        while True:
+            g.clock.tick(kc.FPS)
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return
+                if event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE:
+                        return
+                    if event.key == pygame.K_RIGHT:
+                        self.goto(self.pos + 1)
+                    elif event.key == pygame.K_LEFT:
+                        self.goto(self.pos - 1)
+                    elif pygame.K_1 <= event.key < pygame.K_1 + len(self.lines):
+                        self.line = event.key - pygame.K_1
+                        self.goto(0)
+                elif event.type == pygame.MOUSEBUTTONDOWN and event.button in (4, 5):
+                    g.camera.zoom(1 if event.button == 4 else -1, *event.pos)
+            g.draw()
+
+
+def load_position(path, at=None):
+    """Сохранение позиции: из .kcs как есть, из повтора — после at действий
+    (по умолчанию — конец повтора)."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] == kc.SAVE_MAGIC:
+        return data
+    replay = kc.Replay.from_bytes(data)
+    at = len(replay) if at is None else at
+    game = kc.Game(headless=True)
+    snapshot = dict(replay.snapshots).get(at) if at > 0 else None
+    if snapshot is None:
+        replay.seek(game, at)
+        return game.save_state()
+    # На снимке сверяемся: доходим до него от предыдущего снимка
+    replay.seek(game, at - 1)
+    game.apply_action(replay.action(at - 1), record=False)
+    if game.save_state() != snapshot:
+        raise ValueError(f"позиция {at} расходится со снимком повтора")
+    return snapshot
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Анализ позиции")
+    parser.add_argument("path", help="сохранение (.kcs) или повтор (.kcr)")
+    parser.add_argument("--at", type=int, metavar="N", help="позиция повтора после N действий")
+    parser.add_argument("--seconds", type=float, default=SECONDS)
+    parser.add_argument("--top", type=int, default=TOP)
+    parser.add_argument("--beam", type=int, default=BEAM,
+                        help="сколько продолжений держать на каждом шаге хода")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--no-reply", action="store_true",
+                        help="не проверять линии ответом ИИ за соперника")
+    parser.add_argument("--show", action="store_true", help="показать линии на поле")
+    args = parser.parse_args(argv)
+
+    try:
+        state = load_position(args.path, args.at)
+    except (OSError, ValueError) as e:
+        sys.exit(f"{args.path}: {e}")
+    lines, nodes, elapsed = analyse(state, args.seconds, args.top, args.beam,
+                                    args.workers, not args.no_reply)
+    player = kc.decode_save(state)["current_player"]
+    print(f"ход игрока {player}: {nodes} узлов за {elapsed:.1f} с "
+          f"({nodes / max(elapsed, 1e-9):.0f} узл/с)")
+    for i, (score, line) in enumerate(lines, 1):
+        print(f"{i}. {score:+d}  " + " → ".join(map(describe, line)))
+    if args.show and lines:
+        import pygame
+        screen = pygame.display.set_mode((kc.WIDTH, kc.HEIGHT))
+        pygame.display.set_caption("Рыцари и Замки — анализ")
+        clock = pygame.time.Clock()
+        kc.load_assets(screen, clock)
+        AnalysisViewer(kc.Game(screen=screen, clock=clock), strip_ai(state),
+                       lines, nodes, elapsed).run()
+        pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Оценка ходов ИИ сразу для многих позиций на NumPy.
+
+Те же слагаемые, что в AIPlayer._score_move, только над массивами:
+приближение к ближайшему врагу, руины и башня мага, кавалерия и лучник
+для ходов; урон, убийство и добивание для атак. Результат совпадает
+со скалярной версией до единицы — в том числе выбор ближайшего врага
+при равных дистанциях (меньший uid, как в SpatialIndex.nearest).
+
+Пачка — это P позиций (юнит на доске) и K клеток-кандидатов, каждая
+со ссылкой на свою позицию. gather() собирает пачку из партий; ядра
+score_moves() и score_attacks() работают только с массивами и годятся
+для листьев поиска и наград в rl_env.
+
+    batch = batch_eval.gather([(game, unit, game.move_highlights), ...])
+    scores = batch_eval.score_moves(**batch)
+"""
+
+import numpy as np
+
+import knights_and_castles as kc
+from terrain import TERRAIN_RUINS, TERRAIN_TOWER, terrain
+
+TYPE_CAVALRY = kc.UNIT_TYPE_IDS["cavalry"]
+TYPE_ARCHER = kc.UNIT_TYPE_IDS["archer"]
+NO_ENEMY = 9999   # дистанция, когда врагов нет (как у SpatialIndex.nearest)
+
+
+# ========================== ЯДРА ==========================
+
+def score_moves(src, enemies, n_enemies, kind, spell_ready, pos, dst, site):
+    """Счёт хода для K клеток.
+
+    src (P, 2) — где стоит юнит позиции; enemies (P, E, 2) — живые враги
+    в порядке uid, n_enemies (P,) — сколько из E настоящие (остальное —
+    хвост-заполнитель); kind (P,) — UNIT_TYPE_IDS юнита; spell_ready (P,) —
+    хватает ли артефактов хоть на одно заклинание. pos (K,) — номер
+    позиции клетки, dst (K, 2) — сама клетка, site (K,) — рельеф TERRAIN_*
+    под ней. Возвращает int64 (K,).
+    """
+    src = np.asarray(src, np.int64)
+    enemies = np.asarray(enemies, np.int64)
+    dst = np.asarray(dst, np.int64)
+    pos = np.asarray(pos, np.intp)
+    n_enemies = np.asarray(n_enemies)
+    e = enemies.shape[1]
+    if e:
+        valid = np.arange(e) < n_enemies[:, None]
+        d = np.abs(enemies - src[:, None, :]).sum(axis=2)
+        d = np.where(valid, d, NO_ENEMY)
+        # argmin берёт первый минимум — враги идут по uid
+        nearest = d.argmin(axis=1)
+        d_before = d[np.arange(len(src)), nearest]
+        target = enemies[np.arange(len(src)), nearest]
+    else:
+        d_before = np.full(len(src), NO_ENEMY, np.int64)
+        target = np.zeros((len(src), 2), np.int64)
+    has = (n_enemies > 0)[pos]
+    d_after = np.abs(dst - target[pos]).sum(axis=1)
+    d_before = d_before[pos]
+
+    score = np.where(has & (d_after < d_before), 20 * (d_before - d_after), 0)
+    site = np.asarray(site)
+    score += np.where(site == TERRAIN_RUINS, 50, 0)
+    score += np.where(site == TERRAIN_TOWER, np.where(np.asarray(spell_ready)[pos], 200, 5), 0)
+    k = np.asarray(kind)[pos]
+    score += np.where(has & (k == TYPE_CAVALRY), np.maximum(0, 10 - d_after) * 3, 0)
+    score += np.where(has & (k == TYPE_ARCHER) & (d_after >= 2), 10, 0)
+    return score
+
+
+def score_attacks(damage, shielded, hp, armor):
+    """Счёт атаки для K пар (атакующий, цель): урон атакующего, огненный
+    щит у цели, HP и броня цели. Возвращает int64 (K,)."""
+    damage = np.asarray(damage, np.int64)
+    hp = np.asarray(hp, np.int64)
+    dmg = np.where(shielded, np.maximum(0, damage - 2), damage)
+    effective = np.maximum(0, dmg - np.maximum(0, armor))
+    score = np.where(hp - effective <= 0, 10000, 100 * effective)
+    return score + np.where(hp <= damage, 500, 0)
+
+
+# ========================== СБОР ПАЧЕК ==========================
+
+_terrain_cache = {}
+
+
+def _terrain(board):
+    # Рельеф зависит только от размера поля
+    key = (board.rows, board.cols)
+    t = _terrain_cache.get(key)
+    if t is None:
+        t = _terrain_cache[key] = terrain(board)
+    return t
+
+
+def gather(items):
+    """Пачка для score_moves из [(game, unit, клетки)], по позиции на элемент."""
+    p = len(items)
+    foes = [game.board.player_units(3 - unit.player) for game, unit, _ in items]
+    e = max(map(len, foes), default=0)
+    src = np.empty((p, 2), np.int64)
+    enemies = np.zeros((p, e, 2), np.int64)
+    n_enemies = np.empty(p, np.int64)
+    kind = np.empty(p, np.int8)
+    spell_ready = np.empty(p, bool)
+    pos, dst, site = [], [], []
+    for i, ((game, unit, cells), units) in enumerate(zip(items, foes)):
+        src[i] = unit.row, unit.col
+        n_enemies[i] = len(units)
+        if units:
+            enemies[i, :len(units)] = [(u.row, u.col) for u in units]
+        kind[i] = kc.UNIT_TYPE_IDS[unit.unit_type]
+        spell_ready[i] = bool(game.inventory[unit.player].craftable() & kc.SPELL_MASK)
+        if cells:
+            cells = np.asarray(cells, np.int64).reshape(-1, 2)
+            pos.append(np.full(len(cells), i, np.intp))
+            dst.append(cells)
+            site.append(_terrain(game.board)[cells[:, 0], cells[:, 1]])
+    if dst:
+        pos, dst, site = np.concatenate(pos), np.concatenate(dst), np.concatenate(site)
+    else:
+        pos, dst, site = np.empty(0, np.intp), np.empty((0, 2), np.int64), np.empty(0, np.int8)
+    return {"src": src, "enemies": enemies, "n_enemies": n_enemies, "kind": kind,
+            "spell_ready": spell_ready, "pos": pos, "dst": dst, "site": site}
+
+
+def gather_attacks(items):
+    """Массивы для score_attacks из [(game, атакующий, цель)]."""
+    return {"damage": [u.damage for _, u, _ in items],
+            "shielded": [game.fire_shield.get(t.player, False) for game, _, t in items],
+            "hp": [t.hp for _, _, t in items],
+            "armor": [t.armor for _, _, t in items]}
+
+
+def score_unit(game, unit):
+    """Все ходы и атаки выбранного юнита за один вызов ядер:
+    ([(клетка, счёт)] ходов, [(клетка, счёт)] атак) — как в _best_actions.
+
+    Подсветка выбранного юнита партии остаётся прежней: calc_moves
+    заменяет поля новыми объектами, так что их хватает вернуть на место.
+    """
+    saved = (game.move_highlights, game.attack_highlights, game.jump_targets,
+             game.move_costs, game.jump_costs, game._moves_cache)
+    try:
+        game.calc_moves(unit)
+        moves = list(game.move_highlights)
+        if unit.unit_type == "archer":
+            attacks = [(cell, game.board.unit_at(*cell)) for cell in game.attack_highlights]
+            attacks = [(cell, t) for cell, t in attacks if t and t.player != unit.player]
+        else:
+            attacks = list(game.jump_targets.items())
+    finally:
+        (game.move_highlights, game.attack_highlights, game.jump_targets,
+         game.move_costs, game.jump_costs, game._moves_cache) = saved
+    mv = score_moves(**gather([(game, unit, moves)])).tolist() if moves else []
+    at = score_attacks(**gather_attacks([(game, unit, t) for _, t in attacks])).tolist() \
+        if attacks else []
+    return list(zip(moves, mv)), [(cell, s) for (cell, _), s in zip(attacks, at)]
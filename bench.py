@@ -0,0 +1,800 @@
+#!/usr/bin/env python3
+"""Бенчмарки Рыцарей и Замков.
+
+Запуск: python bench.py [имя ...]   (без аргументов — все бенчмарки)
+Окно не открывается: используется SDL dummy-драйвер.
+
+--json FILE пишет результаты (и сведения о машине) в JSON; такой файл —
+базовая линия для --baseline: метрики, ставшие хуже больше чем на
+--threshold, печатаются как регрессии, и код выхода — 1.
+"""
+
+import os
+import subprocess
+import sys
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BENCHES = {}
+
+
+def bench(fn):
+    BENCHES[fn.__name__[len("bench_"):]] = fn
+    return fn
+
+
+# Скрипт дочернего процесса: от начала импорта до первого кадра меню
+_FIRST_FRAME = """
+import time
+t0 = time.perf_counter()
+import pygame
+import knights_and_castles as kc
+screen = pygame.display.set_mode((kc.WIDTH, kc.HEIGHT))
+clock = pygame.time.Clock()
+kc.load_assets(screen, clock)
+kc.MenuScreen(screen, clock)._draw()
+print(time.perf_counter() - t0)
+"""
+
+
+def _first_frame(cache_dir):
+    env = dict(os.environ, KC_ASSET_CACHE=cache_dir)
+    out = subprocess.run([sys.executable, "-c", _FIRST_FRAME], cwd=HERE, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+@bench
+def bench_startup(runs=5):
+    """Время до первого кадра: холодный старт (пустой кэш) и тёплый."""
+    cold, warm = [], []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cold.append(_first_frame(cache_dir))
+            warm.append(_first_frame(cache_dir))
+    return {"cold_first_frame_ms": statistics.median(cold) * 1e3,
+            "warm_first_frame_ms": statistics.median(warm) * 1e3}
+
+
+def _game():
+    import pygame
+    import knights_and_castles as kc
+    screen = pygame.display.set_mode((kc.WIDTH, kc.HEIGHT))
+    return kc, kc.Game(screen=screen)
+
+
+@bench
+def bench_sprites(frames=300):
+    """Кадр с анимацией всех юнитов и превью; память атласов."""
+    kc, game = _game()
+    game.preview_unit = game.board.units[0]
+    for u in game.board.units[::2]:
+        game.attack_anims[u] = 0
+    game.draw()
+    t = time.perf_counter()
+    for _ in range(frames):
+        game.draw()
+    frame = (time.perf_counter() - t) / frames
+    resident, lru, cap = game.sprites.atlas_memory()
+    return {"frame_ms": frame * 1e3, "atlas_resident_kb": resident // 1024,
+            "atlas_lru_kb": lru // 1024, "atlas_cap_kb": cap // 1024}
+
+
+@bench
+def bench_particles(live=500, frames=150):
+    """Кадр с сотнями живых эффектов (пул постоянно пополняется)."""
+    kc, game = _game()
+    kinds = list(kc.EFFECTS)
+    fx = game.effects
+
+    def refill():
+        while fx.count < live:
+            i = fx.count
+            fx.spawn(kinds[i % len(kinds)], i % kc.ROWS, (i // kc.ROWS) % kc.COLS,
+                     game.anim_tick - i % 20)
+
+    refill()
+    game.draw()
+    times = []
+    for _ in range(frames):
+        refill()
+        t = time.perf_counter()
+        game.draw()
+        times.append(time.perf_counter() - t)
+    times.sort()
+    return {"live": live, "frame_ms": statistics.mean(times) * 1e3,
+            "p99_frame_ms": times[int(len(times) * 0.99)] * 1e3,
+            "fps_ok": times[int(len(times) * 0.99)] < 1 / kc.FPS}
+
+
+def _random_board(kc, n, seed=0):
+    """Поле с n юнитами в случайных клетках (плотность ~1/8)."""
+    import random
+    rng = random.Random(seed)
+    side = max(kc.MIN_ROWS, int((n * 8) ** 0.5))
+    cells = rng.sample(range(side * side), n)
+    units = [kc.UNIT_CLASSES[rng.choice(list(kc.UNIT_CLASSES))](
+        1 + i % 2, cell // side, cell % side) for i, cell in enumerate(cells)]
+    return kc.Board(side, side, units=units), rng
+
+
+def _per_call_us(fn, args_list):
+    t = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    return (time.perf_counter() - t) / len(args_list) * 1e6
+
+
+@bench
+def bench_spatial(sizes=(20, 500, 5000), queries=2000):
+    """Ближайший враг, юниты в радиусе, число живых: индекс против перебора."""
+    import knights_and_castles as kc
+    result = {}
+    for n in sizes:
+        board, rng = _random_board(kc, n)
+        qs = [(rng.randrange(board.rows), rng.randrange(board.cols), rng.choice((1, 2)))
+              for _ in range(queries)]
+
+        def linear_nearest(r, c, p):
+            enemies = [u for u in board.units if u.player == p and u.is_alive()]
+            return min(enemies, key=lambda e: abs(e.row - r) + abs(e.col - c))
+
+        result[f"n{n}_nearest_us"] = _per_call_us(board.nearest_unit, qs)
+        result[f"n{n}_nearest_linear_us"] = _per_call_us(linear_nearest, qs)
+        result[f"n{n}_radius5_us"] = _per_call_us(
+            board.units_in_radius, [(r, c, 5, p) for r, c, p in qs])
+        result[f"n{n}_count_us"] = _per_call_us(board.alive_count, [(p,) for _, _, p in qs])
+    return result
+
+
+@bench
+def bench_rosters(n=5000, kills=200):
+    """Составы игроков и уборка погибших на большом поле."""
+    import knights_and_castles as kc
+    board, rng = _random_board(kc, n)
+    t = time.perf_counter()
+    for _ in range(kills):
+        board.player_units(1)
+        board.alive_count(2)
+    roster_us = (time.perf_counter() - t) / kills * 1e6
+    victims = rng.sample(board.units, kills)
+    t = time.perf_counter()
+    for u in victims:
+        u.take_damage(10 ** 6)
+        board.remove_dead((u,))
+    remove_us = (time.perf_counter() - t) / kills * 1e6
+    return {"units": n, "roster_query_us": roster_us, "remove_dead_us": remove_us}
+
+
+@bench
+def bench_moves(n=5000, reps=2000):
+    """Подсветка ходов и многошаговая достижимость на большом поле."""
+    kc, game = _game()
+    game.board, rng = _random_board(kc, n)
+    units = rng.sample(game.board.units, 50)
+    result = {}
+
+    def timed(fn):
+        t = time.perf_counter()
+        for i in range(reps):
+            fn(units[i % len(units)])
+        return (time.perf_counter() - t) / reps * 1e6
+
+    def cold(u):
+        game._moves_cache = None
+        game.calc_moves(u)
+
+    def warm(u):
+        u.moves_left = u.max_moves
+        game.calc_moves(u)
+        u.moves_left -= 1
+        game.calc_moves(u)   # тот же юнит, ход потрачен на месте
+
+    for u in units:
+        u.moves_left = u.max_moves
+    result["calc_moves_us"] = timed(cold)
+    result["calc_moves_after_spend_us"] = timed(warm) / 2
+    for steps in (3, 8):
+        def bfs(u, steps=steps):
+            game.board._reach_cache.pop(u.uid, None)
+            game.board.reachable(u, steps)
+        result[f"reach{steps}_bfs_us"] = timed(bfs)
+        result[f"reach{steps}_cached_us"] = timed(lambda u: game.board.reachable(u, steps))
+    return result
+
+
+@bench
+def bench_recipes(states=20000):
+    """Какие рецепты доступны: словарь с перебором против упакованного вектора."""
+    import random
+    import knights_and_castles as kc
+    rng = random.Random(0)
+    dicts = [{n: rng.randrange(4) for n in kc.ARTIFACT_NAMES} for _ in range(states)]
+    packed = [kc.pack_counts(d) for d in dicts]
+
+    def dict_scan(inv):
+        return [all(inv.get(i, 0) >= c for i, c in r["recipe"].items())
+                for r in kc.ALL_RECIPES]
+
+    t = time.perf_counter()
+    for d in dicts:
+        dict_scan(d)
+    dict_us = (time.perf_counter() - t) / states * 1e6
+    kc.craftable_mask.cache_clear()
+    t = time.perf_counter()
+    for p in packed:
+        kc.craftable_mask.__wrapped__(p)
+    packed_us = (time.perf_counter() - t) / states * 1e6
+    for p in packed:
+        kc.craftable_mask(p)   # прогрев кэша
+    t = time.perf_counter()
+    for p in packed:
+        kc.craftable_mask(p)
+    cached_us = (time.perf_counter() - t) / states * 1e6
+    return {"dict_us": dict_us, "packed_us": packed_us, "cached_us": cached_us,
+            "distinct": kc.craftable_mask.cache_info().currsize}
+
+
+@bench
+def bench_save(reps=2000):
+    """Сохранение и загрузка полного состояния партии."""
+    kc, game = _game()
+    game.board, _ = _random_board(kc, 200)
+    game.selected_unit = game.board.units[0]
+    game.state = "move"
+    data = game.save_state()
+    t = time.perf_counter()
+    for _ in range(reps):
+        game.save_state()
+    save_us = (time.perf_counter() - t) / reps * 1e6
+    t = time.perf_counter()
+    for _ in range(reps):
+        game.load_state(data)
+    load_us = (time.perf_counter() - t) / reps * 1e6
+    return {"units": len(game.board.units), "bytes": len(data),
+            "save_us": save_us, "load_us": load_us,
+            "json_bytes": len(game.export_json().encode())}
+
+
+def _random_play(kc, game, rng, actions):
+    """Доиграть actions действий: ИИ за игрока 2, случайные ходы за игрока 1."""
+    for _ in range(actions):
+        if game.state == "game_over":
+            break
+        if game.is_ai_turn():
+            game.apply_action(game.ai_players[game.current_player].next_action())
+        elif game.state == "select":
+            u = rng.choice([u for u in game.board.player_units(1) if not u.done])
+            game.apply_action((kc.ACT_SELECT, u.row, u.col))
+        elif game.attack_highlights or game.move_highlights:
+            r, c = rng.choice(game.attack_highlights or game.move_highlights)
+            code = kc.ACT_MOVE if (r, c) in game.move_highlights else kc.ACT_JUMP
+            if code == kc.ACT_JUMP and game.selected_unit.unit_type == "archer":
+                code = kc.ACT_SHOOT
+            game.apply_action((code, r, c))
+        else:
+            game.apply_action((kc.ACT_NEXT, 0, 0))
+
+
+@bench
+def bench_replay(actions=5000, seeks=200):
+    """Перемотка повтора: через снимки против проигрывания с начала."""
+    import random
+    import knights_and_castles as kc
+    rng = random.Random(0)
+    game = kc.Game(ai_mode=True, screen=_game()[1].screen, rows=40, cols=20, seed=0)
+    _random_play(kc, game, rng, actions)
+    replay = kc.Replay.from_bytes(game.replay.to_bytes())
+    viewer = kc.Game(screen=game.screen)
+    targets = [rng.randrange(len(replay) + 1) for _ in range(seeks)]
+    t = time.perf_counter()
+    for i in targets:
+        replay.seek(viewer, i)
+    seek_ms = (time.perf_counter() - t) / seeks * 1e3
+    t = time.perf_counter()
+    for i in targets[:20]:
+        viewer.load_state(replay.snapshots[0][1])
+        for j in range(i):
+            viewer.apply_action(replay.action(j), record=False)
+    from_start_ms = (time.perf_counter() - t) / 20 * 1e3
+    return {"actions": len(replay), "bytes": len(replay.to_bytes()),
+            "snapshot_every": replay.snapshot_every,
+            "seek_ms": seek_ms, "from_start_ms": from_start_ms}
+
+
+@bench
+def bench_archive(games=2000, distinct=10):
+    """Архив повторов: упаковка и потоковая сводка по тысячам партий."""
+    import random
+    import knights_and_castles as kc
+    import replay_archive
+    rng = random.Random(0)
+    screen = _game()[1].screen
+    replays = []
+    for i in range(distinct):
+        game = kc.Game(ai_mode=True, screen=screen, seed=i)
+        _random_play(kc, game, rng, 2000)
+        game.replay.finish(game)
+        replays.append(game.replay)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "games.kca")
+        t = time.perf_counter()
+        with replay_archive.ArchiveWriter(path) as w:
+            for i in range(games):
+                w.add(replays[i % distinct])
+        pack_s = time.perf_counter() - t
+        with replay_archive.ReplayArchive(path) as archive:
+            t = time.perf_counter()
+            stats = replay_archive.summarize(archive)
+            scan_s = time.perf_counter() - t
+            t = time.perf_counter()
+            for i in range(0, games, games // 100):
+                archive.replay(i)
+            load_ms = (time.perf_counter() - t) / 100 * 1e3
+        size = os.path.getsize(path)
+    actions = stats["avg_actions"] * games
+    return {"games": games, "mb": size / 2 ** 20, "pack_games_s": games / pack_s,
+            "scan_games_s": games / scan_s, "scan_mactions_s": actions / scan_s / 1e6,
+            "load_by_id_ms": load_ms}
+
+
+class _Sink:
+    """Транспорт, который только считает отправленное (без сокета)."""
+
+    def __init__(self):
+        self.sent = 0
+
+    def write(self, data):
+        self.sent += len(data)
+
+    def is_closing(self):
+        return False
+
+    def set_write_buffer_limits(self, high=None, low=None):
+        pass
+
+    def get_extra_info(self, name, default=None):
+        return default
+
+
+def _recorded_games(kc, games, turns=200):
+    """Партии ИИ против ИИ: [(зерно, [действие ACTION_RECORD, ...]), ...]."""
+    recorded = []
+    for seed in range(games):
+        game = kc.Game(seed=seed, ai_sides=(1, 2), headless=True)
+        game.play_out(turns)
+        recorded.append((seed, [kc.ACTION_RECORD.pack(*a) for a in game.replay]))
+    return recorded
+
+
+@bench
+def bench_server(games=20, matches=1000):
+    """Сервер: обработка действия (правила + проверка + пересылка), память партии."""
+    import tracemalloc
+    import knights_and_castles as kc
+    import server
+
+    recorded = _recorded_games(kc, games)
+    n = sum(len(bodies) for _, bodies in recorded)
+
+    t_rules = 0.0
+    for seed, bodies in recorded:
+        game = kc.Game(seed=seed, headless=True)
+        actions = [kc.ACTION_RECORD.unpack(b) for b in bodies]
+        t = time.perf_counter()
+        for a in actions:
+            game.apply_action(a)
+        t_rules += time.perf_counter() - t
+
+    srv = server.Server()
+    t_server = 0.0
+    sink = _Sink()
+    for seed, bodies in recorded:
+        match = server.Match(seed, kc.ROWS, kc.COLS, seed)
+        srv.matches[match.id] = match
+        for player in (1, 2):
+            conn = server.Connection(srv)
+            conn.transport, conn.match, conn.player = sink, match, player
+            match.conns[player] = conn
+        t = time.perf_counter()
+        for body in bodies:
+            if match.id in srv.matches:
+                srv.act(match.conns[match.game.current_player], body)
+        t_server += time.perf_counter() - t
+
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    kept = [server.Match(i, kc.ROWS, kc.COLS, i) for i in range(matches)]
+    per_match = (tracemalloc.get_traced_memory()[0] - base) / len(kept)
+    tracemalloc.stop()
+    return {"actions": n, "server_us": t_server / n * 1e6, "rules_us": t_rules / n * 1e6,
+            "overhead_us": (t_server - t_rules) / n * 1e6,
+            "bytes_per_action": sink.sent / n, "kb_per_match": per_match / 1024}
+
+
+@bench
+def bench_spectate(games=5, watchers=(0, 100, 1000, 5000)):
+    """Трансляция зрителям: цена действия на сервере от числа зрителей.
+    Дельта кодируется один раз; ход (пачка действий) — одна запись на зрителя."""
+    import asyncio
+    import knights_and_castles as kc
+    import server
+
+    recorded = _recorded_games(kc, games)
+    n = sum(len(bodies) for _, bodies in recorded)
+    result = {}
+
+    async def run(k):
+        srv = server.Server()
+        sinks = []
+        t_total = 0.0
+        for seed, bodies in recorded:
+            match = server.Match(seed + 1, kc.ROWS, kc.COLS, seed)
+            srv.matches[match.id] = match
+            for player in (1, 2):
+                conn = server.Connection(srv)
+                conn.transport, conn.match, conn.player = _Sink(), match, player
+                match.conns[player] = conn
+            for _ in range(k):
+                conn = server.Connection(srv)
+                conn.transport = _Sink()
+                sinks.append(conn.transport)
+                srv.watch(conn, match.id)
+            t = time.perf_counter()
+            player = match.game.current_player
+            for body in bodies:
+                if match.id not in srv.matches:
+                    break
+                srv.act(match.conns[match.game.current_player], body)
+                if match.game.current_player != player:
+                    player = match.game.current_player
+                    await asyncio.sleep(0)    # конец хода: пачка уходит зрителям
+            await asyncio.sleep(0)
+            t_total += time.perf_counter() - t
+        return t_total, srv, sinks
+
+    for k in watchers:
+        t_total, srv, sinks = asyncio.run(run(k))
+        result[f"us_w{k}"] = t_total / n * 1e6
+        if k:
+            # Байт на действие у одного зрителя (дельта, сверки, снимок, конец)
+            result["bytes_per_action"] = sum(x.sent for x in sinks) / (k * n)
+    return result
+
+
+@bench
+def bench_rl_env(n=64, seconds=5.0):
+    """Векторная среда: шагов в секунду со случайным агентом по маске."""
+    import numpy as np
+    import rl_env
+    rng = np.random.default_rng(0)
+    result = {}
+    for opponent in ("ai", "self"):
+        env = rl_env.VectorEnv(n, opponent=opponent)
+        obs = env.reset(seed=0)
+        steps = 0
+        t = time.perf_counter()
+        while time.perf_counter() - t < seconds:
+            # Случайное допустимое действие: argmax шума по маске
+            actions = np.argmax(rng.random(obs["mask"].shape) * obs["mask"], axis=1)
+            obs, *_ = env.step(actions)
+            steps += n
+        result[f"steps_per_s_{opponent}"] = steps / (time.perf_counter() - t)
+    result["n_actions"] = env.n_actions
+    return result
+
+
+@bench
+def bench_batch_eval(games=20, reps=5):
+    """Оценка ходов: _score_move по клетке против ядер batch_eval на пачке."""
+    import knights_and_castles as kc
+    import batch_eval
+    items = []
+    for seed in range(games):
+        game = kc.Game(seed=seed, ai_sides=(1, 2), headless=True)
+        game.play_out(10)
+        cells = [(r, c) for r in range(game.board.rows) for c in range(game.board.cols)]
+        items += [(game, u, cells) for u in game.board.units]
+    n = sum(len(cells) for _, _, cells in items)
+    t = time.perf_counter()
+    for game, u, cells in items:
+        ai = kc.AIPlayer(game, u.player)
+        for r, c in cells:
+            ai._score_move(u, r, c)
+    scalar = time.perf_counter() - t
+    t = time.perf_counter()
+    batch = batch_eval.gather(items)
+    gather = time.perf_counter() - t
+    t = time.perf_counter()
+    for _ in range(reps):
+        batch_eval.score_moves(**batch)
+    kernel = (time.perf_counter() - t) / reps
+    return {"cells": n, "scalar_ns_per_cell": scalar / n * 1e9,
+            "kernel_ns_per_cell": kernel / n * 1e9,
+            "gather_ns_per_cell": gather / n * 1e9}
+
+
+# Работа воркера почти бесплатная (ключ позиции), так что измеряется доставка
+def _pickled_job(states):
+    import shm_store
+    return [shm_store.position_key(state) for state in states]
+
+
+def _shm_job(args):
+    import shm_store
+    name, first, count = args
+    store = shm_store.PositionStore(name=name)
+    for slot in range(first, first + count):
+        store.publish(slot, 0, shm_store.position_key(store.state(slot)))
+    store.close()
+
+
+@bench
+def bench_shm_store(positions=4000, workers=2, ops=200000, sizes=((20, 10), (60, 300))):
+    """Общая память: раздача позиций пулу через pickle против PositionStore
+    (обычное и широкое поле); запись и чтение таблицы транспозиций."""
+    from concurrent.futures import ProcessPoolExecutor
+    import knights_and_castles as kc
+    import shm_store
+    result = {}
+    step = positions // (workers * 4)
+    with ProcessPoolExecutor(workers) as pool:
+        list(pool.map(abs, range(workers)))    # процессы уже запущены
+        for rows, cols in sizes:
+            # Позиции после каждого хода ИИ против ИИ
+            game = kc.Game(rows=rows, cols=cols, seed=0, ai_sides=(1, 2), headless=True)
+            states = []
+            while len(states) < positions and game.state != "game_over":
+                game.play_out(1)
+                states.append(game.save_state())
+            states = (states * (positions // len(states) + 1))[:positions]
+            t = time.perf_counter()
+            list(pool.map(_pickled_job, [states[i:i + step] for i in range(0, positions, step)]))
+            result[f"pickle_us_{cols}"] = (time.perf_counter() - t) / positions * 1e6
+            with shm_store.PositionStore(positions, max(map(len, states))) as store:
+                for i, s in enumerate(states):
+                    store.put(i, s)
+                t = time.perf_counter()
+                list(pool.map(_shm_job, [(store.name, i, min(step, positions - i))
+                                         for i in range(0, positions, step)]))
+                result[f"shm_us_{cols}"] = (time.perf_counter() - t) / positions * 1e6
+    with shm_store.TranspositionTable(16) as tt:
+        keys = [i * 0x9E3779B97F4A7C15 & (1 << 64) - 1 for i in range(ops)]
+        t = time.perf_counter()
+        for k in keys:
+            tt.put(k, 10, 3, shm_store.BOUND_EXACT, (kc.ACT_MOVE, 1, 2))
+        result["tt_put_ns"] = (time.perf_counter() - t) / ops * 1e9
+        t = time.perf_counter()
+        for k in keys:
+            tt.get(k)
+        result["tt_get_ns"] = (time.perf_counter() - t) / ops * 1e9
+    return result
+
+
+_IMPORT = """
+import time
+t0 = time.perf_counter()
+import pygame
+import knights_and_castles as kc
+pygame.display.set_mode((kc.WIDTH, kc.HEIGHT))
+t1 = time.perf_counter()
+kc.SpriteManager()
+print(t1 - t0, time.perf_counter() - t1)
+"""
+
+
+@bench
+def bench_import(runs=5, reps=20):
+    """Холодный импорт модуля игры и сборка SpriteManager (кэш ассетов готов)."""
+    runs_out = [subprocess.run([sys.executable, "-c", _IMPORT], cwd=HERE, capture_output=True,
+                               text=True, check=True).stdout.split()[-2:]
+                for _ in range(runs)]
+    kc, _ = _game()
+    t = time.perf_counter()
+    for _ in range(reps):
+        kc.SpriteManager()
+    return {"import_ms": statistics.median(float(a) for a, _ in runs_out) * 1e3,
+            "sprites_cold_ms": statistics.median(float(b) for _, b in runs_out) * 1e3,
+            "sprites_warm_ms": (time.perf_counter() - t) / reps * 1e3}
+
+
+@bench
+def bench_engine(games=20, queries=200000):
+    """Правила на стандартном поле: unit_at, calc_moves, целые партии ИИ."""
+    import random
+    import knights_and_castles as kc
+    rng = random.Random(0)
+    game = kc.Game(seed=0, ai_sides=(1, 2), headless=True)
+    board = game.board
+    cells = [(rng.randrange(board.rows), rng.randrange(board.cols)) for _ in range(queries)]
+    t = time.perf_counter()
+    for r, c in cells:
+        board.unit_at(r, c)
+    result = {"unit_at_ns": (time.perf_counter() - t) / queries * 1e9}
+    units = board.units
+    t = time.perf_counter()
+    for i in range(queries // 10):
+        u = units[i % len(units)]
+        u.moves_left = u.max_moves
+        game._moves_cache = None
+        game.calc_moves(u)
+    result["calc_moves_us"] = (time.perf_counter() - t) / (queries // 10) * 1e6
+    actions = 0
+    t = time.perf_counter()
+    for seed in range(games):
+        game = kc.Game(seed=seed, ai_sides=(1, 2), headless=True)
+        game.play_out(500)
+        actions += len(game.replay)
+    elapsed = time.perf_counter() - t
+    result["games_per_s"] = games / elapsed
+    result["actions_per_s"] = actions / elapsed
+    return result
+
+
+@bench
+def bench_ai(sizes=((20, 10), (40, 50), (60, 200)), turns=20, reps=20):
+    """Планирование хода ИИ (start_turn) на полях разного размера."""
+    import knights_and_castles as kc
+    result = {}
+    for rows, cols in sizes:
+        # Позиции в начале первых turns ходов партии ИИ против ИИ
+        game = kc.Game(rows=rows, cols=cols, seed=0, ai_sides=(1, 2), headless=True)
+        states = []
+        while len(states) < turns and game.state != "game_over":
+            states.append(game.save_state())
+            game.play_out(1)
+        t = time.perf_counter()
+        for state in states:
+            game.load_state(state)
+            ai = game.ai_players[game.current_player]
+            for _ in range(reps):
+                ai.start_turn()
+        result[f"plan_{rows}x{cols}_ms"] = (time.perf_counter() - t) / (len(states) * reps) * 1e3
+        result[f"units_{rows}x{cols}"] = len(game.board.units)
+    return result
+
+
+@bench
+def bench_draw(frames=100, sizes=((20, 10), (60, 200))):
+    """Кадр Game.draw без эффектов: обычный масштаб и самый мелкий."""
+    import pygame
+    import knights_and_castles as kc
+    screen = pygame.display.set_mode((kc.WIDTH, kc.HEIGHT))
+    result = {}
+    for rows, cols in sizes:
+        game = kc.Game(screen=screen, rows=rows, cols=cols, seed=0)
+        for zoom in ("default", "min"):
+            if zoom == "min":
+                for _ in kc.CAMERA_CELL_SIZES:
+                    game.camera.zoom(-1)
+            game.draw()
+            t = time.perf_counter()
+            for _ in range(frames):
+                game.draw()
+            result[f"frame_{rows}x{cols}_{zoom}_ms"] = (time.perf_counter() - t) / frames * 1e3
+    return result
+
+
+@bench
+def bench_perft(depth=4, seed=0):
+    """Perft от начальной позиции: листьев в секунду (главная метрика генератора)."""
+    from collections import Counter
+    import knights_and_castles as kc
+    import perft
+    game = kc.Game(seed=seed, headless=True)
+    game.replay = None
+    t = time.perf_counter()
+    leaves = perft.perft(game, depth, Counter())
+    elapsed = time.perf_counter() - t
+    return {"depth": depth, "leaves": leaves, "leaves_per_s": leaves / elapsed}
+
+
+# ========================== БАЗОВАЯ ЛИНИЯ ==========================
+
+THRESHOLD = 0.25   # допустимое ухудшение относительно базовой линии
+# Направление метрики — по словам имени: «в секунду» больше — лучше,
+# время и память меньше — лучше; прочие поля (счётчики, флаги) не сравниваются
+_LOWER = {"ms", "us", "ns", "kb", "mb", "bytes"}
+
+
+def direction(metric):
+    """-1 — меньше лучше, 1 — больше лучше, 0 — не сравнивается."""
+    words = metric.split("_")
+    if words[-1] == "s" or any(a == "per" and b == "s" for a, b in zip(words, words[1:])):
+        return 1
+    if _LOWER.intersection(words):
+        return -1
+    return 0
+
+
+def best_of(runs):
+    """Слить прогоны одного бенчмарка: по каждой метрике — лучшее значение."""
+    best = {}
+    for result in runs:
+        for metric, value in result.items():
+            d = direction(metric)
+            old = best.get(metric)
+            if old is None or not d or (value - old) * d > 0:
+                best[metric] = value
+    return best
+
+
+def compare(results, baseline, threshold=THRESHOLD):
+    """[(бенчмарк, метрика, было, стало, изменение, регрессия?)] по общим метрикам."""
+    rows = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            d = direction(metric)
+            if not d or not isinstance(old, (int, float)) or isinstance(old, bool) or not old:
+                continue
+            change = (value - old) / old
+            rows.append((name, metric, old, value, change, change * d < -threshold))
+    return rows
+
+
+def _meta():
+    import platform
+    import pygame
+    return {"python": platform.python_version(), "pygame": pygame.version.ver,
+            "machine": platform.machine(), "system": platform.system(),
+            "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def main(argv=None):
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="Бенчмарки Рыцарей и Замков")
+    parser.add_argument("names", nargs="*", metavar="имя", help="бенчмарки (по умолчанию все)")
+    parser.add_argument("--json", metavar="FILE", help="записать результаты в JSON ('-' — stdout)")
+    parser.add_argument("--baseline", metavar="FILE",
+                        help="сравнить с базовой линией; код выхода 1 при регрессии")
+    parser.add_argument("--repeat", type=int, default=1, metavar="N",
+                        help="прогнать каждый бенчмарк N раз и взять лучшее значение")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help=f"допустимое ухудшение (доля, по умолчанию {THRESHOLD})")
+    args = parser.parse_args(argv)
+    names = args.names or list(BENCHES)
+    for name in names:
+        if name not in BENCHES:
+            sys.exit(f"неизвестный бенчмарк: {name} (есть: {', '.join(BENCHES)})")
+    out = sys.stderr if args.json == "-" else sys.stdout
+    results = {}
+    for name in names:
+        t = time.perf_counter()
+        result = results[name] = best_of(BENCHES[name]() for _ in range(args.repeat))
+        elapsed = time.perf_counter() - t
+        fields = "  ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}"
+                           for k, v in result.items())
+        print(f"{name:<12} {fields}  ({elapsed:.1f}s)", file=out, flush=True)
+
+    if args.json:
+        doc = json.dumps({"meta": _meta(), "results": results}, ensure_ascii=False, indent=1)
+        if args.json == "-":
+            print(doc)
+        else:
+            with open(args.json, "w") as f:
+                f.write(doc + "\n")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        rows = compare(results, baseline, args.threshold)
+        bad = [r for r in rows if r[5]]
+        for name, metric, old, new, change, regressed in rows:
+            mark = "РЕГРЕССИЯ" if regressed else ""
+            print(f"{name:<12} {metric:<32} {old:>12.3f} -> {new:>12.3f}  {change:+7.1%}  {mark}",
+                  file=out)
+        print(f"сравнено метрик: {len(rows)}, регрессий (хуже чем на {args.threshold:.0%}): "
+              f"{len(bad)}", file=out)
+        if bad:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""Клиент сетевой игры и скриптовые боты для нагрузочной проверки.
+
+Окно — обычная Game: свои действия применяются сразу и уходят на сервер,
+действия соперника приходят с сервера и применяются к своей копии партии.
+Зритель получает снимок партии и дальше — дельты (spectate.py).
+
+    python client.py --host 127.0.0.1 --code 42   # играть (код — приватная партия)
+    python client.py --watch 7                    # смотреть партию 7 (без номера — любую)
+    python client.py --bots 500                   # 500 партий ИИ против ИИ через сервер
+    python client.py --bots 20 --watchers 2000    # и 2000 зрителей на них
+"""
+
+import argparse
+import asyncio
+import socket
+import sys
+import time
+import zlib
+
+import pygame
+
+import knights_and_castles as kc
+import spectate
+from protocol import (MSG_JOIN, MSG_START, MSG_ACTION, MSG_REJECT, MSG_STATE,
+                      MSG_END, MSG_CHECK, MSG_DESYNC, MSG_SYNCED, MSG_WATCH,
+                      MSG_SNAPSHOT, MSG_DELTA, CHECK_EVERY, PORT, JOIN, START, END,
+                      STATE, CHECK, DESYNC, WATCH, frame, split_frames)
+
+MAX_TURNS = 500  # бот сдаётся, если за столько ходов партия не кончилась
+
+
+# ========================== ПОДКЛЮЧЕНИЕ ==========================
+
+class NetClient:
+    """Неблокирующий сокет: send() и recv() без ожидания, раз в кадр."""
+
+    def __init__(self, host, port):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.sock.setblocking(False)
+        self.buf = bytearray()
+        self.out = bytearray()
+        self.closed = False
+
+    def send(self, msg, payload=b""):
+        self.out += frame(msg, payload)
+        self.flush()
+
+    def flush(self):
+        if self.out and not self.closed:
+            try:
+                sent = self.sock.send(self.out)
+            except BlockingIOError:
+                return
+            except OSError:
+                self.closed = True
+                return
+            del self.out[:sent]
+
+    def recv(self):
+        """Все пришедшие целиком сообщения: [(тип, тело), ...]."""
+        self.flush()
+        while not self.closed:
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                break
+            except OSError:
+                data = b""
+            if not data:
+                self.closed = True
+                break
+            self.buf += data
+        return split_frames(self.buf)
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+
+
+class SyncState:
+    """Число применённых действий и суммы состояния на точках сверки.
+
+    Свои действия клиент применяет сразу, поэтому MSG_CHECK может прийти,
+    когда он уже ушёл вперёд: сумма запоминается в момент, когда счётчик
+    проходит точку сверки."""
+
+    __slots__ = ("count", "sums")
+
+    def __init__(self):
+        self.count = 0
+        self.sums = {}
+
+    def applied(self, game):
+        self.count += 1
+        if self.count % CHECK_EVERY == 0:
+            self.sums[self.count] = game.checksum()
+
+    def agrees(self, body):
+        count, crc = CHECK.unpack(body)
+        return self.sums.pop(count, crc) == crc
+
+    def reset(self, body):
+        """Разобрать MSG_STATE: счётчик — как у сервера; возвращает save_state()."""
+        self.count = STATE.unpack_from(body)[0]
+        self.sums.clear()
+        return zlib.decompress(body[STATE.size:])
+
+
+# ========================== ИГРА ПО СЕТИ ==========================
+
+class RemotePlayer:
+    """Соперник по сети на месте AIPlayer: пока ходит он, клики не
+    принимаются, а его действия применяет NetGame.poll()."""
+
+    def __init__(self, game, player):
+        self.game = game
+        self.player = player
+
+    def start_turn(self):
+        pass
+
+    def step(self, speed=1):
+        pass
+
+    def next_action(self):
+        return (kc.ACT_END, 0, 0)
+
+    def is_done(self):
+        return True
+
+
+class NetGame(kc.Game):
+    """Партия в окне, синхронная с сервером."""
+
+    def __init__(self, client, player, rows, cols, seed, screen=None, clock=None):
+        super().__init__(screen=screen, clock=clock, rows=rows, cols=cols, seed=seed)
+        self.net = client
+        self.player = player
+        self.remote = RemotePlayer(self, 3 - player)
+        self.sync = SyncState()
+        self._remote_action = False
+        self._set_remote()
+
+    def _set_remote(self):
+        self.ai_players = {self.remote.player: self.remote}
+        self.ai_mode = False   # клавиши скорости ИИ не нужны
+
+    def apply_action(self, action, record=True):
+        ok = super().apply_action(action, record)
+        if ok is not False and not self._remote_action:
+            self.sync.applied(self)
+            self.net.send(MSG_ACTION, kc.ACTION_RECORD.pack(*action))
+        return ok
+
+    def load_state(self, data):
+        super().load_state(data)
+        self._set_remote()
+
+    def quickload(self, path=kc.SAVE_PATH):
+        self.show_popup("В сетевой игре загрузка недоступна")
+
+    def poll(self):
+        for msg, body in self.net.recv():
+            if msg == MSG_ACTION:
+                self._remote_action = True
+                try:
+                    super().apply_action(kc.ACTION_RECORD.unpack(body))
+                finally:
+                    self._remote_action = False
+                self.sync.applied(self)
+            elif msg == MSG_CHECK:
+                if not self.sync.agrees(body):
+                    self.net.send(MSG_DESYNC, DESYNC.pack(self.sync.count))
+            elif msg == MSG_REJECT:
+                self.show_popup("Сервер отклонил ход")
+            elif msg == MSG_STATE:
+                self.load_state(self.sync.reset(body))
+                self.net.send(MSG_SYNCED)
+                self.show_popup("Партия синхронизирована с сервером")
+            elif msg == MSG_END:
+                winner = END.unpack(body)[0]
+                if self.state != "game_over":
+                    self.winner = winner or None
+                    self.state = "game_over"
+                    self.message = (f"ПОБЕДА ИГРОКА {winner}! Соперник вышел"
+                                    if winner else "Партия прервана")
+        if self.net.closed and self.state != "game_over":
+            self.state = "game_over"
+            self.message = "Соединение с сервером потеряно"
+
+
+class SpectatorGame(kc.Game):
+    """Просмотр чужой партии: состояние приходит снимком и дельтами,
+    клики по полю не принимаются (обе стороны — «удалённые»)."""
+
+    def __init__(self, client, screen=None, clock=None):
+        super().__init__(screen=screen, clock=clock)
+        self.net = client
+        self.match_id = 0
+        self.feed = spectate.DeltaDecoder(self)
+        self._set_remote()
+        self.banner = "Ожидание партии..."
+
+    def _set_remote(self):
+        self.ai_players = {p: RemotePlayer(self, p) for p in (1, 2)}
+        self.ai_mode = False
+
+    def load_state(self, data):
+        super().load_state(data)
+        self._set_remote()
+
+    def quickload(self, path=kc.SAVE_PATH):
+        self.show_popup("При просмотре загрузка недоступна")
+
+    def poll(self):
+        for msg, body in self.net.recv():
+            if msg == MSG_DELTA:
+                self.feed.apply(body)
+            elif msg == MSG_SNAPSHOT:
+                self.match_id = WATCH.unpack_from(body)[0]
+                self.feed.load(body[WATCH.size:])
+                self.banner = f"Просмотр партии {self.match_id}"
+            elif msg == MSG_CHECK:
+                count, crc = CHECK.unpack(body)
+                if count == self.feed.count and crc != self.checksum():
+                    # Копия разошлась — просим снимок заново
+                    self.net.send(MSG_WATCH, WATCH.pack(self.match_id))
+            elif msg == MSG_END:
+                if self.match_id == 0:
+                    self.message = "Нет идущих партий"
+                self.state = "game_over"
+        if self.net.closed and self.state != "game_over":
+            self.state = "game_over"
+            self.message = "Соединение с сервером потеряно"
+
+
+def wait_for_start(client, screen, clock):
+    """Экран ожидания соперника; None — если закрыли окно или нажали ESC."""
+    font = pygame.font.SysFont("Arial", 24, bold=True)
+    text = font.render("Ожидание соперника...", True, (230, 210, 160))
+    while not client.closed:
+        clock.tick(kc.FPS)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN
+                                             and event.key == pygame.K_ESCAPE):
+                return None
+        for msg, body in client.recv():
+            if msg == MSG_START:
+                return START.unpack(body)
+        screen.fill((30, 25, 20))
+        screen.blit(text, ((kc.WIDTH - text.get_width()) // 2, kc.HEIGHT // 2))
+        pygame.display.flip()
+    return None
+
+
+def play(host, port, code):
+    client = NetClient(host, port)
+    client.send(MSG_JOIN, JOIN.pack(code))
+    screen = pygame.display.set_mode((kc.WIDTH, kc.HEIGHT))
+    pygame.display.set_caption("Рыцари и Замки — сетевая игра")
+    clock = pygame.time.Clock()
+    kc.load_assets(screen, clock)
+    start = wait_for_start(client, screen, clock)
+    if start is not None:
+        _, player, rows, cols, seed = start
+        game = NetGame(client, player, rows, cols, seed, screen, clock)
+        game.show_popup(f"Вы — Игрок {player}")
+        game.run_once()
+    client.close()
+    pygame.quit()
+
+
+def watch(host, port, match_id):
+    client = NetClient(host, port)
+    client.send(MSG_WATCH, WATCH.pack(match_id))
+    screen = pygame.display.set_mode((kc.WIDTH, kc.HEIGHT))
+    pygame.display.set_caption("Рыцари и Замки — просмотр")
+    clock = pygame.time.Clock()
+    kc.load_assets(screen, clock)
+    SpectatorGame(client, screen, clock).run_once()
+    client.close()
+    pygame.quit()
+
+
+# ========================== БОТЫ ==========================
+
+class Bot(asyncio.Protocol):
+    """Скриптовый клиент: свою сторону играет AIPlayer на копии партии."""
+
+    def __init__(self, code, done, corrupt_every=0):
+        self.code = code
+        self.done = done        # Future, результат — словарь итогов
+        self.corrupt_every = corrupt_every  # портить свою копию раз в N ходов
+        self.buf = bytearray()
+        self.game = None
+        self.sync = SyncState()
+        self.player = 0
+        self.turns = 0
+        self.sent = 0
+        self.rejects = 0
+        self.desyncs = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.write(frame(MSG_JOIN, JOIN.pack(self.code)))
+
+    def data_received(self, data):
+        self.buf += data
+        for msg, body in split_frames(self.buf):
+            if msg == MSG_ACTION:
+                self.game.apply_action(kc.ACTION_RECORD.unpack(body))
+                self.sync.applied(self.game)
+            elif msg == MSG_CHECK:
+                if not self.sync.agrees(body):
+                    self.desyncs += 1
+                    self.transport.write(frame(MSG_DESYNC, DESYNC.pack(self.sync.count)))
+            elif msg == MSG_START:
+                _, self.player, rows, cols, seed = START.unpack(body)
+                self.game = kc.Game(rows=rows, cols=cols, seed=seed,
+                                    ai_sides=(self.player,), headless=True)
+            elif msg == MSG_REJECT:
+                self.rejects += 1
+            elif msg == MSG_STATE:
+                g = self.game
+                g.load_state(self.sync.reset(body))
+                g.ai_players = {self.player: kc.AIPlayer(g, self.player)}
+                if g.current_player == self.player:
+                    g.ai_players[self.player].start_turn()
+                self.transport.write(frame(MSG_SYNCED))
+            elif msg == MSG_END:
+                self._finish(END.unpack(body)[0])
+                return
+        if self.game is not None:
+            self._play()
+
+    def _play(self):
+        """Сыграть свой ход целиком и отправить его одним пакетом."""
+        g = self.game
+        if g.current_player != self.player or g.state == "game_over":
+            return
+        self.turns += 1
+        if self.corrupt_every and self.turns % self.corrupt_every == 0:
+            g.board.player_units(self.player)[0].damage += 1   # проверка пересинхронизации
+        out = []
+        if self.turns > MAX_TURNS // 2:
+            g.apply_action((kc.ACT_SURRENDER, 0, 0))
+            self.sync.applied(g)
+            out.append(frame(MSG_ACTION, kc.ACTION_RECORD.pack(kc.ACT_SURRENDER, 0, 0)))
+        ai = g.ai_players[self.player]
+        while g.current_player == self.player and g.state != "game_over":
+            action = ai.next_action()
+            if g.apply_action(action) is not False:
+                self.sync.applied(g)
+                out.append(frame(MSG_ACTION, kc.ACTION_RECORD.pack(*action)))
+        self.sent += len(out)
+        self.transport.write(b"".join(out))
+
+    def _finish(self, winner):
+        if not self.done.done():
+            self.done.set_result({"player": self.player, "winner": winner,
+                                  "turns": self.turns, "sent": self.sent,
+                                  "rejects": self.rejects, "desyncs": self.desyncs,
+                                  "agree": self.game is not None and self.game.winner == (winner or None)})
+        self.transport.close()
+
+    def connection_lost(self, exc):
+        if not self.done.done():
+            self.done.set_result(None)
+
+
+class Watcher(asyncio.Protocol):
+    """Скриптовый зритель: смотрит партии по кругу до deadline. С verify
+    применяет дельты к своей копии и сверяет её с суммами сервера; без
+    него только считает байты — так тысячи зрителей в одном процессе
+    нагружают сервер, а не себя."""
+
+    def __init__(self, done, deadline, verify=False):
+        self.done = done
+        self.deadline = deadline
+        self.feed = spectate.DeltaDecoder(kc.Game(headless=True)) if verify else None
+        self.buf = bytearray()
+        self.received = 0
+        self.deltas = 0
+        self.snapshots = 0
+        self.checked = 0
+        self.mismatches = 0
+        self.matches = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.write(frame(MSG_WATCH, WATCH.pack(0)))
+
+    def data_received(self, data):
+        self.received += len(data)
+        self.buf += data
+        feed = self.feed
+        for msg, body in split_frames(self.buf):
+            if msg == MSG_DELTA:
+                self.deltas += 1
+                if feed:
+                    feed.apply(body)
+            elif msg == MSG_SNAPSHOT:
+                self.snapshots += 1
+                if feed:
+                    feed.load(body[WATCH.size:])
+            elif msg == MSG_CHECK and feed:
+                count, crc = CHECK.unpack(body)
+                if count == feed.count:
+                    self.checked += 1
+                    self.mismatches += crc != feed.game.checksum()
+            elif msg == MSG_END:
+                self.matches += 1
+                loop = asyncio.get_running_loop()
+                if loop.time() < self.deadline:
+                    # Следующая партия (если идущих нет — чуть позже)
+                    loop.call_later(0.05, self.transport.write, frame(MSG_WATCH, WATCH.pack(0)))
+                else:
+                    self.transport.close()
+
+    def connection_lost(self, exc):
+        if not self.done.done():
+            self.done.set_result(self)
+
+
+async def run_watchers(host, port, n, seconds, verify=20, connect_batch=100):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + seconds
+    futures = []
+    t = time.perf_counter()
+    for i in range(n):
+        done = loop.create_future()
+        futures.append(done)
+        await loop.create_connection(lambda: Watcher(done, deadline, i < verify), host, port)
+        if i % connect_batch == 0:
+            await asyncio.sleep(0)
+    watchers = await asyncio.gather(*futures)
+    elapsed = time.perf_counter() - t
+    deltas = sum(w.deltas for w in watchers)
+    mb = sum(w.received for w in watchers) / 2 ** 20
+    print(f"{n} зрителей за {elapsed:.1f} с: {deltas} дельт ({deltas / elapsed:.0f}/с), "
+          f"{mb:.1f} МБ, снимков: {sum(w.snapshots for w in watchers)}, "
+          f"сверок: {sum(w.checked for w in watchers)}, "
+          f"расхождений: {sum(w.mismatches for w in watchers)}", file=sys.stderr)
+    return watchers
+
+
+async def run_bots(host, port, pairs, corrupt_every=0, connect_batch=100):
+    loop = asyncio.get_running_loop()
+    futures = []
+    t = time.perf_counter()
+    for i in range(2 * pairs):
+        done = loop.create_future()
+        futures.append(done)
+        await loop.create_connection(lambda: Bot(0, done, corrupt_every), host, port)
+        if i % connect_batch == 0:
+            await asyncio.sleep(0)    # не держим цикл на долгом подключении
+    results = await asyncio.gather(*futures)
+    elapsed = time.perf_counter() - t
+    ok = [r for r in results if r]
+    sent = sum(r["sent"] for r in ok)
+    print(f"{pairs} партий за {elapsed:.1f} с: {sent} действий "
+          f"({sent / elapsed:.0f} действий/с), отклонено: {sum(r['rejects'] for r in ok)}, "
+          f"расхождений сумм: {sum(r['desyncs'] for r in ok)}, "
+          f"расхождений в итоге: {sum(not r['agree'] for r in ok)}, "
+          f"оборвано: {len(results) - len(ok)}", file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Клиент сетевой игры")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--code", type=int, default=0,
+                        help="код приватной партии (0 — любой соперник)")
+    parser.add_argument("--bots", type=int, metavar="N",
+                        help="без окна: N партий скриптовых ботов")
+    parser.add_argument("--corrupt-every", type=int, default=0, metavar="K",
+                        help="боты портят свою копию партии раз в K ходов "
+                             "(проверка пересинхронизации)")
+    parser.add_argument("--watch", type=int, nargs="?", const=0, metavar="ID",
+                        help="смотреть партию ID (без номера — любую идущую)")
+    parser.add_argument("--watchers", type=int, default=0, metavar="N",
+                        help="без окна: N скриптовых зрителей")
+    parser.add_argument("--seconds", type=float, default=10,
+                        help="сколько секунд работают скриптовые зрители")
+    args = parser.parse_args(argv)
+    if args.bots or args.watchers:
+        async def load():
+            jobs = []
+            if args.bots:
+                jobs.append(run_bots(args.host, args.port, args.bots, args.corrupt_every))
+            if args.watchers:
+                jobs.append(run_watchers(args.host, args.port, args.watchers, args.seconds))
+            await asyncio.gather(*jobs)
+        asyncio.run(load())
+    elif args.watch is not None:
+        watch(args.host, args.port, args.watch)
+    else:
+        play(args.host, args.port, args.code)
+
+
+if __name__ == "__main__":
+    main()
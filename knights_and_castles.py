@@ -5,6 +5,18 @@ import pygame
 import sys
 import os
 import random
+import argparse
+import hashlib
+import json
+import mmap
+import struct
+import time
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 
 # ========================== КОНСТАНТЫ ==========================
 COLS = 10
@@ -19,9 +31,24 @@ CELL_SIZE = min(48, _max_h // ROWS)
 SIDEBAR_WIDTH = min(280, int(CELL_SIZE * 5.8))
 WIDTH = COLS * CELL_SIZE + SIDEBAR_WIDTH
 HEIGHT = ROWS * CELL_SIZE
-
-ASSETS = os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                       "Tiny Swords", "Tiny Swords (Free Pack)")
+BOARD_VIEW_W = COLS * CELL_SIZE  # ширина окна поля; COLS x ROWS — размер по умолчанию
+
+# Камера: допустимые размеры клетки при зуме (CELL_SIZE — исходный масштаб)
+CAMERA_CELL_SIZES = sorted({8, 12, 16, 24, CELL_SIZE, 48, 64})
+SPRITE_MIN_CELL = 16     # мельче — юниты рисуются цветными квадратами
+CAMERA_SCROLL_SPEED = 12  # пикселей за кадр при прокрутке клавишами
+# Скорость ИИ (клавиши 1/2/3): действий за AIPlayer.DELAY_FRAMES кадров;
+# None — без ограничения, кадр рисуется раз в AI_RENDER_EVERY действий
+AI_SPEEDS = (1, 10, None)
+AI_SPEED_LABELS = ("1×", "10×", "макс.")
+AI_RENDER_EVERY = 25
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS = os.path.join(BASE_DIR, "Tiny Swords", "Tiny Swords (Free Pack)")
+COVER_PATH = os.path.join(BASE_DIR, "Knights_and_Castles_1920x1080.png")
+CACHE_DIR = os.environ.get("KC_ASSET_CACHE", os.path.join(BASE_DIR, ".asset_cache"))
+SAVE_PATH = os.path.join(BASE_DIR, "quicksave.kcs")  # F5 — сохранить, F9 — загрузить
+REPLAY_DIR = os.path.join(BASE_DIR, "replays")
 
 # Цвета
 C_BG = (40, 30, 20)
@@ -42,6 +69,8 @@ C_BLACK = (0, 0, 0)
 C_GOLD = (255, 215, 0)
 C_GRAY = (120, 110, 90)
 C_LOCKED = (100, 80, 80)
+C_GROUND_A = (85, 120, 50)
+C_GROUND_B = (78, 112, 45)
 
 # ========================== АРТЕФАКТЫ И РЕЦЕПТЫ ==========================
 
@@ -106,86 +135,605 @@ WEAPON_RECIPES = [
 ]
 
 
-def can_craft(inventory, recipe):
-    """Проверить, хватает ли артефактов для рецепта."""
-    for item, count in recipe.items():
-        if inventory.get(item, 0) < count:
-            return False
-    return True
+ARTIFACT_IDS = {name: i for i, name in enumerate(ARTIFACT_NAMES)}
+
+# Инвентарь — вектор счётчиков, упакованный в одно целое: по INV_LANE бит
+# на артефакт. Старший бит каждой дорожки — защитный: после
+# (инвентарь | защитные биты) - рецепт он остаётся взведён ровно там, где
+# артефактов хватает, так что рецепт проверяется одним вычитанием.
+INV_LANE = 16
+INV_MAX = (1 << (INV_LANE - 1)) - 1
+_LANE_MASK = (1 << INV_LANE) - 1
+_INV_GUARDS = sum(1 << (INV_LANE * i + INV_LANE - 1) for i in range(len(ARTIFACT_NAMES)))
+
+
+def pack_counts(counts):
+    """{артефакт: количество} -> упакованный вектор."""
+    return sum(n << (INV_LANE * ARTIFACT_IDS[item]) for item, n in counts.items())
+
+
+# Все рецепты одной матрицей: строка — упакованный вектор требований.
+# Заклинания идут первыми, у каждого рецепта — его номер строки "id".
+ALL_RECIPES = SPELL_RECIPES + WEAPON_RECIPES
+RECIPE_MATRIX = [pack_counts(r["recipe"]) for r in ALL_RECIPES]
+for _i, _r in enumerate(ALL_RECIPES):
+    _r["id"] = _i
+SPELL_MASK = (1 << len(SPELL_RECIPES)) - 1
+
+
+@lru_cache(maxsize=1 << 16)
+def craftable_mask(packed):
+    """Битовая маска строк RECIPE_MATRIX, на которые хватает артефактов."""
+    p = packed | _INV_GUARDS
+    mask = 0
+    for i, need in enumerate(RECIPE_MATRIX):
+        if (p - need) & _INV_GUARDS == _INV_GUARDS:
+            mask |= 1 << i
+    return mask
+
+
+class Inventory:
+    """Артефакты игрока. Снаружи ведёт себя как словарь {имя: количество},
+    внутри — одно упакованное целое (копируется и хэшируется бесплатно)."""
+
+    __slots__ = ("packed",)
+
+    def __init__(self, packed=0):
+        self.packed = packed
+
+    def __getitem__(self, name):
+        return (self.packed >> (INV_LANE * ARTIFACT_IDS[name])) & INV_MAX
 
+    def __setitem__(self, name, count):
+        if not 0 <= count <= INV_MAX:
+            raise ValueError(f"{name}: количество вне 0..{INV_MAX}: {count}")
+        shift = INV_LANE * ARTIFACT_IDS[name]
+        self.packed = self.packed & ~(_LANE_MASK << shift) | count << shift
 
-def spend_recipe(inventory, recipe):
-    """Потратить артефакты из инвентаря."""
-    for item, count in recipe.items():
-        inventory[item] -= count
+    def get(self, name, default=0):
+        return self[name] if name in ARTIFACT_IDS else default
+
+    def keys(self):
+        return iter(ARTIFACT_NAMES)
+
+    def items(self):
+        return [(name, self[name]) for name in ARTIFACT_NAMES]
+
+    def craftable(self):
+        """Маска всех доступных рецептов (кэшируется по содержимому)."""
+        return craftable_mask(self.packed)
+
+    def can_craft(self, recipe_info):
+        """Хватает ли артефактов на рецепт из ALL_RECIPES."""
+        return bool(craftable_mask(self.packed) >> recipe_info["id"] & 1)
+
+    def spend(self, recipe_info):
+        """Потратить артефакты; вызывать только если can_craft."""
+        self.packed -= RECIPE_MATRIX[recipe_info["id"]]
 
 
 # ========================== ЗАГРУЗКА СПРАЙТОВ ==========================
 
-def load_sprite(path, size=None):
-    full = os.path.join(ASSETS, path)
-    if not os.path.exists(full):
-        print(f"[ОШИБКА] Файл не найден: {full}")
+# Листы анимаций юнитов: тип -> анимация -> (файл внутри папки цвета, размер кадра)
+UNIT_SHEETS = {
+    "knight": {"idle":   ("Warrior/Warrior_Idle.png", 192),
+               "attack": ("Warrior/Warrior_Attack1.png", 192)},
+    "archer": {"idle":   ("Archer/Archer_Idle.png", 192),
+               "attack": ("Archer/Archer_Shoot.png", 192)},
+    "cavalry": {"idle":   ("Lancer/Lancer_Idle.png", 320),
+                "attack": ("Lancer/Lancer_Right_Attack.png", 320)},
+}
+TEAM_COLORS = {1: "Blue", 2: "Red"}
+
+ANIM_TICKS_PER_FRAME = 3            # кадров игры на кадр анимации (10 к/с при 30 FPS)
+ATLAS_CACHE_BYTES = 8 * 1024 * 1024  # потолок памяти атласов нестандартных размеров
+
+# Визуальные эффекты: вид -> (лист из Particle FX, размер в клетках)
+EFFECTS = {
+    "dust":      ("Dust_01", 1.0),
+    "explosion": ("Explosion_01", 2.0),
+    "fire":      ("Fire_01", 1.0),
+}
+EFFECT_CAPACITY = 1024  # ёмкость пула эффектов
+
+
+# ========================== КЭШ АССЕТОВ ==========================
+#
+# Формат файла .asset_cache/sprites_<CELL_SIZE>.bin:
+#   заголовок  <4sH16sI>  магия, версия, подпись исходников, число записей
+#   индекс     <32sHHBQ>  имя, ширина, высота, байт на пиксель, смещение
+#   данные     сырые RGBA/RGB пиксели, выровненные по 16 байт
+# Анимации хранятся атласами: все кадры листа в одну строку, уже
+# вырезанные и масштабированные под размер клетки.
+# Файл читается через mmap: поверхности создаются прямо из буфера без
+# декодирования PNG и без smoothscale.
+
+CACHE_MAGIC = b"KCAC"
+CACHE_VERSION = 2
+_CACHE_HEADER = struct.Struct("<4sH16sI")
+_CACHE_ENTRY = struct.Struct("<32sHHBQ")
+
+
+def asset_specs(cs):
+    """Ассеты первого экрана и поля (в файле кэша).
+
+    Имя -> (файл, размер кадра | None, размер | None, альфа). Если задан
+    размер кадра, лист режется на кадры и каждый масштабируется до размера.
+    """
+    large_cs = int(cs * 1.8)
+    specs = {}
+    for team, color in TEAM_COLORS.items():
+        for unit_type, anims in UNIT_SHEETS.items():
+            size = large_cs if unit_type == "cavalry" else cs
+            for anim, (path, frame) in anims.items():
+                src = os.path.join(ASSETS, "Units", f"{color} Units", path)
+                specs[f"anim/{team}/{unit_type}/{anim}"] = (src, frame, (size, size), True)
+        specs[f"castle/{team}"] = (
+            os.path.join(ASSETS, "Buildings", f"{color} Buildings", "Castle.png"),
+            None, (cs * 4, cs * 4), True)
+    specs["tower"] = (os.path.join(ASSETS, "Buildings", "Blue Buildings", "Tower.png"),
+                      None, (cs, cs), True)
+    specs["monastery"] = (os.path.join(ASSETS, "Buildings", "Blue Buildings",
+                                       "Monastery.png"),
+                          None, (cs * 2, cs * 2), True)
+    specs["cover"] = (COVER_PATH, None, (WIDTH, HEIGHT), False)
+    return specs
+
+
+def lazy_asset_specs():
+    """Ассеты, не нужные на первом экране: грузятся по требованию."""
+    specs = {}
+    for team, color in TEAM_COLORS.items():
+        for unit_type, anims in UNIT_SHEETS.items():
+            for anim, (path, frame) in anims.items():
+                # Лист в исходном разрешении — для атласов любого размера
+                specs[f"sheet/{team}/{unit_type}/{anim}"] = (
+                    os.path.join(ASSETS, "Units", f"{color} Units", path), None, None, True)
+        # Здания в исходном разрешении — для зума камеры
+        specs[f"building/castle/{team}"] = (
+            os.path.join(ASSETS, "Buildings", f"{color} Buildings", "Castle.png"),
+            None, None, True)
+    specs["building/tower"] = (
+        os.path.join(ASSETS, "Buildings", "Blue Buildings", "Tower.png"), None, None, True)
+    for group, folder in [("fx", "Particle FX"),
+                          ("ui", os.path.join("UI Elements", "UI Elements"))]:
+        root = os.path.join(ASSETS, folder)
+        for dirpath, _, files in os.walk(root):
+            for fname in sorted(files):
+                if fname.endswith(".png"):
+                    rel = os.path.relpath(os.path.join(dirpath, fname), root)
+                    name = os.path.splitext(rel)[0].replace(os.sep, "/")
+                    specs[f"{group}/{name}"] = (os.path.join(dirpath, fname),
+                                                None, None, True)
+    return specs
+
+
+def _specs_signature(specs, cs):
+    """Подпись исходников: путь, mtime и размер каждого файла + параметры сборки."""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{CACHE_VERSION}:{cs}:{WIDTH}x{HEIGHT}".encode())
+    for name in sorted(specs):
+        src, frame, size, alpha = specs[name]
+        try:
+            st = os.stat(src)
+            stamp = f"{st.st_mtime_ns}:{st.st_size}"
+        except OSError:
+            stamp = "missing"
+        h.update(f"|{name}:{src}:{stamp}:{frame}:{size}:{alpha}".encode())
+    return h.digest()
+
+
+def _decode_asset(spec):
+    """Медленный путь: прочитать PNG, вырезать кадр, масштабировать.
+
+    Не трогает дисплей, поэтому безопасно вызывается из рабочих потоков.
+    """
+    src, frame, size, alpha = spec
+    if not os.path.exists(src):
+        print(f"[ОШИБКА] Файл не найден: {src}")
         return None
-    img = pygame.image.load(full).convert_alpha()
+    img = pygame.image.load(src)
+    if frame:
+        # Атлас: n кадров подряд, каждый ровно size[0] x size[1]
+        n = img.get_width() // frame
+        strip = img.subsurface(pygame.Rect(0, 0, n * frame, frame))
+        w, h = size or (frame, frame)
+        return pygame.transform.smoothscale(strip, (n * w, h))
     if size:
         img = pygame.transform.smoothscale(img, size)
     return img
 
 
-def extract_frame(sheet, frame_idx, frame_w, frame_h, target_size):
-    if sheet is None:
+def _decode_raw(spec):
+    img = _decode_asset(spec)
+    if img is None:
         return None
-    rect = pygame.Rect(frame_idx * frame_w, 0, frame_w, frame_h)
-    frame = pygame.Surface((frame_w, frame_h), pygame.SRCALPHA)
-    frame.blit(sheet, (0, 0), rect)
-    return pygame.transform.smoothscale(frame, target_size)
+    fmt = "RGBA" if spec[3] else "RGB"
+    return img.get_size(), len(fmt), pygame.image.tobytes(img, fmt)
+
+
+_pool = None
+
+
+def asset_pool():
+    """Общий пул потоков для декодирования PNG (SDL_image отпускает GIL)."""
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1),
+                                   thread_name_prefix="assets")
+    return _pool
+
+
+class AssetLoader:
+    """Параллельная сборка кэша: все ассеты первого экрана декодируются в пуле."""
+
+    def __init__(self, cs=None):
+        self.cs = cs or CELL_SIZE
+        self.specs = asset_specs(self.cs)
+        pool = asset_pool()
+        self._futures = {name: pool.submit(_decode_raw, spec)
+                         for name, spec in self.specs.items()}
+
+    def progress(self):
+        """(готово, всего)"""
+        done = sum(1 for f in self._futures.values() if f.done())
+        return done, len(self._futures)
+
+    def done(self):
+        return all(f.done() for f in self._futures.values())
+
+    def results(self):
+        return {name: f.result() for name, f in self._futures.items()}
+
+
+def cache_path(cs):
+    return os.path.join(CACHE_DIR, f"sprites_{cs}.bin")
+
+
+def build_asset_cache(cs=None, loader=None):
+    """Шаг сборки: декодировать и масштабировать все ассеты, записать кэш."""
+    loader = loader or AssetLoader(cs)
+    cs = loader.cs
+    entries = [(name, raw) for name, raw in loader.results().items()
+               if raw is not None]
+
+    offset = _CACHE_HEADER.size + _CACHE_ENTRY.size * len(entries)
+    index, blobs = [], []
+    for name, ((w, h), bpp, data) in entries:
+        offset = (offset + 15) & ~15
+        index.append(_CACHE_ENTRY.pack(name.encode(), w, h, bpp, offset))
+        blobs.append((offset, data))
+        offset += len(data)
+
+    path = cache_path(cs)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION,
+                                   _specs_signature(loader.specs, cs), len(entries)))
+        f.write(b"".join(index))
+        for off, data in blobs:
+            f.write(b"\0" * (off - f.tell()))
+            f.write(data)
+    os.replace(tmp, path)  # атомарно: недописанный кэш никогда не читается
+    return path
+
+
+class AssetCache:
+    """Пред-масштабированные ассеты из mmap-файла с ленивой конвертацией.
+
+    Ассеты из lazy_asset_specs() в файл не попадают: они декодируются при
+    первом обращении или заранее в фоне через prefetch().
+    """
+
+    def __init__(self, cs, build=True):
+        self.cs = cs
+        self.specs = asset_specs(cs)
+        self.lazy_specs = lazy_asset_specs()
+        self._index = {}
+        self._mm = None
+        self._surfaces = {}
+        self._pending = {}
+        self.ready = self._open(_specs_signature(self.specs, cs))
+        if not self.ready and build:
+            self.build()
+
+    def build(self, loader=None):
+        try:
+            build_asset_cache(self.cs, loader)
+        except OSError as e:
+            print(f"[ОШИБКА] Не удалось записать кэш ассетов: {e}")
+            return
+        self.ready = self._open(_specs_signature(self.specs, self.cs))
+
+    def _open(self, signature):
+        try:
+            with open(cache_path(self.cs), "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        if len(mm) < _CACHE_HEADER.size:
+            mm.close()
+            return False
+        magic, version, sig, count = _CACHE_HEADER.unpack_from(mm, 0)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION or sig != signature:
+            mm.close()
+            return False
+        for name, w, h, bpp, off in _CACHE_ENTRY.iter_unpack(
+                mm[_CACHE_HEADER.size:_CACHE_HEADER.size + _CACHE_ENTRY.size * count]):
+            self._index[name.rstrip(b"\0").decode()] = (w, h, bpp, off)
+        self._mm = mm
+        return True
+
+    def prefetch(self, prefix=""):
+        """Запустить фоновое декодирование ленивых ассетов с данным префиксом."""
+        pool = asset_pool()
+        for name, spec in self.lazy_specs.items():
+            if (name.startswith(prefix) and name not in self._surfaces
+                    and name not in self._pending):
+                self._pending[name] = pool.submit(_decode_asset, spec)
+
+    def get(self, name):
+        """Surface по имени (см. asset_specs/lazy_asset_specs) или None."""
+        if name in self._surfaces:
+            return self._surfaces[name]
+        entry = self._index.get(name)
+        spec = self.specs.get(name) or self.lazy_specs.get(name)
+        if entry is not None:
+            w, h, bpp, off = entry
+            view = memoryview(self._mm)[off:off + w * h * bpp]
+            raw = pygame.image.frombuffer(view, (w, h), "RGBA" if bpp == 4 else "RGB")
+            surf = raw.convert_alpha() if bpp == 4 else raw.convert()
+            del raw
+            view.release()
+        elif spec is not None:
+            # Ленивый ассет или кэш недоступен — читаем PNG
+            pending = self._pending.pop(name, None)
+            img = pending.result() if pending else _decode_asset(spec)
+            if img is None:
+                surf = None
+            else:
+                surf = img.convert_alpha() if spec[3] else img.convert()
+        else:
+            surf = None
+        self._surfaces[name] = surf
+        return surf
+
+
+_asset_cache = None
+
+
+def get_asset_cache():
+    """Общий на процесс кэш ассетов (меню и игра не читают PNG повторно)."""
+    global _asset_cache
+    if _asset_cache is None or _asset_cache.cs != CELL_SIZE:
+        _asset_cache = AssetCache(CELL_SIZE)
+    return _asset_cache
+
+
+def load_assets(screen, clock):
+    """Подготовить кэш ассетов до первого кадра меню.
+
+    Если кэш устарел, PNG декодируются в пуле потоков, а на экране
+    показывается полоса прогресса. Ленивые ассеты (кадры превью)
+    после этого догружаются в фоне.
+    """
+    global _asset_cache
+    cache = AssetCache(CELL_SIZE, build=False)
+    if not cache.ready:
+        loader = AssetLoader(CELL_SIZE)
+        font = pygame.font.SysFont("Arial", 20, bold=True)
+        bar_w, bar_h = WIDTH - 80, 24
+        bar = pygame.Rect(40, HEIGHT // 2, bar_w, bar_h)
+        while not loader.done():
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    sys.exit()
+            done, total = loader.progress()
+            screen.fill((20, 15, 10))
+            t = font.render(f"Загрузка... {done}/{total}", True, C_GOLD)
+            screen.blit(t, ((WIDTH - t.get_width()) // 2, bar.y - 36))
+            pygame.draw.rect(screen, (60, 45, 25), bar, border_radius=6)
+            fill = bar.copy()
+            fill.w = bar_w * done // max(1, total)
+            pygame.draw.rect(screen, C_GOLD, fill, border_radius=6)
+            pygame.display.flip()
+            clock.tick(FPS)
+        cache.build(loader)
+    cache.prefetch("sheet/")
+    for sheet, _ in EFFECTS.values():
+        cache.prefetch(f"fx/{sheet}")
+    _asset_cache = cache
+    return cache
+
+
+class Atlas:
+    """Кадры одной анимации одного размера в одной Surface-строке."""
+
+    __slots__ = ("surface", "size", "rects", "nbytes")
+
+    def __init__(self, surface, size):
+        self.surface = surface
+        self.size = size
+        n = max(1, surface.get_width() // size)
+        self.rects = [pygame.Rect(i * size, 0, size, size) for i in range(n)]
+        self.nbytes = surface.get_width() * surface.get_height() * surface.get_bytesize()
+
+    def frame(self, tick):
+        """Прямоугольник кадра для общего счётчика анимации."""
+        return self.rects[(tick // ANIM_TICKS_PER_FRAME) % len(self.rects)]
+
+    def duration(self):
+        return len(self.rects) * ANIM_TICKS_PER_FRAME
 
 
 class SpriteManager:
     def __init__(self):
         cs = CELL_SIZE
+        assets = get_asset_cache()
+        self._assets = assets
+
+        # Cavalry rendered larger for clarity
+        large_cs = int(cs * 1.8)
+        self.cavalry_size = large_cs
+
+        # Атласы размера клетки лежат в кэше ассетов и резидентны всегда;
+        # прочие размеры (превью) строятся по требованию в LRU с потолком памяти
+        self._atlases = {}
+        self._scaled = OrderedDict()
+        self._scaled_bytes = 0
         self.units = {}
-        for color, team in [("Blue", 1), ("Red", 2)]:
-            prefix = f"Units/{color} Units"
-            w_sheet = load_sprite(f"{prefix}/Warrior/Warrior_Idle.png")
-            self.units[(team, "knight")] = extract_frame(w_sheet, 0, 192, 192, (cs, cs))
-            a_sheet = load_sprite(f"{prefix}/Archer/Archer_Idle.png")
-            self.units[(team, "archer")] = extract_frame(a_sheet, 0, 192, 192, (cs, cs))
-            l_sheet = load_sprite(f"{prefix}/Lancer/Lancer_Idle.png")
-            self.units[(team, "cavalry")] = extract_frame(l_sheet, 0, 320, 320, (cs, cs))
+        for team in TEAM_COLORS:
+            for unit_type, anims in UNIT_SHEETS.items():
+                size = large_cs if unit_type == "cavalry" else cs
+                for anim in anims:
+                    surf = assets.get(f"anim/{team}/{unit_type}/{anim}")
+                    self._atlases[(team, unit_type, anim, size)] = (
+                        Atlas(surf, size) if surf else None)
+                idle = self._atlases[(team, unit_type, "idle", size)]
+                self.units[(team, unit_type)] = (
+                    idle.surface.subsurface(idle.rects[0]) if idle else None)
 
         self.castle_img = {}
-        self.castle_img[1] = load_sprite("Buildings/Blue Buildings/Castle.png",
-                                          (cs * 4, cs * 4))
-        self.castle_img[2] = load_sprite("Buildings/Red Buildings/Castle.png",
-                                          (cs * 4, cs * 4))
-        self.tower_img = load_sprite("Buildings/Blue Buildings/Tower.png", (cs, cs))
-        self.monastery_img = load_sprite("Buildings/Blue Buildings/Monastery.png",
-                                          (cs * 2, cs * 2))
+        self.castle_img[1] = assets.get("castle/1")
+        self.castle_img[2] = assets.get("castle/2")
+        self.tower_img = assets.get("tower")
+        self.monastery_img = assets.get("monastery")
 
         # Flat checkerboard ground tiles (no 3D trapezoid effect)
         self.ground_tile_a = pygame.Surface((cs, cs))
-        self.ground_tile_a.fill((85, 120, 50))
+        self.ground_tile_a.fill(C_GROUND_A)
         self.ground_tile_b = pygame.Surface((cs, cs))
-        self.ground_tile_b.fill((78, 112, 45))
+        self.ground_tile_b.fill(C_GROUND_B)
         self.ground_tile = self.ground_tile_a  # kept for compat
 
-        # Cavalry rendered larger for clarity
-        large_cs = int(cs * 1.8)
-        self.cavalry_size = large_cs
-        for color, team in [("Blue", 1), ("Red", 2)]:
-            prefix = f"Units/{color} Units"
-            l_sheet = load_sprite(f"{prefix}/Lancer/Lancer_Idle.png")
-            self.units[(team, "cavalry")] = extract_frame(l_sheet, 0, 320, 320, (large_cs, large_cs))
-
     def get_unit(self, player, unit_type):
         return self.units.get((player, unit_type))
 
+    def get_atlas(self, player, unit_type, anim, size):
+        """Атлас анимации заданного размера; каждый лист режется один раз."""
+        key = (player, unit_type, anim, size)
+        if key in self._atlases:
+            return self._atlases[key]
+        if key in self._scaled:
+            self._scaled.move_to_end(key)
+            return self._scaled[key][0]
+        sheet = self._assets.get(f"sheet/{player}/{unit_type}/{anim}")
+        atlas = None
+        if sheet is not None:
+            frame = UNIT_SHEETS[unit_type][anim][1]
+            n = sheet.get_width() // frame
+            strip = sheet.subsurface(pygame.Rect(0, 0, n * frame, frame))
+            atlas = Atlas(pygame.transform.smoothscale(strip, (n * size, size)), size)
+        self._lru_put(key, atlas, atlas.nbytes if atlas else 0)
+        return atlas
+
+    def get_building(self, name, size):
+        """Здание ("castle/1", "castle/2", "tower") стороной size пикселей."""
+        key = ("building", name, size)
+        if key in self._scaled:
+            self._scaled.move_to_end(key)
+            return self._scaled[key][0]
+        src = self._assets.get(f"building/{name}")
+        img = pygame.transform.smoothscale(src, (size, size)) if src else None
+        self._lru_put(key, img, size * size * 4 if img else 0)
+        return img
+
+    def _lru_put(self, key, obj, nbytes):
+        self._scaled[key] = (obj, nbytes)
+        self._scaled_bytes += nbytes
+        while self._scaled_bytes > ATLAS_CACHE_BYTES and len(self._scaled) > 1:
+            _, (_, old_bytes) = self._scaled.popitem(last=False)
+            self._scaled_bytes -= old_bytes
+
+    def get_effect_atlas(self, kind, size):
+        """Атлас эффекта (кадры квадратные, сторона = высота листа)."""
+        key = ("fx", kind, size)
+        if key not in self._atlases:
+            sheet = self._assets.get(f"fx/{EFFECTS[kind][0]}")
+            atlas = None
+            if sheet is not None:
+                n = sheet.get_width() // sheet.get_height()
+                atlas = Atlas(pygame.transform.smoothscale(sheet, (n * size, size)), size)
+            # Эффекты делят кадры между всеми экземплярами — держим резидентно
+            self._atlases[key] = atlas
+        return self._atlases[key]
+
+    def atlas_memory(self):
+        """Байты пикселей во всех атласах: (резидентные, LRU, потолок LRU)."""
+        resident = sum(a.nbytes for a in self._atlases.values() if a)
+        return resident, self._scaled_bytes, ATLAS_CACHE_BYTES
+
     def get_ground(self):
         return self.ground_tile
 
 
+# ========================== ЭФФЕКТЫ ==========================
+
+class ParticleSystem:
+    """Пул визуальных эффектов фиксированной ёмкости.
+
+    Живые эффекты лежат плотно в параллельных массивах (индексы 0..count-1),
+    удаление — перестановкой последнего на место удалённого. Ни спавн, ни
+    кадр не создают объектов; кадры анимаций общие для всех экземпляров.
+    """
+
+    def __init__(self, sprites, capacity=EFFECT_CAPACITY):
+        self.sprites = sprites
+        self.capacity = capacity
+        self.count = 0
+        self.kinds = list(EFFECTS)
+        self.row = array("f", bytes(4 * capacity))
+        self.col = array("f", bytes(4 * capacity))
+        self.kind = array("B", bytes(capacity))
+        self.start = array("l", bytes(array("l").itemsize * capacity))
+
+    def spawn(self, kind, row, col, tick):
+        """Запустить эффект в центре клетки; False, если пул заполнен."""
+        i = self.count
+        if i >= self.capacity:
+            return False
+        self.row[i] = row
+        self.col[i] = col
+        self.kind[i] = self.kinds.index(kind)
+        self.start[i] = tick
+        self.count = i + 1
+        return True
+
+    def _remove(self, i):
+        last = self.count - 1
+        if i != last:
+            self.row[i] = self.row[last]
+            self.col[i] = self.col[last]
+            self.kind[i] = self.kind[last]
+            self.start[i] = self.start[last]
+        self.count = last
+
+    def draw(self, screen, tick, cs, ox=0, oy=0, view_w=BOARD_VIEW_W, view_h=HEIGHT):
+        """Нарисовать и состарить эффекты; законченные возвращаются в пул.
+
+        (ox, oy) — экранная позиция угла поля; эффекты вне окна не рисуются.
+        """
+        atlases = [self.sprites.get_effect_atlas(k, int(cs * EFFECTS[k][1]))
+                   for k in self.kinds]
+        row, col, kind, start = self.row, self.col, self.kind, self.start
+        blit = screen.blit
+        i = self.count - 1
+        while i >= 0:
+            atlas = atlases[kind[i]]
+            age = tick - start[i]
+            if atlas is None or age >= atlas.duration():
+                self._remove(i)
+            else:
+                size = atlas.size
+                x = ox + int((col[i] + 0.5) * cs) - size // 2
+                y = oy + int((row[i] + 0.5) * cs) - size // 2
+                if x < view_w and y < view_h and x + size > 0 and y + size > 0:
+                    blit(atlas.surface, (x, y), atlas.frame(age))
+            i -= 1
+
+
 # ========================== ЮНИТЫ ==========================
 
 class Unit:
@@ -203,6 +751,7 @@ class Unit:
         self.unit_type = unit_type
         self.active = False
         self.done = False
+        self.uid = -1  # порядковый номер на доске (назначает Board.add_unit)
 
     def take_damage(self, dmg):
         if self.armor > 0:
@@ -239,6 +788,9 @@ class Archer(Unit):
                          max_moves=3, unit_type="archer")
 
 
+UNIT_CLASSES = {"knight": Knight, "cavalry": Cavalry, "archer": Archer}
+
+
 # ========================== ЗАМОК ==========================
 
 class Castle:
@@ -271,9 +823,9 @@ class MageTower:
         if self.occupant is None:
             return None
         recipe_info = SPELL_RECIPES[spell_idx]
-        if not can_craft(inventory, recipe_info["recipe"]):
+        if not inventory.can_craft(recipe_info):
             return None
-        spend_recipe(inventory, recipe_info["recipe"])
+        inventory.spend(recipe_info)
 
         player = self.occupant.player
         name = recipe_info["name"]
@@ -293,89 +845,400 @@ class MageTower:
         return None
 
 
+# ========================== СЛУЧАЙНОСТЬ ==========================
+
+class CounterRNG:
+    """Счётчиковый генератор SplitMix64: k-е число зависит только от
+    (seed, k). Состояние — два целых: сохраняется и восстанавливается за
+    O(1), а у каждой партии свой независимый поток."""
+
+    GAMMA = 0x9E3779B97F4A7C15
+    MASK = (1 << 64) - 1
+
+    __slots__ = ("seed", "counter")
+
+    def __init__(self, seed, counter=0):
+        self.seed = seed & self.MASK
+        self.counter = counter
+
+    def next64(self):
+        self.counter += 1
+        z = (self.seed + self.counter * self.GAMMA) & self.MASK
+        z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & self.MASK
+        z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & self.MASK
+        return z ^ (z >> 31)
+
+    def randbelow(self, n):
+        """Целое из [0, n) — старшие биты произведения, без цикла отбора."""
+        return (self.next64() * n) >> 64
+
+    def choice(self, seq):
+        return seq[self.randbelow(len(seq))]
+
+
+def new_seed():
+    """Зерно для новой партии, если его не задали явно."""
+    return random.getrandbits(64)
+
+
 # ========================== РУИНЫ ==========================
 
 class Ruins:
-    def __init__(self, top_row, left_col):
+    def __init__(self, top_row, left_col, seed=None):
         self.top_row = top_row
         self.left_col = left_col
         self.cells = set()
         for r in range(top_row, top_row + 2):
             for c in range(left_col, left_col + 2):
                 self.cells.add((r, c))
+        # Своя колода: состояние — зерно и число вытянутых карт
+        self.rng = CounterRNG(new_seed() if seed is None else seed)
 
     def contains(self, r, c):
         return (r, c) in self.cells
 
     def draw_card(self):
         """Вытянуть артефакт из бесконечной колоды."""
-        return random.choice(ARTIFACT_NAMES)
+        return self.rng.choice(ARTIFACT_NAMES)
+
+    @property
+    def seed(self):
+        return self.rng.seed
+
+    @property
+    def draws(self):
+        return self.rng.counter
+
+    def restore(self, seed, draws):
+        """Колода в состоянии после draws карт от зерна seed."""
+        self.rng = CounterRNG(seed, draws)
 
 
 # ========================== ДОСКА ==========================
 
+class SpatialIndex:
+    """Равномерная сетка корзин BUCKET x BUCKET клеток, отдельная на игрока.
+
+    Держит живые юниты и их число; Board обновляет индекс при добавлении,
+    перемещении и удалении юнитов. Поиск ближайшего идёт кольцами корзин
+    от клетки запроса и останавливается, как только ближние корзины не
+    могут дать юнит ближе найденного.
+    """
+
+    BUCKET = 8
+
+    def __init__(self, rows, cols):
+        b = self.BUCKET
+        self.brows = (rows + b - 1) // b
+        self.bcols = (cols + b - 1) // b
+        n = self.brows * self.bcols
+        self.buckets = {1: [[] for _ in range(n)], 2: [[] for _ in range(n)]}
+        self.counts = {1: 0, 2: 0}
+
+    def _bucket(self, player, r, c):
+        b = self.BUCKET
+        return self.buckets[player][(r // b) * self.bcols + c // b]
+
+    def add(self, unit):
+        self._bucket(unit.player, unit.row, unit.col).append(unit)
+        self.counts[unit.player] += 1
+
+    def remove(self, unit):
+        self._bucket(unit.player, unit.row, unit.col).remove(unit)
+        self.counts[unit.player] -= 1
+
+    def move(self, unit, r, c):
+        old = self._bucket(unit.player, unit.row, unit.col)
+        new = self._bucket(unit.player, r, c)
+        if old is not new:
+            old.remove(unit)
+            new.append(unit)
+
+    def nearest(self, r, c, player):
+        """Ближайший живой юнит игрока по манхэттену: (юнит, дистанция).
+
+        При равных дистанциях — юнит с меньшим uid (как min() по
+        Board.units). Нет юнитов — (None, 9999).
+        """
+        if self.counts[player] == 0:
+            return None, 9999
+        b = self.BUCKET
+        buckets = self.buckets[player]
+        br, bc = r // b, c // b
+        best, best_d, best_uid = None, 9999, -1
+        max_ring = max(br, self.brows - 1 - br, bc, self.bcols - 1 - bc)
+        for k in range(max_ring + 1):
+            # Любая клетка кольца k не ближе (k - 1) * b + 1 по манхэттену
+            if best is not None and (k - 1) * b + 1 > best_d:
+                break
+            for rr in range(max(0, br - k), min(self.brows, br + k + 1)):
+                edge = rr == br - k or rr == br + k
+                step = 1 if edge else 2 * k
+                for cc in range(bc - k, bc + k + 1, step or 1):
+                    if cc < 0 or cc >= self.bcols:
+                        continue
+                    for u in buckets[rr * self.bcols + cc]:
+                        d = abs(u.row - r) + abs(u.col - c)
+                        if (d < best_d or (d == best_d and u.uid < best_uid)) and u.is_alive():
+                            best, best_d, best_uid = u, d, u.uid
+        return best, best_d
+
+    def in_radius(self, r, c, radius, player):
+        """Живые юниты игрока на манхэттенском расстоянии <= radius."""
+        b = self.BUCKET
+        buckets = self.buckets[player]
+        found = []
+        for rr in range(max(0, (r - radius) // b), min(self.brows, (r + radius) // b + 1)):
+            for cc in range(max(0, (c - radius) // b), min(self.bcols, (c + radius) // b + 1)):
+                for u in buckets[rr * self.bcols + cc]:
+                    if abs(u.row - r) + abs(u.col - c) <= radius and u.is_alive():
+                        found.append(u)
+        return found
+
+
+# Отряд на полосу шириной SQUAD_WIDTH клеток:
+# (класс, строка P1 от верхнего края, строка P2 от нижнего края, колонка)
+SQUAD_WIDTH = 10
+SQUAD = [
+    ("cavalry", 3, 4, 4), ("cavalry", 3, 4, 5),
+    ("knight", 1, 3, 3), ("knight", 1, 3, 6),
+    ("knight", 2, 2, 3), ("knight", 2, 2, 6),
+    ("knight", 0, 1, 3), ("archer", 0, 1, 4), ("archer", 0, 1, 5), ("knight", 0, 1, 6),
+]
+MIN_ROWS, MIN_COLS = 12, SQUAD_WIDTH
+
+
 class Board:
-    def __init__(self):
+    """Поле rows x cols. При 20 x 10 — классическая расстановка; на больших
+    полях отряды повторяются полосами по SQUAD_WIDTH колонок, башни мага —
+    у каждой полосы, замки и руины — по центру."""
+
+    def __init__(self, rows=ROWS, cols=COLS, units=None, seed=None):
+        if rows < MIN_ROWS or cols < MIN_COLS:
+            raise ValueError(f"Поле должно быть не меньше {MIN_ROWS}x{MIN_COLS}")
+        self.rows = rows
+        self.cols = cols
         self.units = []
-        self.castle1 = Castle(1, 0, 3)
-        self.castle2 = Castle(2, 16, 3)
-        self.mage_towers = [
-            MageTower(5, 3), MageTower(5, 6),
-            MageTower(14, 3), MageTower(14, 6),
-        ]
-        self.ruins = Ruins(9, 4)
-
-        # P1 (верх)
-        self.units.append(Cavalry(1, 3, 4))
-        self.units.append(Cavalry(1, 3, 5))
-        self.units.append(Knight(1, 1, 3))
-        self.units.append(Knight(1, 1, 6))
-        self.units.append(Knight(1, 2, 3))
-        self.units.append(Knight(1, 2, 6))
-        self.units.append(Knight(1, 0, 3))
-        self.units.append(Archer(1, 0, 4))
-        self.units.append(Archer(1, 0, 5))
-        self.units.append(Knight(1, 0, 6))
-
-        # P2 (низ, та же ориентация что и у P1)
-        self.units.append(Cavalry(2, 16, 4))
-        self.units.append(Cavalry(2, 16, 5))
-        self.units.append(Knight(2, 17, 3))
-        self.units.append(Knight(2, 17, 6))
-        self.units.append(Knight(2, 18, 3))
-        self.units.append(Knight(2, 18, 6))
-        self.units.append(Knight(2, 19, 3))
-        self.units.append(Archer(2, 19, 4))
-        self.units.append(Archer(2, 19, 5))
-        self.units.append(Knight(2, 19, 6))
+        self.rosters = {1: [], 2: []}  # живые юниты игрока в порядке units
+        self.cells = {}  # (r, c) -> юнит: занятость клеток за O(1)
+        self.index = SpatialIndex(rows, cols)
+        # Версия занятости: растёт при каждом изменении клетки;
+        # stamps — версия последнего изменения каждой клетки
+        self.version = 0
+        self.stamps = {}
+        self._reach_cache = {}  # uid -> (row, col, steps, version, клетки, результат)
+        self._next_uid = 0
+        mid = cols // 2
+        self.castle1 = Castle(1, 0, mid - 2)
+        self.castle2 = Castle(2, rows - 4, mid - 2)
+        self.ruins = Ruins(rows // 2 - 1, mid - 1, seed)
+
+        strips = cols // SQUAD_WIDTH
+        offsets = [(cols - strips * SQUAD_WIDTH) // 2 + i * SQUAD_WIDTH
+                   for i in range(strips)]
+        self.mage_towers = []
+        for row in (5, rows - 6):
+            for x0 in offsets:
+                self.mage_towers += [MageTower(row, x0 + 3), MageTower(row, x0 + 6)]
+        self._towers = {(mt.row, mt.col): mt for mt in self.mage_towers}
+
+        if units is not None:
+            # Готовая расстановка (например, из сохранения)
+            for u in units:
+                self.add_unit(u)
+            return
+        # P1 (верх), затем P2 (низ, та же ориентация что и у P1)
+        for player in (1, 2):
+            for x0 in offsets:
+                for unit_type, r1, r2, c in SQUAD:
+                    row = r1 if player == 1 else rows - r2
+                    self.add_unit(UNIT_CLASSES[unit_type](player, row, x0 + c))
+
+    def add_unit(self, unit):
+        unit.uid = self._next_uid
+        self._next_uid += 1
+        self.units.append(unit)
+        self.rosters[unit.player].append(unit)
+        self.cells[(unit.row, unit.col)] = unit
+        self.index.add(unit)
+        self._touch(unit.row, unit.col)
+
+    def move(self, unit, r, c):
+        """Переставить юнит (все перемещения идут через доску)."""
+        if self.cells.get((unit.row, unit.col)) is unit:
+            del self.cells[(unit.row, unit.col)]
+        self._touch(unit.row, unit.col)
+        self.index.move(unit, r, c)
+        unit.row = r
+        unit.col = c
+        self.cells[(r, c)] = unit
+        self._touch(r, c)
+
+    def _touch(self, r, c):
+        self.version += 1
+        self.stamps[(r, c)] = self.version
+
+    def changed_since(self, cells, version):
+        """Менялась ли занятость какой-либо из клеток после version."""
+        if version == self.version:
+            return False
+        stamps = self.stamps
+        return any(stamps.get(rc, 0) > version for rc in cells)
+
+    def in_bounds(self, r, c):
+        return 0 <= r < self.rows and 0 <= c < self.cols
 
     def unit_at(self, r, c):
-        for u in self.units:
-            if u.is_alive() and u.row == r and u.col == c:
-                return u
+        u = self.cells.get((r, c))
+        if u is not None and u.is_alive():
+            return u
         return None
 
     def is_free(self, r, c):
-        if r < 0 or r >= ROWS or c < 0 or c >= COLS:
+        if r < 0 or r >= self.rows or c < 0 or c >= self.cols:
             return False
         return self.unit_at(r, c) is None
 
-    def remove_dead(self):
-        self.units = [u for u in self.units if u.is_alive()]
+    def remove_dead(self, candidates=None):
+        """Убрать погибших. candidates — кого проверить (обычно цель
+        атаки); без него проверяются все юниты."""
+        for u in list(self.units if candidates is None else candidates):
+            # В cells лежат только ещё не убранные юниты
+            if not u.is_alive() and self.cells.get((u.row, u.col)) is u:
+                del self.cells[(u.row, u.col)]
+                self._touch(u.row, u.col)
+                self._reach_cache.pop(u.uid, None)
+                self.index.remove(u)
+                self.rosters[u.player].remove(u)
+                self.units.remove(u)
+
+    def alive_count(self, player):
+        return len(self.rosters[player])
+
+    def reachable(self, unit, steps=None):
+        """Клетки, куда юнит дойдёт пешком за steps шагов (по умолчанию —
+        moves_left): {(r, c): число шагов}. Обход в ширину по свободным
+        клеткам; результат кэшируется и пересчитывается, только если
+        изменилась занятость просмотренных клеток."""
+        if steps is None:
+            steps = unit.moves_left
+        hit = self._reach_cache.get(unit.uid)
+        if (hit is not None and hit[:3] == (unit.row, unit.col, steps)
+                and not self.changed_since(hit[4], hit[3])):
+            return hit[5]
+        start = (unit.row, unit.col)
+        dist = {}
+        seen = {start}
+        frontier = [start]
+        for step in range(1, steps + 1):
+            nxt = []
+            for r, c in frontier:
+                for nr, nc in ((r - 1, c), (r + 1, c), (r, c - 1), (r, c + 1)):
+                    if (nr, nc) in seen:
+                        continue
+                    seen.add((nr, nc))
+                    if self.is_free(nr, nc):
+                        dist[(nr, nc)] = step
+                        nxt.append((nr, nc))
+            frontier = nxt
+        self._reach_cache[unit.uid] = (unit.row, unit.col, steps, self.version, seen, dist)
+        return dist
+
+    def nearest_unit(self, r, c, player):
+        """Ближайший по манхэттену живой юнит игрока: (юнит, дистанция)."""
+        return self.index.nearest(r, c, player)
+
+    def units_in_radius(self, r, c, radius, player):
+        return self.index.in_radius(r, c, radius, player)
 
     def player_units(self, player):
-        return [u for u in self.units if u.player == player and u.is_alive()]
+        """Живые юниты игрока — общий список доски, менять его нельзя."""
+        return self.rosters[player]
 
     def is_in_mage_tower(self, r, c):
-        for mt in self.mage_towers:
-            if mt.contains(r, c):
-                return mt
-        return None
+        return self._towers.get((r, c))
 
     def is_in_ruins(self, r, c):
         return self.ruins.contains(r, c)
 
 
+# ========================== КАМЕРА ==========================
+
+class Camera:
+    """Окно просмотра поля: смещение в пикселях мира и текущий размер клетки.
+
+    Отрисовка поля обходит только клетки внутри окна, поэтому время кадра
+    зависит от размера окна, а не от размера карты.
+    """
+
+    def __init__(self, board, view_w=BOARD_VIEW_W, view_h=HEIGHT):
+        self.board = board
+        self.view_w = view_w
+        self.view_h = view_h
+        self.cs = CELL_SIZE
+        self.x = 0
+        self.y = 0
+        self.clamp()
+
+    def clamp(self):
+        """Не уводить поле за край; поле меньше окна — по центру."""
+        world_w = self.board.cols * self.cs
+        world_h = self.board.rows * self.cs
+        if world_w <= self.view_w:
+            self.x = -((self.view_w - world_w) // 2)
+        else:
+            self.x = max(0, min(self.x, world_w - self.view_w))
+        if world_h <= self.view_h:
+            self.y = -((self.view_h - world_h) // 2)
+        else:
+            self.y = max(0, min(self.y, world_h - self.view_h))
+
+    def scroll(self, dx, dy):
+        self.x += dx
+        self.y += dy
+        self.clamp()
+
+    def zoom(self, step, mx=None, my=None):
+        """Сменить масштаб на step уровней, сохраняя точку под курсором."""
+        if mx is None:
+            mx, my = self.view_w // 2, self.view_h // 2
+        sizes = CAMERA_CELL_SIZES
+        i = min(range(len(sizes)), key=lambda k: abs(sizes[k] - self.cs))
+        new = sizes[max(0, min(len(sizes) - 1, i + step))]
+        if new == self.cs:
+            return
+        wx = (self.x + mx) / self.cs
+        wy = (self.y + my) / self.cs
+        self.cs = new
+        self.x = int(wx * new) - mx
+        self.y = int(wy * new) - my
+        self.clamp()
+
+    def center_on(self, r, c):
+        self.x = c * self.cs + self.cs // 2 - self.view_w // 2
+        self.y = r * self.cs + self.cs // 2 - self.view_h // 2
+        self.clamp()
+
+    def visible_cells(self):
+        """(r0, r1, c0, c1): полуинтервалы видимых клеток, обрезанные по полю."""
+        cs = self.cs
+        r0 = max(0, self.y // cs)
+        c0 = max(0, self.x // cs)
+        r1 = min(self.board.rows, (self.y + self.view_h) // cs + 1)
+        c1 = min(self.board.cols, (self.x + self.view_w) // cs + 1)
+        return r0, r1, c0, c1
+
+    def to_screen(self, r, c):
+        return c * self.cs - self.x, r * self.cs - self.y
+
+    def to_cell(self, mx, my):
+        return (my + self.y) // self.cs, (mx + self.x) // self.cs
+
+    def is_visible(self, x, y, w, h):
+        """Пересекает ли прямоугольник (в экранных координатах) окно поля."""
+        return x < self.view_w and y < self.view_h and x + w > 0 and y + h > 0
+
+
 # ========================== МЕНЮ ==========================
 
 class MenuScreen:
@@ -433,13 +1296,7 @@ class MenuScreen:
         self.font_small = pygame.font.SysFont("Arial", 12)
 
         # Обложка
-        cover_path = os.path.join(os.path.dirname(os.path.abspath(__file__)),
-                                  "Knights_and_Castles_1920x1080.png")
-        if os.path.exists(cover_path):
-            raw = pygame.image.load(cover_path).convert()
-            self.cover = pygame.transform.smoothscale(raw, (WIDTH, HEIGHT))
-        else:
-            self.cover = None
+        self.cover = get_asset_cache().get("cover")
 
         # Контент правил в пикселях
         self.rule_line_h = 20
@@ -452,12 +1309,14 @@ class MenuScreen:
 
         # Кнопки (фиксированы внизу экрана)
         self.btn_h = 50
-        self.btn_w = (WIDTH - 60) // 2
-        self.btn1_rect = pygame.Rect(20,          HEIGHT - self.btn_h - 10, self.btn_w, self.btn_h)
-        self.btn2_rect = pygame.Rect(WIDTH // 2 + 10, HEIGHT - self.btn_h - 10, self.btn_w, self.btn_h)
+        self.btn_w = (WIDTH - 80) // 3
+        by = HEIGHT - self.btn_h - 10
+        self.btn1_rect = pygame.Rect(20,                        by, self.btn_w, self.btn_h)
+        self.btn2_rect = pygame.Rect(40 + self.btn_w,           by, self.btn_w, self.btn_h)
+        self.btn3_rect = pygame.Rect(60 + 2 * self.btn_w,       by, self.btn_w, self.btn_h)
 
     def run(self):
-        """Главный цикл меню. Возвращает '2p' или 'ai'."""
+        """Главный цикл меню. Возвращает '2p', 'ai' или 'aivai'."""
         while True:
             self.clock.tick(FPS)
             for event in pygame.event.get():
@@ -488,6 +1347,8 @@ class MenuScreen:
             return "2p"
         if self.btn2_rect.collidepoint(mx, my):
             return "ai"
+        if self.btn3_rect.collidepoint(mx, my):
+            return "aivai"
         return None
 
     def _draw(self):
@@ -554,6 +1415,12 @@ class MenuScreen:
         t2 = self.font_big.render("🤖 Против ИИ", True, (255, 80, 80))
         self.screen.blit(t2, (self.btn2_rect.centerx - t2.get_width() // 2,
                                self.btn2_rect.centery - t2.get_height() // 2))
+        # Кнопка «ИИ против ИИ»
+        pygame.draw.rect(self.screen, btn_bg, self.btn3_rect, border_radius=8)
+        pygame.draw.rect(self.screen, (200, 170, 60), self.btn3_rect, 3, border_radius=8)
+        t3 = self.font_big.render("ИИ против ИИ", True, (255, 215, 80))
+        self.screen.blit(t3, (self.btn3_rect.centerx - t3.get_width() // 2,
+                               self.btn3_rect.centery - t3.get_height() // 2))
 
         # Подсказка скролла
         hint = self.font_small.render("↑↓ / колёсико мыши — прокрутка правил", True, (100, 90, 70))
@@ -565,40 +1432,57 @@ class MenuScreen:
 # ========================== ИИ-ПРОТИВНИК ==========================
 
 class AIPlayer:
-    """Тактический ИИ для Игрока 2. Использует эвристическую оценку ходов."""
+    """Тактический ИИ за одного из игроков. Использует эвристическую оценку ходов."""
 
     DELAY_FRAMES = 18  # задержка между действиями (для визуальности)
 
-    def __init__(self, game):
+    def __init__(self, game, player=2):
         self.game = game
-        self.player = 2
-        self._action_queue = []   # [(func, args), ...]
+        self.player = player
+        self.enemy = 2 if player == 1 else 1
+        self._action_queue = deque()   # [(код, a, b), ...]
         self._delay = 0
 
     # ---------- Публичный интерфейс ----------
 
     def start_turn(self):
         """Планируем все ходы AI на этот ход и складываем в очередь."""
-        self._action_queue = []
+        self._action_queue = deque()
         g = self.game
         alive = g.board.player_units(self.player)
-        max_act = min(g.max_units_per_turn, len(alive))
+        # units_acted > 0 только если ход продолжается после загрузки
+        max_act = min(g.max_units_per_turn, len(alive)) - g.units_acted
         units_to_act = [u for u in alive if not u.done][:max_act]
         for unit in units_to_act:
             self._plan_unit(unit)
+        # Планирование перебило подсветку; после загрузки посреди хода
+        # выбранный юнит должен ходить по своей
+        if g.selected_unit is not None:
+            g.calc_moves(g.selected_unit)
         # Финальное: завершить ход
-        self._action_queue.append((g.end_turn, ()))
+        self._action_queue.append((ACT_END, 0, 0))
 
-    def step(self):
-        """Вызывается каждый кадр во время хода AI. Выполняет одно действие с задержкой."""
+    def step(self, speed=1):
+        """Вызывается каждый кадр во время хода AI: speed действий за
+        DELAY_FRAMES кадров; None — одно действие сразу, без задержки."""
+        g = self.game
         if not self._action_queue:
             return
-        self._delay -= 1
-        if self._delay > 0:
+        if speed is None:
+            g.apply_action(self.next_action())
             return
-        fn, args = self._action_queue.pop(0)
-        fn(*args)
-        self._delay = self.DELAY_FRAMES
+        self._delay -= speed
+        # Несколько действий за кадр — только пока ход не перешёл к другому
+        while (self._delay <= 0 and self._action_queue
+               and g.current_player == self.player and g.state != "game_over"):
+            g.apply_action(self.next_action())
+            self._delay += self.DELAY_FRAMES
+
+    def next_action(self):
+        """Следующее запланированное действие; пустая очередь — конец хода."""
+        if self._action_queue:
+            return self._action_queue.popleft()
+        return (ACT_END, 0, 0)
 
     def is_done(self):
         return len(self._action_queue) == 0
@@ -607,25 +1491,14 @@ class AIPlayer:
 
     def _plan_unit(self, unit):
         """Планируем действия одного юнита — добавляем в очередь."""
-        g = self.game
         # Выбираем юнит
-        self._action_queue.append((self._select, (unit,)))
+        self._action_queue.append((ACT_SELECT, unit.row, unit.col))
 
         # Ищем лучшее действие для каждого очка хода
-        actions = self._best_actions(unit)
-        for fn, args in actions:
-            self._action_queue.append((fn, args))
+        self._action_queue.extend(self._best_actions(unit))
 
         # Пропускаем (заканчиваем ход юнита)
-        self._action_queue.append((g.next_unit, ()))
-
-    def _select(self, unit):
-        g = self.game
-        g.selected_unit = unit
-        unit.active = True
-        unit.moves_left = unit.max_moves
-        g.state = "move"
-        g.calc_moves(unit)
+        self._action_queue.append((ACT_NEXT, 0, 0))
 
     # ---------- Оценочная функция ----------
 
@@ -633,12 +1506,7 @@ class AIPlayer:
         return abs(r1 - r2) + abs(c1 - c2)
 
     def _nearest_enemy(self, unit):
-        g = self.game
-        enemies = g.board.player_units(1)
-        if not enemies:
-            return None, 9999
-        nearest = min(enemies, key=lambda e: self._dist(unit.row, unit.col, e.row, e.col))
-        return nearest, self._dist(unit.row, unit.col, nearest.row, nearest.col)
+        return self.game.board.nearest_unit(unit.row, unit.col, self.enemy)
 
     def _score_move(self, unit, nr, nc, is_attack=False, attack_target=None):
         """Оценить конкретный ход/атаку — возвращает числовой счёт."""
@@ -648,7 +1516,7 @@ class AIPlayer:
         if is_attack and attack_target:
             # Сколько урона нанесём
             dmg = unit.damage
-            if g.fire_shield.get(1, False):
+            if g.fire_shield.get(self.enemy, False):
                 dmg = max(0, dmg - 2)
             effective_dmg = max(0, dmg - max(0, attack_target.armor))
             # Убиваем — огромный бонус
@@ -675,11 +1543,8 @@ class AIPlayer:
         # Башня мага — полезно если есть ингредиенты
         mt = g.board.is_in_mage_tower(nr, nc)
         if mt:
-            inv = g.inventory[self.player]
-            for sp in SPELL_RECIPES:
-                if can_craft(inv, sp["recipe"]):
-                    score += 200
-                    break
+            if g.inventory[self.player].craftable() & SPELL_MASK:
+                score += 200
             else:
                 score += 5
 
@@ -697,33 +1562,33 @@ class AIPlayer:
         return score
 
     def _best_actions(self, unit):
-        """Возвращает список (fn, args) — лучшие действия для юнита."""
+        """Возвращает список действий (код, a, b) — лучшие для юнита."""
         g = self.game
         result = []
         g.calc_moves(unit)
 
         # Спецдействия: руины
         if g.board.is_in_ruins(unit.row, unit.col) and unit.moves_left > 0:
-            result.append((g.try_draw_card, ()))
+            result.append((ACT_DRAW, 0, 0))
             return result
 
         # Спецдействия: башня мага
+        # (башню занимает select_unit при выполнении — план состояние не меняет)
         mt = g.board.is_in_mage_tower(unit.row, unit.col)
         if mt:
-            mt.occupant = unit
             inv = g.inventory[self.player]
             for i, sp in enumerate(SPELL_RECIPES):
-                if can_craft(inv, sp["recipe"]):
+                if inv.can_craft(sp):
                     idx = i
-                    result.append((g.try_cast_spell, (idx,)))
+                    result.append((ACT_SPELL, idx, 0))
                     return result
 
         # Крафт оружия если выгодно
         inv = g.inventory[self.player]
         for i, wp in enumerate(WEAPON_RECIPES):
-            if can_craft(inv, wp["recipe"]):
+            if inv.can_craft(wp):
                 if wp["target"] == "any" or wp["target"] == unit.unit_type:
-                    result.append((g.try_craft_weapon, (i,)))
+                    result.append((ACT_CRAFT, i, 0))
 
         # Атака — ищем лучшую
         best_atk_score = -1
@@ -757,40 +1622,275 @@ class AIPlayer:
         if best_atk_pos and best_atk_score >= best_mv_score:
             r, c = best_atk_pos
             if unit.unit_type == "archer":
-                result.append((g.do_archer_shoot, (r, c)))
+                result.append((ACT_SHOOT, r, c))
             else:
-                result.append((g.do_jump_attack, (r, c)))
+                result.append((ACT_JUMP, r, c))
         elif best_mv_pos:
-            result.append((g.move_unit, (best_mv_pos[0], best_mv_pos[1])))
+            result.append((ACT_MOVE, best_mv_pos[0], best_mv_pos[1]))
             # После движения — проверим атаку снова (рекурсивно не идём, просто добавляем)
             # Планировщик добавит next_unit после
 
         return result
 
 
+# ========================== СОХРАНЕНИЯ ==========================
+
+# Формат (little-endian): заголовок, два инвентаря, юниты, занятые башни.
+SAVE_MAGIC = b"KCSV"
+SAVE_VERSION = 2
+# magic, версия, rows, cols, текущий игрок, units_acted, max_units_per_turn,
+# состояние, победитель, флаги, зерно и счётчик колоды руин, выбранный юнит, юнитов
+_SAVE_HEAD = struct.Struct("<4sHHHBBBBBBQQhH")
+_SAVE_INV = struct.Struct(f"<{len(ARTIFACT_NAMES)}H")
+# тип, игрок, row, col, hp, max_hp, урон, броня, max_armor, max_moves, moves_left, флаги
+_SAVE_UNIT = struct.Struct("<BBHHhhhhhBBB")
+UNIT_TYPES = list(UNIT_CLASSES)
+UNIT_TYPE_IDS = {name: i for i, name in enumerate(UNIT_TYPES)}
+GAME_STATES = ("select", "move", "game_over")
+_FLAG_SHIELD1, _FLAG_SHIELD2, _FLAG_AI, _FLAG_AI1 = 1, 2, 4, 8  # _FLAG_AI — ИИ за игрока 2
+_FLAG_DONE, _FLAG_ACTIVE = 1, 2
+_SAVE_FLAGS_AT = struct.calcsize("<4sHHHBBBBB")  # смещение флагов в заголовке
+
+
+def _read_save(data):
+    """Проверить заголовок и разрезать сохранение на части."""
+    if len(data) < _SAVE_HEAD.size:
+        raise ValueError("сохранение обрезано")
+    head = _SAVE_HEAD.unpack_from(data)
+    if head[0] != SAVE_MAGIC:
+        raise ValueError("это не сохранение Рыцарей и Замков")
+    if head[1] != SAVE_VERSION:
+        raise ValueError(f"версия сохранения {head[1]} не поддерживается")
+    off = _SAVE_HEAD.size
+    inventories = []
+    for _ in (1, 2):
+        inventories.append(_SAVE_INV.unpack_from(data, off))
+        off += _SAVE_INV.size
+    if any(n > INV_MAX for inv in inventories for n in inv):
+        raise ValueError("сохранение повреждено: инвентарь")
+    end = off + head[-1] * _SAVE_UNIT.size
+    if len(data) < end:
+        raise ValueError("сохранение обрезано")
+    units = list(_SAVE_UNIT.iter_unpack(memoryview(data)[off:end]))
+    towers = struct.unpack_from(f"<{(len(data) - end) // 2}h", data, end)
+    # Индексы проверяем здесь: испорченный файл — ValueError, а не IndexError
+    n = len(units)
+    if head[4] not in (1, 2) or head[7] >= len(GAME_STATES) or not -1 <= head[12] < n:
+        raise ValueError("сохранение повреждено: заголовок")
+    rows, cols = head[2], head[3]
+    for u in units:
+        if u[0] >= len(UNIT_TYPES) or u[1] not in (1, 2) or u[2] >= rows or u[3] >= cols:
+            raise ValueError("сохранение повреждено: юнит")
+    if any(not -1 <= i < n for i in towers):
+        raise ValueError("сохранение повреждено: башня")
+    return head, inventories, units, towers
+
+
+def _ai_sides(flags):
+    return tuple(p for p, bit in ((1, _FLAG_AI1), (2, _FLAG_AI)) if flags & bit)
+
+
+def decode_save(data):
+    """Разобрать сохранение в словарь (он же — JSON-экспорт)."""
+    head, inventories, units, towers = _read_save(data)
+    (_, version, rows, cols, player, acted, max_units, state, winner, flags,
+     seed, draws, selected, _) = head
+    return {"version": version, "rows": rows, "cols": cols,
+            "current_player": player, "units_acted": acted,
+            "max_units_per_turn": max_units, "state": GAME_STATES[state],
+            "winner": winner or None, "ai_players": _ai_sides(flags),
+            "fire_shield": {1: bool(flags & _FLAG_SHIELD1), 2: bool(flags & _FLAG_SHIELD2)},
+            "ruins": {"seed": seed, "draws": draws},
+            "selected": selected if selected >= 0 else None,
+            "inventory": {p: dict(zip(ARTIFACT_NAMES, inv))
+                          for p, inv in zip((1, 2), inventories)},
+            "units": [{"type": UNIT_TYPES[t], "player": up, "row": r, "col": c,
+                       "hp": hp, "max_hp": max_hp, "damage": dmg, "armor": armor,
+                       "max_armor": max_armor, "max_moves": max_moves,
+                       "moves_left": moves_left, "done": bool(uf & _FLAG_DONE),
+                       "active": bool(uf & _FLAG_ACTIVE)}
+                      for (t, up, r, c, hp, max_hp, dmg, armor, max_armor, max_moves,
+                           moves_left, uf) in units],
+            "tower_occupants": list(towers)}
+
+
+# ========================== ПОВТОРЫ ==========================
+
+# Действия игроков и ИИ — кортежи (код, a, b); a, b — клетка или номер рецепта
+(ACT_SELECT, ACT_MOVE, ACT_JUMP, ACT_SHOOT, ACT_DRAW, ACT_SPELL, ACT_CRAFT,
+ ACT_NEXT, ACT_END, ACT_DESELECT, ACT_SURRENDER) = range(11)
+ACTION_NAMES = ("select", "move", "jump", "shoot", "draw", "spell", "craft",
+                "next", "end", "deselect", "surrender")
+ACTION_RECORD = struct.Struct("<BHH")  # запись действия в повторе
+
+REPLAY_MAGIC = b"KCRP"
+REPLAY_VERSION = 2
+REPLAY_SNAPSHOT_EVERY = 64
+# magic, версия, шаг снимков, действий, снимков, ходов
+_REPLAY_HEAD = struct.Struct("<4sHHIII")
+_REPLAY_SNAP = struct.Struct("<II")  # номер действия, длина сохранения
+
+
+class Replay:
+    """Повтор партии: поток действий по 5 байт (только дописывается),
+    начальное состояние и снимки save_state() каждые snapshot_every действий.
+
+    Зерно колоды руин входит в каждый снимок, поэтому перемотка к любому
+    действию — загрузка ближайшего снимка и не больше snapshot_every шагов.
+    """
+
+    def __init__(self, initial, snapshot_every=REPLAY_SNAPSHOT_EVERY):
+        self.snapshot_every = snapshot_every
+        self.actions = bytearray()
+        self.snapshots = [(0, initial)]
+        self.turn_starts = [0]  # номера действий, с которых начинается ход
+        self._player = _SAVE_HEAD.unpack_from(initial)[4]
+
+    def __len__(self):
+        return len(self.actions) // ACTION_RECORD.size
+
+    def __iter__(self):
+        return ACTION_RECORD.iter_unpack(self.actions)
+
+    def action(self, i):
+        return ACTION_RECORD.unpack_from(self.actions, i * ACTION_RECORD.size)
+
+    def record(self, action, game):
+        self.actions += ACTION_RECORD.pack(*action)
+        n = len(self)
+        if game.current_player != self._player:
+            self._player = game.current_player
+            self.turn_starts.append(n)
+        if n % self.snapshot_every == 0:
+            self.snapshots.append((n, game.save_state()))
+
+    def turn_of(self, i):
+        """Номер хода (с нуля), которому принадлежит позиция i."""
+        return bisect_right(self.turn_starts, i) - 1
+
+    def seek(self, game, i):
+        """Привести game к состоянию после первых i действий.
+
+        В повтор пишутся только выполненные действия — отказ при
+        перемотке значит, что позиция разошлась с партией (ValueError).
+        """
+        k = bisect_right(self.snapshots, i, key=lambda snap: snap[0]) - 1
+        start, state = self.snapshots[k]
+        game.load_state(state)
+        for j in range(start, i):
+            action = self.action(j)
+            if game.apply_action(action, record=False) is False:
+                raise ValueError(f"действие {j} ({ACTION_NAMES[action[0]]}) "
+                                 "не выполняется при перемотке")
+
+    def finish(self, game):
+        """Дописать снимок конечного состояния (если его ещё нет)."""
+        if self.snapshots[-1][0] != len(self):
+            self.snapshots.append((len(self), game.save_state()))
+
+    def summary(self):
+        """Кто ходил первым, победитель (0 — нет) и длина партии."""
+        return {"first_player": _SAVE_HEAD.unpack_from(self.snapshots[0][1])[4],
+                "winner": _SAVE_HEAD.unpack_from(self.snapshots[-1][1])[8],
+                "actions": len(self), "turns": len(self.turn_starts)}
+
+    def to_bytes(self):
+        parts = [_REPLAY_HEAD.pack(REPLAY_MAGIC, REPLAY_VERSION, self.snapshot_every,
+                                   len(self), len(self.snapshots), len(self.turn_starts)),
+                 self.actions,
+                 struct.pack(f"<{len(self.turn_starts)}I", *self.turn_starts)]
+        for n, state in self.snapshots:
+            parts += [_REPLAY_SNAP.pack(n, len(state)), state]
+        return b"".join(parts)
+
+    @staticmethod
+    def split(data):
+        """Разрезать сериализованный повтор без копирования.
+
+        Возвращает (шаг снимков, действия, начала ходов, [(номер, снимок)]);
+        действия и снимки — срезы memoryview над data.
+        """
+        data = memoryview(data)
+        if len(data) < _REPLAY_HEAD.size:
+            raise ValueError("повтор обрезан")
+        magic, version, every, n_actions, n_snaps, n_turns = _REPLAY_HEAD.unpack_from(data)
+        if magic != REPLAY_MAGIC:
+            raise ValueError("это не повтор Рыцарей и Замков")
+        if version != REPLAY_VERSION:
+            raise ValueError(f"версия повтора {version} не поддерживается")
+        off = _REPLAY_HEAD.size
+        end = off + n_actions * ACTION_RECORD.size
+        if end + 4 * n_turns > len(data):
+            raise ValueError("повтор обрезан")
+        actions = data[off:end]
+        turn_starts = struct.unpack_from(f"<{n_turns}I", data, end)
+        off = end + 4 * n_turns
+        snapshots = []
+        for _ in range(n_snaps):
+            if off + _REPLAY_SNAP.size > len(data):
+                raise ValueError("повтор обрезан")
+            n, size = _REPLAY_SNAP.unpack_from(data, off)
+            off += _REPLAY_SNAP.size
+            snapshots.append((n, data[off:off + size]))
+            off += size
+        if off > len(data) or not snapshots:
+            raise ValueError("повтор обрезан")
+        return every, actions, turn_starts, snapshots
+
+    @classmethod
+    def from_bytes(cls, data):
+        every, actions, turn_starts, snapshots = cls.split(data)
+        replay = cls(bytes(snapshots[0][1]), every)
+        replay.actions = bytearray(actions)
+        replay.snapshots = [(n, bytes(state)) for n, state in snapshots]
+        replay.turn_starts = list(turn_starts)
+        return replay
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
 # ========================== ИГРА ==========================
 
 class Game:
-    def __init__(self, ai_mode=False, screen=None, clock=None):
-        if screen is None:
-            self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
-            pygame.display.set_caption("Рыцари и Замки")
+    """Партия. ai_mode — ИИ за игрока 2; ai_sides — явный список игроков
+    за ИИ (например, (1, 2) — ИИ против ИИ). headless — без окна, шрифтов
+    и спрайтов: только правила (для симуляций)."""
+
+    def __init__(self, ai_mode=False, screen=None, clock=None, rows=ROWS, cols=COLS,
+                 seed=None, ai_sides=None, headless=False):
+        self.headless = headless
+        if headless:
+            self.screen = self.clock = None
+            self.sprites = None
         else:
-            self.screen = screen
-        self.clock = clock if clock else pygame.time.Clock()
-        self.font = pygame.font.SysFont("Arial", 13)
-        self.font_big = pygame.font.SysFont("Arial", 18, bold=True)
-        self.font_title = pygame.font.SysFont("Arial", 24, bold=True)
-        self.font_small = pygame.font.SysFont("Arial", 11)
-
-        self.sprites = SpriteManager()
-        self.board = Board()
+            if screen is None:
+                self.screen = pygame.display.set_mode((WIDTH, HEIGHT))
+                pygame.display.set_caption("Рыцари и Замки")
+            else:
+                self.screen = screen
+            self.clock = clock if clock else pygame.time.Clock()
+            self.font = pygame.font.SysFont("Arial", 13)
+            self.font_big = pygame.font.SysFont("Arial", 18, bold=True)
+            self.font_title = pygame.font.SysFont("Arial", 24, bold=True)
+            self.font_small = pygame.font.SysFont("Arial", 11)
+            self.sprites = SpriteManager()
+
+        # Зерно партии: одно и то же зерно и действия дают ту же партию
+        self.seed = new_seed() if seed is None else seed
+        self.board = Board(rows, cols, seed=self.seed)
+        self.camera = Camera(self.board)
+        self._drag = False
+        self._draw_cache = {}  # (что, размер клетки) -> готовая Surface
 
         # Инвентари артефактов для каждого игрока
-        self.inventory = {
-            1: {name: 0 for name in ARTIFACT_NAMES},
-            2: {name: 0 for name in ARTIFACT_NAMES},
-        }
+        self.inventory = {1: Inventory(), 2: Inventory()}
 
         self.current_player = 1
         self.units_acted = 0
@@ -801,11 +1901,16 @@ class Game:
         self.jump_targets = {}
         self.move_costs = {}
         self.jump_costs = {}
+        # Последний расчёт calc_moves: (юнит, row, col, moves_left,
+        # версия доски, просмотренные клетки, ходы)
+        self._moves_cache = None
 
         self.state = "select"
         self.message = "Ход Игрока 1: выберите юнит"
         self.popup_text = None
         self.popup_timer = 0
+        self.banner = None  # строка поверх поля (например, позиция повтора)
+        self.marks = []     # [(r, c, "sel" | "move" | "attack")] — подсветка линии анализа
         self.fire_shield = {1: False, 2: False}
         self.winner = None
 
@@ -814,13 +1919,34 @@ class Game:
 
         # Предпросмотр фигурки
         self.preview_unit = None
+        self._preview_bg = None
+
+        # Общий счётчик анимации и начавшиеся атаки: unit -> тик начала
+        self.anim_tick = 0
+        self.attack_anims = {}
+        # Без окна эффекты не рисуются — пул нулевой ёмкости не тратит память
+        self.effects = ParticleSystem(self.sprites, 0 if headless else EFFECT_CAPACITY)
 
         # AI режим
-        self.ai_mode = ai_mode
-        self.ai_player = AIPlayer(self) if ai_mode else None
+        if ai_sides is None:
+            ai_sides = (2,) if ai_mode else ()
+        self.ai_players = {p: AIPlayer(self, p) for p in ai_sides}
+        self.ai_mode = bool(self.ai_players)
         self._ai_thinking = False  # True когда AI планирует ход
+        self.ai_speed = 0          # индекс в AI_SPEEDS
+        self._frame = 0
+
+        # Все действия идут через apply_action и пишутся в повтор
+        self._handlers = (self.select_unit, self.move_unit, self.do_jump_attack,
+                          self.do_archer_shoot, self.try_draw_card, self.try_cast_spell,
+                          self.try_craft_weapon, self.next_unit, self.end_turn,
+                          self.deselect_unit, self.surrender)
+        self.replay = None
 
         self.start_turn()
+        self.replay = Replay(self.save_state())
+        if len(self.ai_players) == 2 and not headless:
+            self.set_ai_speed(0)
 
     # -------------------- Ходы --------------------
 
@@ -832,10 +1958,21 @@ class Game:
             u.reset_moves()
         self.update_message()
         # Если ход AI — запускаем планирование
-        if self.ai_mode and self.current_player == 2 and self.ai_player:
-            self.ai_player.start_turn()
+        ai = self.ai_players.get(self.current_player)
+        if ai:
+            ai.start_turn()
             self._ai_thinking = True
 
+    def is_ai_turn(self):
+        return self.current_player in self.ai_players
+
+    def set_ai_speed(self, idx):
+        self.ai_speed = idx
+        if len(self.ai_players) == 2:
+            self.banner = f"ИИ против ИИ — скорость {AI_SPEED_LABELS[idx]} (1/2/3)"
+        else:
+            self.show_popup(f"Скорость ИИ: {AI_SPEED_LABELS[idx]}")
+
     def end_turn(self):
         enemy = 2 if self.current_player == 1 else 1
         if self.fire_shield[self.current_player]:
@@ -855,8 +1992,7 @@ class Game:
         self.jump_targets = {}
         self.move_costs = {}
         self.jump_costs = {}
-        alive = self.board.player_units(self.current_player)
-        max_can = min(self.max_units_per_turn, len(alive))
+        max_can = min(self.max_units_per_turn, self.board.alive_count(self.current_player))
         if self.units_acted >= max_can:
             self.end_turn()
         else:
@@ -865,7 +2001,7 @@ class Game:
 
     def update_message(self):
         p = self.current_player
-        left = min(self.max_units_per_turn, len(self.board.player_units(p))) - self.units_acted
+        left = min(self.max_units_per_turn, self.board.alive_count(p)) - self.units_acted
         self.message = f"Игрок {p}: выберите юнит ({left} ост.)"
 
     def show_popup(self, text):
@@ -875,6 +2011,12 @@ class Game:
     # -------------------- Вычисление ходов --------------------
 
     def calc_moves(self, unit):
+        """Заполнить подсветку ходов выбранного юнита.
+
+        Результат кэшируется: пока юнит стоит на месте, а просмотренные
+        клетки не менялись, новый расчёт не нужен — при уменьшении
+        moves_left из прошлого списка просто отбрасываются дорогие ходы.
+        """
         self.move_highlights = []
         self.attack_highlights = []
         self.jump_targets = {}
@@ -882,50 +2024,159 @@ class Game:
         self.jump_costs = {}
         if unit.moves_left <= 0:
             return
-        if unit.unit_type == "archer":
-            self._calc_archer_moves(unit)
-        else:
-            self._calc_melee_moves(unit)
-
-    def _calc_melee_moves(self, unit):
+        hit = self._moves_cache
+        if (hit is None or hit[:3] != (unit, unit.row, unit.col)
+                or hit[3] < unit.moves_left
+                or self.board.changed_since(hit[5], hit[4])):
+            looked = []
+            if unit.unit_type == "archer":
+                moves = self._calc_archer_moves(unit, looked)
+            else:
+                moves = self._calc_melee_moves(unit, looked)
+            hit = (unit, unit.row, unit.col, unit.moves_left,
+                   self.board.version, looked, moves)
+            self._moves_cache = hit
+        left = unit.moves_left
+        for kind, cell, cost, target in hit[6]:
+            if cost > left:
+                continue
+            if kind == "move":
+                self.move_highlights.append(cell)
+                self.move_costs[cell] = cost
+            else:
+                self.attack_highlights.append(cell)
+                if kind == "jump":
+                    self.jump_targets[cell] = target
+                    self.jump_costs[cell] = cost
+
+    def _calc_melee_moves(self, unit, looked):
+        """Ходы пехоты и кавалерии: [(вид, клетка, цена, цель)]."""
+        moves = []
         r, c = unit.row, unit.col
         for dr, dc in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
             nr, nc = r + dr, c + dc
-            if 0 <= nr < ROWS and 0 <= nc < COLS:
+            if self.board.in_bounds(nr, nc):
+                looked.append((nr, nc))
                 target = self.board.unit_at(nr, nc)
                 if target is None:
-                    self.move_highlights.append((nr, nc))
-                    self.move_costs[(nr, nc)] = 1
+                    moves.append(("move", (nr, nc), 1, None))
                 elif target.player != unit.player:
                     land_r, land_c = nr + dr, nc + dc
+                    looked.append((land_r, land_c))
                     if unit.moves_left >= 2 and self.board.is_free(land_r, land_c):
-                        self.attack_highlights.append((land_r, land_c))
-                        self.jump_targets[(land_r, land_c)] = target
-                        self.jump_costs[(land_r, land_c)] = 2
+                        moves.append(("jump", (land_r, land_c), 2, target))
+        return moves
 
-    def _calc_archer_moves(self, unit):
+    def _calc_archer_moves(self, unit, looked):
+        """Ходы лучника: [(вид, клетка, цена, цель)]."""
+        moves = []
         r, c = unit.row, unit.col
         for dr, dc in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
             for dist in range(1, 3):
                 if unit.moves_left < dist:
                     break
                 nr, nc = r + dr * dist, c + dc * dist
+                looked.append((nr, nc))
                 if not self.board.is_free(nr, nc):
                     break
-                self.move_highlights.append((nr, nc))
-                self.move_costs[(nr, nc)] = dist
+                moves.append(("move", (nr, nc), dist, None))
         for dr, dc in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
             nr, nc = r + dr, c + dc
-            if 0 <= nr < ROWS and 0 <= nc < COLS:
+            if self.board.in_bounds(nr, nc):
+                looked.append((nr, nc))
                 target = self.board.unit_at(nr, nc)
                 if target and target.player != unit.player:
-                    self.attack_highlights.append((nr, nc))
+                    moves.append(("shoot", (nr, nc), 1, target))
+        return moves
 
     # -------------------- Действия --------------------
 
+    def apply_action(self, action, record=True):
+        """Выполнить действие (код, a, b); успешное — дописать в повтор."""
+        code, a, b = action
+        if code <= ACT_SHOOT:
+            ok = self._handlers[code](a, b)
+        elif code in (ACT_SPELL, ACT_CRAFT):
+            ok = self._handlers[code](a)
+        else:
+            ok = self._handlers[code]()
+        if ok is not False and record and self.replay is not None:
+            self.replay.record(action, self)
+        return ok
+
+    def is_legal(self, action):
+        """Можно ли выполнить действие сейчас — для действий извне (сеть),
+        которым нельзя доверять больше, чем кликам в интерфейсе."""
+        code, a, b = action
+        if self.state == "game_over" or code >= len(ACTION_NAMES):
+            return False
+        unit = self.selected_unit
+        if code == ACT_SELECT:
+            # Сменить юнит можно, только пока выбранный не ходил
+            u = self.board.unit_at(a, b)
+            return (u is not None and u.player == self.current_player and not u.done
+                    and (unit is None or unit.moves_left == unit.max_moves))
+        if code in (ACT_MOVE, ACT_JUMP):
+            return (a, b) in (self.move_highlights if code == ACT_MOVE else self.attack_highlights)
+        if code == ACT_SHOOT:
+            return (unit is not None and unit.unit_type == "archer"
+                    and (a, b) in self.attack_highlights)
+        if code in (ACT_END, ACT_SURRENDER):
+            return True
+        # Остальное — действия выбранного юнита (как в legal_actions)
+        if unit is None:
+            return False
+        if code == ACT_SPELL:
+            return a < len(SPELL_RECIPES)
+        if code == ACT_CRAFT:
+            return a < len(WEAPON_RECIPES)
+        return True
+
+    def legal_actions(self):
+        """Все действия, которые сейчас выполнятся успешно (без сдачи).
+
+        Строже is_legal: учитывает артефакты, башни и руины, поэтому годится
+        для масок действий. Лучнику атака — только ACT_SHOOT, прыжок — только
+        пехоте и кавалерии (у лучника ACT_JUMP делает тот же выстрел).
+        """
+        if self.state == "game_over":
+            return []
+        player = self.current_player
+        unit = self.selected_unit
+        actions = []
+        if unit is None or unit.moves_left == unit.max_moves:
+            actions += [(ACT_SELECT, u.row, u.col) for u in self.board.player_units(player)
+                        if not u.done and u is not unit]
+        if unit is None:
+            actions.append((ACT_END, 0, 0))
+            return actions
+        actions += [(ACT_MOVE, r, c) for r, c in self.move_highlights]
+        if unit.unit_type == "archer":
+            actions += [(ACT_SHOOT, r, c) for r, c in self.attack_highlights]
+        else:
+            actions += [(ACT_JUMP, r, c) for r, c in self.jump_targets]
+        inv = self.inventory[player]
+        ready = inv.craftable()
+        if unit.moves_left > 0:
+            if self.board.is_in_ruins(unit.row, unit.col):
+                actions.append((ACT_DRAW, 0, 0))
+            mt = self.board.is_in_mage_tower(unit.row, unit.col)
+            if mt is not None and mt.occupant is unit:
+                actions += [(ACT_SPELL, i, 0) for i, s in enumerate(SPELL_RECIPES)
+                            if ready >> s["id"] & 1]
+        actions += [(ACT_CRAFT, i, 0) for i, w in enumerate(WEAPON_RECIPES)
+                    if ready >> w["id"] & 1
+                    and (w["target"] == "any" or w["target"] == unit.unit_type)]
+        if unit.moves_left == unit.max_moves:
+            actions.append((ACT_DESELECT, 0, 0))
+        actions += [(ACT_NEXT, 0, 0), (ACT_END, 0, 0)]
+        return actions
+
     def select_unit(self, r, c):
         unit = self.board.unit_at(r, c)
         if unit and unit.player == self.current_player and not unit.done:
+            if self.selected_unit is not None:
+                self.selected_unit.active = False   # смена выбора
             self.selected_unit = unit
             unit.active = True
             unit.moves_left = unit.max_moves
@@ -944,8 +2195,7 @@ class Game:
         cost = self.move_costs.get((r, c), 1)
         if unit.moves_left < cost:
             return False
-        unit.row = r
-        unit.col = c
+        self.board.move(unit, r, c)
         unit.moves_left -= cost
         mt = self.board.is_in_mage_tower(r, c)
         if mt:
@@ -956,6 +2206,12 @@ class Game:
             self.calc_moves(unit)
         return True
 
+    def _remove_dead(self, target):
+        """Убрать цель атаки, если погибла, вместе с её анимацией атаки."""
+        self.board.remove_dead((target,))
+        if not target.is_alive():
+            self.attack_anims.pop(target, None)
+
     def do_jump_attack(self, r, c):
         if (r, c) not in self.attack_highlights:
             return False
@@ -966,14 +2222,16 @@ class Game:
         cost = self.jump_costs.get((r, c), 1)
         if unit.moves_left < cost:
             return False
-        unit.row = r
-        unit.col = c
+        self.board.move(unit, r, c)
         unit.moves_left -= cost
+        self.attack_anims[unit] = self.anim_tick
+        self.effects.spawn("dust", r, c, self.anim_tick)
+        self.effects.spawn("explosion", target.row, target.col, self.anim_tick)
         dmg = unit.damage
         if self.fire_shield.get(target.player, False):
             dmg = max(0, dmg - 2)
         target.take_damage(dmg)
-        self.board.remove_dead()
+        self._remove_dead(target)
         self.check_win()
         if unit.moves_left <= 0:
             self.next_unit()
@@ -987,11 +2245,13 @@ class Game:
         if target is None or target.player == unit.player:
             return False
         unit.moves_left -= 1
+        self.attack_anims[unit] = self.anim_tick
+        self.effects.spawn("fire", r, c, self.anim_tick)
         dmg = unit.damage
         if self.fire_shield.get(target.player, False):
             dmg = max(0, dmg - 2)
         target.take_damage(dmg)
-        self.board.remove_dead()
+        self._remove_dead(target)
         self.check_win()
         if unit.moves_left <= 0:
             self.next_unit()
@@ -1025,13 +2285,16 @@ class Game:
 
         inv = self.inventory[unit.player]
         recipe_info = SPELL_RECIPES[spell_idx]
-        if not can_craft(inv, recipe_info["recipe"]):
+        if not inv.can_craft(recipe_info):
             self.show_popup("Не хватает артефактов!")
             return False
 
         result = mt.cast_spell(spell_idx, self.board.units, inv)
         if spell_idx == 2:
             self.fire_shield[unit.player] = True
+        kind = "fire" if spell_idx == 2 else "dust"
+        for u in self.board.player_units(unit.player):
+            self.effects.spawn(kind, u.row, u.col, self.anim_tick)
 
         unit.moves_left -= 1
         self.show_popup(result or "Заклинание применено")
@@ -1049,7 +2312,7 @@ class Game:
             return False
         inv = self.inventory[unit.player]
         w = WEAPON_RECIPES[weapon_idx]
-        if not can_craft(inv, w["recipe"]):
+        if not inv.can_craft(w):
             self.show_popup("Не хватает артефактов!")
             return False
         # Проверка целевого типа
@@ -1057,38 +2320,203 @@ class Game:
             self.show_popup("Только для лучника!")
             return False
 
-        spend_recipe(inv, w["recipe"])
+        inv.spend(w)
         if w["stat"] == "damage":
             unit.damage += w["value"]
         self.show_popup(f"{w['name']}: +{w['value']} урон")
         return True
 
     def check_win(self):
-        if len(self.board.player_units(1)) == 0:
+        if self.board.alive_count(1) == 0:
             self.winner = 2
             self.state = "game_over"
             self.message = "ПОБЕДА ИГРОКА 2!"
-        elif len(self.board.player_units(2)) == 0:
+        elif self.board.alive_count(2) == 0:
             self.winner = 1
             self.state = "game_over"
             self.message = "ПОБЕДА ИГРОКА 1!"
 
     def skip_unit(self):
         if self.selected_unit:
-            self.next_unit()
+            self.apply_action((ACT_NEXT, 0, 0))
+
+    def deselect_unit(self):
+        """Снять выбор с юнита, который ещё не ходил."""
+        unit = self.selected_unit
+        if unit is None or unit.moves_left != unit.max_moves:
+            return False
+        unit.active = False
+        self.selected_unit = None
+        self.move_highlights = []
+        self.attack_highlights = []
+        self.jump_targets = {}
+        self.move_costs = {}
+        self.jump_costs = {}
+        self.state = "select"
+        return True
+
+    def surrender(self):
+        self.winner = 2 if self.current_player == 1 else 1
+        self.state = "game_over"
+        self.message = f"Игрок {self.current_player} сдался!"
+
+    # -------------------- Симуляция --------------------
+
+    def play_out(self, max_turns=None):
+        """Доиграть партию без задержек, пока ходит ИИ (для ИИ против ИИ —
+        до конца или max_turns ходов). Возвращает число сыгранных ходов."""
+        turns = 0
+        player = self.current_player
+        while (self.state != "game_over" and self.is_ai_turn()
+               and (max_turns is None or turns < max_turns)):
+            self.apply_action(self.ai_players[player].next_action())
+            if self.current_player != player:
+                player = self.current_player
+                turns += 1
+        return turns
+
+    # -------------------- Сохранение --------------------
+
+    def save_state(self):
+        """Полное состояние партии в компактном бинарном виде."""
+        b = self.board
+        units = b.units
+        pos = {u: i for i, u in enumerate(units)}
+        flags = ((_FLAG_SHIELD1 if self.fire_shield[1] else 0)
+                 | (_FLAG_SHIELD2 if self.fire_shield[2] else 0)
+                 | (_FLAG_AI if 2 in self.ai_players else 0)
+                 | (_FLAG_AI1 if 1 in self.ai_players else 0))
+        parts = [_SAVE_HEAD.pack(
+            SAVE_MAGIC, SAVE_VERSION, b.rows, b.cols, self.current_player,
+            self.units_acted, self.max_units_per_turn, GAME_STATES.index(self.state),
+            self.winner or 0, flags, b.ruins.seed, b.ruins.draws,
+            pos.get(self.selected_unit, -1), len(units))]
+        for p in (1, 2):
+            inv = self.inventory[p]
+            parts.append(_SAVE_INV.pack(*[inv[name] for name in ARTIFACT_NAMES]))
+        pack = _SAVE_UNIT.pack
+        types = UNIT_TYPE_IDS
+        for u in units:
+            parts.append(pack(types[u.unit_type], u.player, u.row, u.col, u.hp,
+                              u.max_hp, u.damage, u.armor, u.max_armor, u.max_moves,
+                              u.moves_left,
+                              (_FLAG_DONE if u.done else 0) | (_FLAG_ACTIVE if u.active else 0)))
+        parts.append(struct.pack(f"<{len(b.mage_towers)}h",
+                                 *[pos.get(mt.occupant, -1) for mt in b.mage_towers]))
+        return b"".join(parts)
+
+    def checksum(self):
+        """CRC32 состояния для сверки копий партии по сети. Кто из игроков
+        ИИ, не учитывается: у каждого клиента свой «удалённый» соперник."""
+        data = bytearray(self.save_state())
+        data[_SAVE_FLAGS_AT] &= _FLAG_SHIELD1 | _FLAG_SHIELD2
+        return zlib.crc32(data)
+
+    def load_state(self, data):
+        """Восстановить партию из save_state(). Окно, спрайты и камера остаются."""
+        head, inventories, rows, towers = _read_save(data)
+        (_, _, n_rows, n_cols, player, acted, max_units, state, winner, flags,
+         seed, draws, selected, _) = head
+        units = []
+        for (t, up, r, c, hp, max_hp, dmg, armor, max_armor, max_moves,
+             moves_left, uf) in rows:
+            u = UNIT_CLASSES[UNIT_TYPES[t]](up, r, c)
+            u.hp, u.max_hp, u.damage = hp, max_hp, dmg
+            u.armor, u.max_armor = armor, max_armor
+            u.max_moves, u.moves_left = max_moves, moves_left
+            u.done, u.active = bool(uf & _FLAG_DONE), bool(uf & _FLAG_ACTIVE)
+            units.append(u)
+        board = Board(n_rows, n_cols, units=units, seed=seed)
+        board.ruins.restore(seed, draws)
+        for mt, i in zip(board.mage_towers, towers):
+            mt.occupant = units[i] if i >= 0 else None
+        if (board.rows, board.cols) != (self.board.rows, self.board.cols):
+            self.camera = Camera(board)
+            self._draw_cache = {}
+        else:
+            self.camera.board = board
+        self.board = board
+        self.seed = seed
+
+        self.inventory = {p: Inventory(sum(n << (INV_LANE * i) for i, n in enumerate(inv)))
+                          for p, inv in zip((1, 2), inventories)}
+        self.fire_shield = {1: bool(flags & _FLAG_SHIELD1), 2: bool(flags & _FLAG_SHIELD2)}
+        self.current_player = player
+        self.units_acted = acted
+        self.max_units_per_turn = max_units
+        self.state = GAME_STATES[state]
+        self.winner = winner or None
+        self.ai_players = {p: AIPlayer(self, p) for p in _ai_sides(flags)}
+        self.ai_mode = bool(self.ai_players)
+        self._ai_thinking = False
+
+        self.selected_unit = units[selected] if selected >= 0 else None
+        self.move_highlights = []
+        self.attack_highlights = []
+        self.jump_targets = {}
+        self.move_costs = {}
+        self.jump_costs = {}
+        self._moves_cache = None
+        if self.selected_unit is not None:
+            self.calc_moves(self.selected_unit)
+        self.preview_unit = None
+        self.attack_anims = {}
+        self.effects.count = 0
+        self.popup_text = None
+        self.popup_timer = 0
+        if self.state == "game_over":
+            self.check_win()
+        else:
+            self.update_message()
+            if self.is_ai_turn():
+                self.ai_players[self.current_player].start_turn()
+                self._ai_thinking = True
+
+    def quicksave(self, path=SAVE_PATH):
+        with open(path, "wb") as f:
+            f.write(self.save_state())
+        self.show_popup("Игра сохранена")
+
+    def quickload(self, path=SAVE_PATH):
+        try:
+            with open(path, "rb") as f:
+                self.load_state(f.read())
+        except FileNotFoundError:
+            self.show_popup("Нет сохранения")
+        except ValueError as e:
+            self.show_popup(f"Ошибка загрузки: {e}")
+        else:
+            self.replay = Replay(self.save_state())  # повтор продолжается с загрузки
+            self.show_popup("Игра загружена")
+
+    def save_replay(self, directory=REPLAY_DIR):
+        """Записать повтор партии в directory; возвращает путь или None."""
+        if self.replay is None or not len(self.replay):
+            return None
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, time.strftime("%Y%m%d-%H%M%S") + ".kcr")
+        self.replay.finish(self)
+        self.replay.save(path)
+        return path
+
+    def export_json(self):
+        """Состояние партии в читаемом JSON (для отладки)."""
+        return json.dumps(decode_save(self.save_state()), ensure_ascii=False, indent=1)
 
     # -------------------- Клики --------------------
 
     def handle_click(self, mx, my):
         if self.state == "game_over":
             return
-        if mx >= COLS * CELL_SIZE:
+        if mx >= BOARD_VIEW_W:
             self.handle_sidebar_click(mx, my)
             return
 
+        row, col = self.camera.to_cell(mx, my)
+        if not self.board.in_bounds(row, col):
+            return
+
         # Закрыть превью кликом вне юнита
-        col = mx // CELL_SIZE
-        row = my // CELL_SIZE
         clicked_unit = self.board.unit_at(row, col)
         if self.preview_unit is not None:
             if clicked_unit == self.preview_unit:
@@ -1102,36 +2530,27 @@ class Game:
             self.preview_unit = clicked_unit
 
         if self.state == "select":
-            self.select_unit(row, col)
+            self.apply_action((ACT_SELECT, row, col))
         elif self.state == "move":
             if (row, col) in self.attack_highlights:
                 if self.selected_unit.unit_type == "archer":
                     target = self.board.unit_at(row, col)
                     if target and target.player != self.selected_unit.player:
-                        self.do_archer_shoot(row, col)
+                        self.apply_action((ACT_SHOOT, row, col))
                     else:
-                        self.do_jump_attack(row, col)
+                        self.apply_action((ACT_JUMP, row, col))
                 else:
-                    self.do_jump_attack(row, col)
+                    self.apply_action((ACT_JUMP, row, col))
             elif (row, col) in self.move_highlights:
-                self.move_unit(row, col)
+                self.apply_action((ACT_MOVE, row, col))
             elif self.board.unit_at(row, col) and \
                  self.board.unit_at(row, col).player == self.current_player and \
                  not self.board.unit_at(row, col).done:
                 if self.selected_unit and \
                    self.selected_unit.moves_left == self.selected_unit.max_moves:
-                    self.selected_unit.active = False
-                    self.select_unit(row, col)
-            elif self.selected_unit and \
-                 self.selected_unit.moves_left == self.selected_unit.max_moves:
-                self.selected_unit.active = False
-                self.selected_unit = None
-                self.move_highlights = []
-                self.attack_highlights = []
-                self.jump_targets = {}
-                self.move_costs = {}
-                self.jump_costs = {}
-                self.state = "select"
+                    self.apply_action((ACT_SELECT, row, col))
+            else:
+                self.apply_action((ACT_DESELECT, 0, 0))
 
     def handle_sidebar_click(self, mx, my):
         for bx, by, bw, bh, action in getattr(self, '_sidebar_buttons', []):
@@ -1142,77 +2561,123 @@ class Game:
     # -------------------- РЕНДЕРИНГ --------------------
 
     def draw(self):
+        self.anim_tick += 1
         self.screen.fill(C_BG)
+        # Всё поле рисуется только в пределах окна камеры
+        self.screen.set_clip(pygame.Rect(0, 0, BOARD_VIEW_W, HEIGHT))
         self.draw_ground()
         self.draw_structures()
         self.draw_highlights()
         self.draw_units()
+        cam = self.camera
+        self.effects.draw(self.screen, self.anim_tick, cam.cs, -cam.x, -cam.y)
         self.draw_grid()
+        self.screen.set_clip(None)
         self.draw_sidebar()
         self.draw_unit_preview_popup()
         self.draw_popup()
         if self.state == "game_over":
             self.draw_game_over()
+        if self.banner:
+            self.draw_banner()
         pygame.display.flip()
 
+    def _cached_surface(self, what, cs):
+        """Вспомогательные Surface под размер клетки (создаются один раз)."""
+        key = (what, cs)
+        surf = self._draw_cache.get(key)
+        if surf is not None:
+            return surf
+        if what == "ground":
+            # Шахматка на всё окно + запас в 2 клетки для сдвига
+            cols = BOARD_VIEW_W // cs + 3
+            rows = HEIGHT // cs + 3
+            surf = pygame.Surface((cols * cs, rows * cs))
+            surf.fill(C_GROUND_A)
+            for r in range(rows):
+                for c in range(r % 2 == 0, cols, 2):
+                    surf.fill(C_GROUND_B, (c * cs, r * cs, cs, cs))
+        elif what == "ruins":
+            surf = pygame.Surface((CELL_SIZE * 2, CELL_SIZE * 2), pygame.SRCALPHA)
+            self._draw_ruins(surf, 0, 0)
+            if cs != CELL_SIZE:
+                surf = pygame.transform.smoothscale(surf, (cs * 2, cs * 2))
+        else:
+            color = {"sel": C_HIGHLIGHT_SEL, "move": C_HIGHLIGHT_MOVE,
+                     "attack": C_HIGHLIGHT_ATTACK, "done": (0, 0, 0, 60)}[what]
+            surf = pygame.Surface((cs, cs), pygame.SRCALPHA)
+            surf.fill(color)
+        self._draw_cache[key] = surf
+        return surf
+
     def draw_ground(self):
-        for r in range(ROWS):
-            for c in range(COLS):
-                x, y = c * CELL_SIZE, r * CELL_SIZE
-                tile = self.sprites.ground_tile_a if (r + c) % 2 == 0 else self.sprites.ground_tile_b
-                self.screen.blit(tile, (x, y))
+        cam = self.camera
+        cs = cam.cs
+        r0, r1, c0, c1 = cam.visible_cells()
+        x0, y0 = cam.to_screen(r0, c0)
+        x1, y1 = cam.to_screen(r1, c1)
+        # Одна готовая шахматка вместо блита каждой клетки; чётность —
+        # сдвигом на клетку влево
+        shift = (r0 + c0) % 2
+        clip = self.screen.get_clip()
+        self.screen.set_clip(clip.clip(pygame.Rect(x0, y0, x1 - x0, y1 - y0)))
+        self.screen.blit(self._cached_surface("ground", cs), (x0 - shift * cs, y0))
+        self.screen.set_clip(clip)
 
     def draw_structures(self):
-        c1 = self.board.castle1
-        cx, cy = c1.left_col * CELL_SIZE, c1.top_row * CELL_SIZE
-        img1 = self.sprites.castle_img.get(1)
-        if img1:
-            self.screen.blit(img1, (cx, cy))
-        else:
-            pygame.draw.rect(self.screen, C_P1,
-                             (cx, cy, 4 * CELL_SIZE, 4 * CELL_SIZE), 3)
-
-        c2 = self.board.castle2
-        cx2, cy2 = c2.left_col * CELL_SIZE, c2.top_row * CELL_SIZE
-        img2 = self.sprites.castle_img.get(2)
-        if img2:
-            self.screen.blit(img2, (cx2, cy2))
-        else:
-            pygame.draw.rect(self.screen, C_P2,
-                             (cx2, cy2, 4 * CELL_SIZE, 4 * CELL_SIZE), 3)
+        cam = self.camera
+        cs = cam.cs
+        for castle, color in ((self.board.castle1, C_P1), (self.board.castle2, C_P2)):
+            cx, cy = cam.to_screen(castle.top_row, castle.left_col)
+            if not cam.is_visible(cx, cy, 4 * cs, 4 * cs):
+                continue
+            if cs == CELL_SIZE:
+                img = self.sprites.castle_img.get(castle.player)
+            else:
+                img = self.sprites.get_building(f"castle/{castle.player}", 4 * cs)
+            if img:
+                self.screen.blit(img, (cx, cy))
+            else:
+                pygame.draw.rect(self.screen, color, (cx, cy, 4 * cs, 4 * cs), 3)
 
+        if cs == CELL_SIZE:
+            tower_img = self.sprites.tower_img
+        else:
+            tower_img = self.sprites.get_building("tower", cs)
         for mt in self.board.mage_towers:
-            tx, ty = mt.col * CELL_SIZE, mt.row * CELL_SIZE
-            if self.sprites.tower_img:
-                self.screen.blit(self.sprites.tower_img, (tx, ty))
+            tx, ty = cam.to_screen(mt.row, mt.col)
+            if not cam.is_visible(tx, ty, cs, cs):
+                continue
+            if tower_img:
+                self.screen.blit(tower_img, (tx, ty))
             else:
-                pygame.draw.rect(self.screen, C_TOWER,
-                                 (tx, ty, CELL_SIZE, CELL_SIZE))
+                pygame.draw.rect(self.screen, C_TOWER, (tx, ty, cs, cs))
                 t = self.font.render("M", True, C_WHITE)
-                self.screen.blit(t, (tx + 16, ty + 16))
+                self.screen.blit(t, (tx + cs // 3, ty + cs // 3))
 
         ruins = self.board.ruins
-        rx, ry = ruins.left_col * CELL_SIZE, ruins.top_row * CELL_SIZE
-        self._draw_ruins(rx, ry)
+        rx, ry = cam.to_screen(ruins.top_row, ruins.left_col)
+        if cam.is_visible(rx, ry, 2 * cs, 2 * cs):
+            self.screen.blit(self._cached_surface("ruins", cs), (rx, ry))
 
-    def _draw_ruins(self, rx, ry):
+    def _draw_ruins(self, surf, rx, ry):
         """Рисует руины программно: разрушенные стены, обломки, мох."""
         cs = CELL_SIZE
         w, h = cs * 2, cs * 2
         # Тёмная каменная основа
-        pygame.draw.rect(self.screen, (62, 57, 47), (rx, ry, w, h))
+        pygame.draw.rect(surf, (62, 57, 47), (rx, ry, w, h))
         # Левый сломанный столб
-        pygame.draw.rect(self.screen, (105, 95, 80), (rx + 4, ry + 6, 10, h - 14))
-        pygame.draw.polygon(self.screen, (80, 72, 60), [
+        pygame.draw.rect(surf, (105, 95, 80), (rx + 4, ry + 6, 10, h - 14))
+        pygame.draw.polygon(surf, (80, 72, 60), [
             (rx + 4, ry + 6), (rx + 14, ry + 6),
             (rx + 11, ry + 1), (rx + 7, ry + 3)])
         # Правый сломанный столб (короче)
-        pygame.draw.rect(self.screen, (105, 95, 80), (rx + 22, ry + 14, 9, h - 22))
-        pygame.draw.polygon(self.screen, (80, 72, 60), [
+        pygame.draw.rect(surf, (105, 95, 80), (rx + 22, ry + 14, 9, h - 22))
+        pygame.draw.polygon(surf, (80, 72, 60), [
             (rx + 22, ry + 14), (rx + 31, ry + 14),
             (rx + 28, ry + 10), (rx + 25, ry + 12)])
         # Частичная стена (горизонтальный сегмент)
-        pygame.draw.rect(self.screen, (95, 87, 72), (rx + 4, ry + cs - 4, cs - 8, 6))
+        pygame.draw.rect(surf, (95, 87, 72), (rx + 4, ry + cs - 4, cs - 8, 6))
         # Обломки и камни (случайные, но фиксированные позиции)
         rubble = [
             (rx + 18, ry + cs + 8,  14, 6),
@@ -1224,54 +2689,89 @@ class Game:
             (rx + cs - 4, ry + cs + 18, 12, 5),
         ]
         for bx, by, bw, bh in rubble:
-            pygame.draw.ellipse(self.screen, (92, 84, 68), (bx, by, bw, bh))
-            pygame.draw.ellipse(self.screen, (68, 62, 52), (bx + 1, by + 1, bw - 2, bh - 2), 1)
+            pygame.draw.ellipse(surf, (92, 84, 68), (bx, by, bw, bh))
+            pygame.draw.ellipse(surf, (68, 62, 52), (bx + 1, by + 1, bw - 2, bh - 2), 1)
         # Мох
         moss = [(rx + 16, ry + cs + 16, 8, 4),
                 (rx + cs + 10, ry + cs + 8, 10, 4)]
         for mx_, my_, mw, mh in moss:
-            pygame.draw.ellipse(self.screen, (55, 88, 42), (mx_, my_, mw, mh))
+            pygame.draw.ellipse(surf, (55, 88, 42), (mx_, my_, mw, mh))
         # Подпись
         t = self.font_small.render("Руины", True, (160, 150, 120))
-        self.screen.blit(t, (rx + 4, ry + h - 14))
+        surf.blit(t, (rx + 4, ry + h - 14))
 
     def draw_highlights(self):
+        cam = self.camera
+        cs = cam.cs
+        for r, c, what in self.marks:
+            x, y = cam.to_screen(r, c)
+            if cam.is_visible(x, y, cs, cs):
+                self.screen.blit(self._cached_surface(what, cs), (x, y))
         if self.state != "move":
             return
         if self.selected_unit:
-            sx = self.selected_unit.col * CELL_SIZE
-            sy = self.selected_unit.row * CELL_SIZE
-            s = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA)
-            s.fill(C_HIGHLIGHT_SEL)
-            self.screen.blit(s, (sx, sy))
-        for (r, c) in self.move_highlights:
-            x, y = c * CELL_SIZE, r * CELL_SIZE
-            s = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA)
-            s.fill(C_HIGHLIGHT_MOVE)
-            self.screen.blit(s, (x, y))
-        for (r, c) in self.attack_highlights:
-            x, y = c * CELL_SIZE, r * CELL_SIZE
-            s = pygame.Surface((CELL_SIZE, CELL_SIZE), pygame.SRCALPHA)
-            s.fill(C_HIGHLIGHT_ATTACK)
-            self.screen.blit(s, (x, y))
+            self.screen.blit(self._cached_surface("sel", cs),
+                             cam.to_screen(self.selected_unit.row, self.selected_unit.col))
+        for cells, what in ((self.move_highlights, "move"),
+                            (self.attack_highlights, "attack")):
+            s = self._cached_surface(what, cs)
+            for (r, c) in cells:
+                x, y = cam.to_screen(r, c)
+                if cam.is_visible(x, y, cs, cs):
+                    self.screen.blit(s, (x, y))
+
+    def _unit_atlas(self, u, size):
+        """Атлас и тик текущей анимации юнита (атака, затем снова покой)."""
+        tick = self.anim_tick
+        start = self.attack_anims.get(u)
+        if start is not None:
+            atlas = self.sprites.get_atlas(u.player, u.unit_type, "attack", size)
+            if atlas and tick - start < atlas.duration():
+                return atlas, tick - start
+            del self.attack_anims[u]
+        return self.sprites.get_atlas(u.player, u.unit_type, "idle", size), tick
+
+    def _visible_units(self):
+        """Юниты в окне камеры: перебор видимых клеток или юнитов — что меньше."""
+        r0, r1, c0, c1 = self.camera.visible_cells()
+        units = self.board.units
+        if len(units) <= (r1 - r0) * (c1 - c0):
+            return [u for u in units
+                    if r0 <= u.row < r1 and c0 <= u.col < c1 and u.is_alive()]
+        cells = self.board.cells
+        found = []
+        for r in range(r0, r1):
+            for c in range(c0, c1):
+                u = cells.get((r, c))
+                if u is not None and u.is_alive():
+                    found.append(u)
+        return found
 
     def draw_units(self):
-        cs = CELL_SIZE
-        for u in self.board.units:
-            if not u.is_alive():
+        cam = self.camera
+        cs = cam.cs
+        large = int(cs * 1.8)
+        sprites_on = cs >= SPRITE_MIN_CELL
+        done_shade = self._cached_surface("done", cs)
+        for u in self._visible_units():
+            x, y = cam.to_screen(u.row, u.col)
+            if not sprites_on:
+                # Мелкий масштаб: без спрайтов и полосок, только цвет игрока
+                color = C_P1 if u.player == 1 else C_P2
+                self.screen.fill(color, (x + 1, y + 1, cs - 2, cs - 2))
+                if u.active:
+                    pygame.draw.rect(self.screen, C_GOLD, (x, y, cs, cs), 1)
                 continue
-            x = u.col * cs
-            y = u.row * cs
-            sprite = self.sprites.get_unit(u.player, u.unit_type)
+            size = large if u.unit_type == "cavalry" else cs
+            atlas, tick = self._unit_atlas(u, size)
 
             if u.unit_type == "cavalry":
                 # Кавалерия — крупный спрайт, центрирован на клетке
-                large = self.sprites.cavalry_size
                 off = (large - cs) // 2
                 draw_x = x - off
                 draw_y = y - off
-                if sprite:
-                    self.screen.blit(sprite, (draw_x, draw_y))
+                if atlas:
+                    self.screen.blit(atlas.surface, (draw_x, draw_y), atlas.frame(tick))
                 else:
                     color = C_P1 if u.player == 1 else C_P2
                     pygame.draw.rect(self.screen, color,
@@ -1282,14 +2782,14 @@ class Game:
                 border_col = (200, 160, 50) if u.player == 1 else (200, 80, 50)
                 pygame.draw.rect(self.screen, border_col, (x, y, cs, cs), 2)
             else:
-                if sprite:
-                    self.screen.blit(sprite, (x, y))
+                if atlas:
+                    self.screen.blit(atlas.surface, (x, y), atlas.frame(tick))
                 else:
                     color = C_P1 if u.player == 1 else C_P2
                     pygame.draw.rect(self.screen, color,
                                      (x + 4, y + 4, cs - 8, cs - 8))
                     t = self.font.render(u.unit_type[0].upper(), True, C_WHITE)
-                    self.screen.blit(t, (x + 16, y + 14))
+                    self.screen.blit(t, (x + cs // 3, y + cs // 3))
 
             # HP/Armor бары
             bw = cs - 4
@@ -1307,20 +2807,23 @@ class Game:
             if u.active:
                 pygame.draw.rect(self.screen, C_GOLD, (x, y, cs, cs), 2)
             if u.done:
-                s = pygame.Surface((cs, cs), pygame.SRCALPHA)
-                s.fill((0, 0, 0, 60))
-                self.screen.blit(s, (x, y))
+                self.screen.blit(done_shade, (x, y))
 
     def draw_grid(self):
-        for r in range(ROWS + 1):
-            pygame.draw.line(self.screen, C_GRID,
-                             (0, r * CELL_SIZE), (COLS * CELL_SIZE, r * CELL_SIZE))
-        for c in range(COLS + 1):
-            pygame.draw.line(self.screen, C_GRID,
-                             (c * CELL_SIZE, 0), (c * CELL_SIZE, ROWS * CELL_SIZE))
+        cam = self.camera
+        cs = cam.cs
+        r0, r1, c0, c1 = cam.visible_cells()
+        x0, y0 = cam.to_screen(r0, c0)
+        x1, y1 = cam.to_screen(r1, c1)
+        for r in range(r0, r1 + 1):
+            y = y0 + (r - r0) * cs
+            pygame.draw.line(self.screen, C_GRID, (x0, y), (x1, y))
+        for c in range(c0, c1 + 1):
+            x = x0 + (c - c0) * cs
+            pygame.draw.line(self.screen, C_GRID, (x, y0), (x, y1))
 
     def draw_sidebar(self):
-        sx = COLS * CELL_SIZE
+        sx = BOARD_VIEW_W
         pygame.draw.rect(self.screen, C_SIDEBAR, (sx, 0, SIDEBAR_WIDTH, HEIGHT))
         pygame.draw.line(self.screen, C_GRID, (sx, 0), (sx, HEIGHT), 2)
 
@@ -1341,8 +2844,8 @@ class Game:
         y += 18
 
         # === Счёт ===
-        p1c = len(self.board.player_units(1))
-        p2c = len(self.board.player_units(2))
+        p1c = self.board.alive_count(1)
+        p2c = self.board.alive_count(2)
         t = self.font.render(f"P1: {p1c} | P2: {p2c}", True, C_TEXT)
         self.screen.blit(t, (pad, y))
         y += 18
@@ -1402,7 +2905,7 @@ class Game:
                 t = self.font.render("Тянуть артефакт (1 ход)", True, C_GOLD)
                 self.screen.blit(t, (pad + 8, y + 7))
                 self._sidebar_buttons.append(
-                    (pad, y, w, btn_h, self.try_draw_card))
+                    (pad, y, w, btn_h, lambda: self.apply_action((ACT_DRAW, 0, 0))))
                 y += btn_h + 5
 
             # === Заклинания (башня мага) ===
@@ -1412,7 +2915,7 @@ class Game:
                 self.screen.blit(t, (pad, y))
                 y += 20
                 for i, sp in enumerate(SPELL_RECIPES):
-                    craftable = can_craft(inv, sp["recipe"])
+                    craftable = inv.can_craft(sp)
                     btn_h = 42
                     bg = (50, 30, 80) if craftable else (40, 30, 40)
                     border = (150, 100, 255) if craftable else C_LOCKED
@@ -1436,7 +2939,7 @@ class Game:
                         idx = i
                         self._sidebar_buttons.append(
                             (pad, y, w, btn_h,
-                             lambda ii=idx: self.try_cast_spell(ii)))
+                             lambda ii=idx: self.apply_action((ACT_SPELL, ii, 0))))
                     y += btn_h + 3
 
             # === Крафт оружия ===
@@ -1444,7 +2947,7 @@ class Game:
             self.screen.blit(t, (pad, y))
             y += 20
             for i, wp in enumerate(WEAPON_RECIPES):
-                craftable = can_craft(inv, wp["recipe"])
+                craftable = inv.can_craft(wp)
                 # Проверка типа юнита
                 type_ok = (wp["target"] == "any" or
                            wp["target"] == u.unit_type)
@@ -1474,7 +2977,7 @@ class Game:
                     idx = i
                     self._sidebar_buttons.append(
                         (pad, y, w, btn_h,
-                         lambda ii=idx: self.try_craft_weapon(ii)))
+                         lambda ii=idx: self.apply_action((ACT_CRAFT, ii, 0))))
                 y += btn_h + 3
 
         y += 10
@@ -1501,13 +3004,8 @@ class Game:
         t = self.font.render("Сдаться", True, (200, 50, 50))
         self.screen.blit(t, (pad + w // 2 - 25, btn_y2 + 7))
 
-        def do_surrender():
-            self.winner = 2 if self.current_player == 1 else 1
-            self.state = "game_over"
-            self.message = f"Игрок {self.current_player} сдался!"
-
         self._sidebar_buttons.append(
-            (pad, btn_y2, w, bh, do_surrender))
+            (pad, btn_y2, w, bh, lambda: self.apply_action((ACT_SURRENDER, 0, 0))))
 
     def draw_unit_preview_popup(self):
         """Увеличенный спрайт фигурки при клике на неё."""
@@ -1517,39 +3015,27 @@ class Game:
         cs = CELL_SIZE
         ps = cs * 4  # размер превью-спрайта
         pw, ph = ps + 20, ps + 90
-        board_w = COLS * cs
+        board_w = BOARD_VIEW_W
         px = (board_w - pw) // 2
         py = (HEIGHT - ph) // 2
 
-        # Фон
-        bg = pygame.Surface((pw, ph), pygame.SRCALPHA)
-        bg.fill((15, 12, 8, 220))
-        self.screen.blit(bg, (px, py))
+        # Фон (полупрозрачная подложка создаётся один раз)
+        if self._preview_bg is None or self._preview_bg.get_size() != (pw, ph):
+            self._preview_bg = pygame.Surface((pw, ph), pygame.SRCALPHA)
+            self._preview_bg.fill((15, 12, 8, 220))
+        self.screen.blit(self._preview_bg, (px, py))
 
         # Рамка в цвете игрока
         border_col = C_P1 if u.player == 1 else C_P2
         pygame.draw.rect(self.screen, border_col, (px, py, pw, ph), 3, border_radius=8)
 
-        # Большой спрайт
-        raw_sprite = None
-        if u.unit_type == "cavalry":
-            l_sheet_path = f"Units/{'Blue' if u.player == 1 else 'Red'} Units/Lancer/Lancer_Idle.png"
-            raw_sheet = load_sprite(l_sheet_path)
-            if raw_sheet:
-                raw_sprite = extract_frame(raw_sheet, 0, 320, 320, (ps, ps))
-        else:
-            key_map = {"knight": "Warrior/Warrior_Idle.png",
-                       "archer": "Archer/Archer_Idle.png"}
-            color = "Blue" if u.player == 1 else "Red"
-            path = f"Units/{color} Units/{key_map.get(u.unit_type, 'Warrior/Warrior_Idle.png')}"
-            raw_sheet = load_sprite(path)
-            if raw_sheet:
-                raw_sprite = extract_frame(raw_sheet, 0, 192, 192, (ps, ps))
+        # Большой анимированный спрайт (атлас из кэша SpriteManager)
+        atlas = self.sprites.get_atlas(u.player, u.unit_type, "idle", ps)
 
         sp_x = px + 10
         sp_y = py + 5
-        if raw_sprite:
-            self.screen.blit(raw_sprite, (sp_x, sp_y))
+        if atlas:
+            self.screen.blit(atlas.surface, (sp_x, sp_y), atlas.frame(self.anim_tick))
         else:
             color = C_P1 if u.player == 1 else C_P2
             pygame.draw.rect(self.screen, color, (sp_x, sp_y, ps, ps), border_radius=6)
@@ -1576,7 +3062,7 @@ class Game:
         if self.popup_text and self.popup_timer > 0:
             self.popup_timer -= 1
             pw, ph = 320, 50
-            px = (COLS * CELL_SIZE - pw) // 2
+            px = (BOARD_VIEW_W - pw) // 2
             py = (HEIGHT - ph) // 2
             s = pygame.Surface((pw, ph), pygame.SRCALPHA)
             s.fill((0, 0, 0, 190))
@@ -1588,6 +3074,13 @@ class Game:
             if self.popup_timer <= 0:
                 self.popup_text = None
 
+    def draw_banner(self):
+        t = self.font_big.render(self.banner, True, C_GOLD)
+        bg = pygame.Surface((t.get_width() + 16, t.get_height() + 8), pygame.SRCALPHA)
+        bg.fill((0, 0, 0, 170))
+        self.screen.blit(bg, (4, 4))
+        self.screen.blit(t, (12, 8))
+
     def draw_game_over(self):
         overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
         overlay.fill((0, 0, 0, 150))
@@ -1600,39 +3093,78 @@ class Game:
 
     # -------------------- ГЛАВНЫЙ ЦИКЛ --------------------
 
+    def poll(self):
+        """Вызывается каждый кадр перед шагом ИИ; сетевой клиент здесь
+        принимает сообщения сервера."""
+
     def run_once(self):
         """Запустить один матч. Возвращает управление после конца игры или ESC."""
         running = True
         while running:
-            self.clock.tick(FPS)
+            speed = AI_SPEEDS[self.ai_speed]
+            uncapped = speed is None and self.is_ai_turn() and self.state != "game_over"
+            # Без ограничения скорости кадры не ждут таймера
+            self.clock.tick(0 if uncapped else FPS)
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    self.save_replay()
                     pygame.quit()
                     sys.exit()
                 elif event.type == pygame.MOUSEBUTTONDOWN:
+                    # Камера: колёсико — зум, средняя кнопка — перетаскивание
+                    if event.button in (4, 5) and event.pos[0] < BOARD_VIEW_W:
+                        self.camera.zoom(1 if event.button == 4 else -1, *event.pos)
+                    elif event.button == 2:
+                        self._drag = True
                     # Во время хода AI не принимаем клики на доску
-                    if self.ai_mode and self.current_player == 2:
+                    elif self.is_ai_turn():
                         pass
                     elif event.button == 1:
                         self.handle_click(*event.pos)
                     elif event.button == 3:
                         if self.selected_unit:
-                            self.next_unit()
+                            self.apply_action((ACT_NEXT, 0, 0))
+                elif event.type == pygame.MOUSEBUTTONUP and event.button == 2:
+                    self._drag = False
+                elif event.type == pygame.MOUSEMOTION and self._drag:
+                    self.camera.scroll(-event.rel[0], -event.rel[1])
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_ESCAPE:
                         running = False   # возврат в меню
+                    elif event.key in (pygame.K_EQUALS, pygame.K_PLUS, pygame.K_KP_PLUS):
+                        self.camera.zoom(1)
+                    elif event.key in (pygame.K_MINUS, pygame.K_KP_MINUS):
+                        self.camera.zoom(-1)
+                    elif event.key == pygame.K_c and self.selected_unit:
+                        self.camera.center_on(self.selected_unit.row, self.selected_unit.col)
                     elif event.key == pygame.K_r and self.state == "game_over":
                         running = False   # перезапуск через меню
                     elif event.key == pygame.K_SPACE:
-                        if not (self.ai_mode and self.current_player == 2):
+                        if not self.is_ai_turn():
                             self.skip_unit()
-
+                    elif event.key in (pygame.K_1, pygame.K_2, pygame.K_3) and self.ai_mode:
+                        self.set_ai_speed(event.key - pygame.K_1)
+                    elif event.key == pygame.K_F5:
+                        self.quicksave()
+                    elif event.key == pygame.K_F9:
+                        self.quickload()
+
+            # Прокрутка камеры стрелками / WASD
+            keys = pygame.key.get_pressed()
+            dx = (keys[pygame.K_RIGHT] or keys[pygame.K_d]) - (keys[pygame.K_LEFT] or keys[pygame.K_a])
+            dy = (keys[pygame.K_DOWN] or keys[pygame.K_s]) - (keys[pygame.K_UP] or keys[pygame.K_w])
+            if dx or dy:
+                self.camera.scroll(dx * CAMERA_SCROLL_SPEED, dy * CAMERA_SCROLL_SPEED)
+
+            self.poll()
             # Шаг AI (если его ход)
-            if (self.ai_mode and self.current_player == 2
-                    and self.ai_player and self.state != "game_over"):
-                self.ai_player.step()
+            if self.is_ai_turn() and self.state != "game_over":
+                self.ai_players[self.current_player].step(speed)
 
-            self.draw()
+            self._frame += 1
+            if not uncapped or self._frame % AI_RENDER_EVERY == 0:
+                self.draw()
+        self.save_replay()
 
     # Оставляем run() для совместимости
     def run(self):
@@ -1641,14 +3173,101 @@ class Game:
         sys.exit()
 
 
+# ========================== ПРОСМОТР ПОВТОРА ==========================
+
+class ReplayViewer:
+    """Перемотка повтора: ←/→ — по действию, PgUp/PgDn — по ходу,
+    Home/End — в начало/конец, ESC — выход."""
+
+    def __init__(self, game, replay):
+        self.game = game
+        self.replay = replay
+        self.game.replay = None  # просмотр ничего не записывает
+        self.pos = 0
+        replay.seek(game, 0)
+
+    def goto(self, i):
+        i = max(0, min(i, len(self.replay)))
+        if i == self.pos + 1:
+            self.game.apply_action(self.replay.action(self.pos), record=False)
+        elif i != self.pos:
+            self.replay.seek(self.game, i)
+        self.pos = i
+
+    def _turn_step(self, step):
+        turn = self.replay.turn_of(self.pos) + step
+        starts = self.replay.turn_starts
+        if turn < 0:
+            self.goto(0)
+        elif turn >= len(starts):
+            self.goto(len(self.replay))
+        else:
+            self.goto(starts[turn])
+
+    def run(self):
+        g = self.game
+        keys = {pygame.K_RIGHT: lambda: self.goto(self.pos + 1),
+                pygame.K_LEFT: lambda: self.goto(self.pos - 1),
+                pygame.K_PAGEDOWN: lambda: self._turn_step(1),
+                pygame.K_PAGEUP: lambda: self._turn_step(-1),
+                pygame.K_HOME: lambda: self.goto(0),
+                pygame.K_END: lambda: self.goto(len(self.replay))}
+        while True:
+            g.clock.tick(FPS)
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    pygame.quit()
+                    sys.exit()
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == pygame.K_ESCAPE:
+                        return
+                    if event.key in keys:
+                        keys[event.key]()
+                elif event.type == pygame.MOUSEBUTTONDOWN and event.button in (4, 5):
+                    g.camera.zoom(1 if event.button == 4 else -1, *event.pos)
+            g.banner = (f"Повтор: действие {self.pos}/{len(self.replay)}, "
+                        f"ход {self.replay.turn_of(self.pos) + 1}/{len(self.replay.turn_starts)}")
+            g.draw()
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Рыцари и Замки")
+    parser.add_argument("--build-cache", action="store_true",
+                        help="пересобрать кэш ассетов (.asset_cache) и выйти")
+    parser.add_argument("--rows", type=int, default=ROWS,
+                        help=f"строк на поле (не меньше {MIN_ROWS}, по умолчанию {ROWS})")
+    parser.add_argument("--cols", type=int, default=COLS,
+                        help=f"колонок на поле (не меньше {MIN_COLS}, по умолчанию {COLS})")
+    parser.add_argument("--seed", type=int,
+                        help="зерно партии (одинаковое зерно и ходы — одинаковая партия)")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="открыть повтор партии (replays/*.kcr)")
+    parser.add_argument("--dump-save", metavar="FILE",
+                        help="вывести сохранение в JSON и выйти")
+    args = parser.parse_args()
+    if args.dump_save:
+        with open(args.dump_save, "rb") as f:
+            print(json.dumps(decode_save(f.read()), ensure_ascii=False, indent=1))
+        sys.exit()
+    if args.rows < MIN_ROWS or args.cols < MIN_COLS:
+        parser.error(f"поле должно быть не меньше {MIN_ROWS}x{MIN_COLS}")
+    if args.build_cache:
+        print(build_asset_cache())
+        sys.exit()
+
     screen = pygame.display.set_mode((WIDTH, HEIGHT))
     pygame.display.set_caption("Рыцари и Замки")
     clock = pygame.time.Clock()
+    load_assets(screen, clock)
+    if args.replay:
+        ReplayViewer(Game(screen=screen, clock=clock), Replay.load(args.replay)).run()
+        pygame.quit()
+        sys.exit()
 
     while True:
         menu = MenuScreen(screen, clock)
         mode = menu.run()
-        ai_mode = (mode == "ai")
-        game = Game(ai_mode=ai_mode, screen=screen, clock=clock)
+        ai_sides = {"2p": (), "ai": (2,), "aivai": (1, 2)}[mode]
+        game = Game(screen=screen, clock=clock, rows=args.rows, cols=args.cols,
+                    seed=args.seed, ai_sides=ai_sides)
         game.run_once()       # играем один матч — по ESC/R возвращаемся в меню
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""Perft: число позиций на глубине D действий от начальной или сохранённой.
+
+Обходит все продолжения Game.legal_actions() на depth действий вперёд
+(действие — одна запись повтора: выбор, шаг, прыжок, ход руин и т. д.)
+и считает листья по виду последнего действия. На последнем уровне
+действия не применяются, а только считаются. Колода руин задаётся
+зерном партии, так что одно зерно — одно и то же дерево.
+
+Это эталон для быстрого генератора ходов: числа должны совпасть
+с нынешней семантикой calc_moves. --verify на каждом узле до глубины
+проверяет генератор перебором всех действий пространства rl_env.
+
+    python perft.py --depth 4 --seed 0
+    python perft.py quicksave.kcs --depth 3 --divide
+    python perft.py --depth 3 --expect 1865
+"""
+
+import argparse
+import sys
+import time
+from collections import Counter
+
+import knights_and_castles as kc
+from analysis import describe, load_position, strip_ai
+
+SEED = 0
+
+
+def perft(game, depth, counts, divide=None):
+    """Листьев на глубине depth из позиции game; counts — по кодам
+    действий листьев. divide — {действие: листьев} для корня.
+    Глубина 0 — сама позиция: один лист без действия."""
+    if depth == 0:
+        return 1
+    actions = game.legal_actions()
+    if depth == 1:
+        for code, _, _ in actions:
+            counts[code] += 1
+        if divide is not None:
+            divide.update({a: 1 for a in actions})
+        return len(actions)
+    state = game.save_state()
+    total = 0
+    for i, action in enumerate(actions):
+        if i:
+            game.load_state(state)
+        game.apply_action(action, record=False)
+        n = perft(game, depth - 1, counts)
+        if divide is not None:
+            divide[action] = n
+        total += n
+    game.load_state(state)
+    return total
+
+
+def _accepted(game, state, action):
+    """Выполнится ли действие из позиции state (у обработчиков)."""
+    game.load_state(state)
+    if action[0] != kc.ACT_SURRENDER and not game.is_legal(action):
+        return False
+    return game.apply_action(action, record=False) is not False
+
+
+def verify(game, depth, table, errors):
+    """Сверить legal_actions с перебором table на всех узлах до depth.
+
+    Ошибка — действие из списка, которое не выполняется, или выполнимое
+    действие, которого в списке нет. Намеренно не перечисляются: сдача,
+    повторный выбор уже выбранного юнита и прыжок лучника (это тот же
+    выстрел).
+    """
+    state = game.save_state()
+    actions = game.legal_actions()
+    listed = set(actions)
+    unit = game.selected_unit
+    for action in table:
+        code = action[0]
+        if action not in listed:
+            if code == kc.ACT_SURRENDER:
+                continue
+            if unit is not None and (
+                    (code == kc.ACT_SELECT and action[1:] == (unit.row, unit.col))
+                    or (code == kc.ACT_JUMP and unit.unit_type == "archer")):
+                continue
+        ok = _accepted(game, state, action)
+        if ok != (action in listed):
+            errors.append((state, action, "не выполняется" if ok is False else "пропущено"))
+    if depth > 1:
+        for action in actions:
+            game.load_state(state)
+            game.apply_action(action, record=False)
+            verify(game, depth - 1, table, errors)
+    game.load_state(state)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft для генератора действий")
+    parser.add_argument("path", nargs="?", help="сохранение (.kcs) или повтор (.kcr)")
+    parser.add_argument("--at", type=int, metavar="N", help="позиция повтора после N действий")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=SEED, help="зерно начальной позиции")
+    parser.add_argument("--rows", type=int, default=kc.ROWS)
+    parser.add_argument("--cols", type=int, default=kc.COLS)
+    parser.add_argument("--divide", action="store_true", help="листья по каждому первому действию")
+    parser.add_argument("--verify", type=int, metavar="D",
+                        help="сверить генератор с перебором всех действий до глубины D")
+    parser.add_argument("--expect", type=int, metavar="N",
+                        help="ожидаемое число листьев; иначе код выхода 1")
+    args = parser.parse_args(argv)
+    if args.depth < 0:
+        parser.error("--depth не может быть меньше 0")
+
+    if args.path:
+        try:
+            state = load_position(args.path, args.at)
+        except (OSError, ValueError) as e:
+            sys.exit(f"{args.path}: {e}")
+    else:
+        state = kc.Game(rows=args.rows, cols=args.cols, seed=args.seed,
+                        headless=True).save_state()
+    game = kc.Game(headless=True)
+    game.replay = None
+    game.load_state(strip_ai(state))
+
+    if args.verify:
+        import rl_env
+        table = rl_env.action_table(game.board.rows, game.board.cols)
+        table.append((kc.ACT_SURRENDER, 0, 0))
+        errors = []
+        t = time.perf_counter()
+        verify(game, args.verify, table, errors)
+        for _, action, what in errors[:20]:
+            print(f"ошибка: {describe(action)} — {what}")
+        print(f"проверка до глубины {args.verify}: ошибок {len(errors)} "
+              f"({time.perf_counter() - t:.1f} с)")
+        if errors:
+            sys.exit(1)
+
+    counts = Counter()
+    divide = {} if args.divide else None
+    t = time.perf_counter()
+    leaves = perft(game, args.depth, counts, divide)
+    elapsed = time.perf_counter() - t
+    if divide:
+        for action, n in divide.items():
+            print(f"{describe(action):<28} {n}")
+    print(f"глубина {args.depth}: {leaves} позиций за {elapsed:.2f} с "
+          f"({leaves / max(elapsed, 1e-9):.0f} позиций/с)")
+    for code, n in sorted(counts.items()):
+        print(f"  {kc.ACTION_NAMES[code]:<9} {n}")
+    if args.expect is not None and leaves != args.expect:
+        sys.exit(f"ожидалось {args.expect}, получено {leaves}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Сетевой протокол: типы сообщений и кадры.
+
+Кадр: длина тела (<H), затем тело; первый байт тела — тип сообщения.
+Действие передаётся как ACTION_RECORD (<BHH) — 5 байт, с заголовком 8.
+
+Синхронизация — lockstep: клиенты строят партию из зерна (MSG_START) и
+применяют одни и те же действия. Раз в CHECK_EVERY действий сервер шлёт
+CRC32 своего состояния; клиент, у которого сумма не сошлась, просит
+MSG_STATE. Пока сервер ждёт MSG_SYNCED, действия этого клиента
+отбрасываются: они сделаны на разошедшемся состоянии.
+"""
+
+import struct
+
+PORT = 7777
+
+MSG_JOIN = 1     # клиент: код партии <I (0 — любой свободный соперник)
+MSG_START = 2    # сервер: id партии, ваш игрок, rows, cols, зерно
+MSG_ACTION = 3   # обе стороны: действие ACTION_RECORD
+MSG_REJECT = 4   # сервер: отклонённое действие; следом MSG_STATE
+MSG_STATE = 5    # сервер: число действий <I + zlib(save_state())
+MSG_END = 6      # сервер: победитель <B (0 — нет)
+MSG_CHECK = 7    # сервер: число действий, CRC32 состояния после них
+MSG_DESYNC = 8   # клиент: сумма не сошлась на <I действий — нужен MSG_STATE
+MSG_SYNCED = 9   # клиент: MSG_STATE применён
+MSG_WATCH = 10   # зритель: id партии <I (0 — любая идущая)
+MSG_SNAPSHOT = 11  # сервер зрителю: id партии <I + spectate.snapshot()
+MSG_DELTA = 12   # сервер зрителю: изменения после действия (spectate.DeltaEncoder)
+
+CHECK_EVERY = 32  # сверка состояния раз в столько принятых действий
+
+FRAME_HEAD = struct.Struct("<HB")   # длина тела, тип
+JOIN = struct.Struct("<I")
+START = struct.Struct("<IBHHQ")
+END = struct.Struct("<B")
+STATE = struct.Struct("<I")
+CHECK = struct.Struct("<II")
+DESYNC = struct.Struct("<I")
+WATCH = struct.Struct("<I")
+
+
+def frame(msg, payload=b""):
+    """Кадр сообщения msg с телом payload."""
+    if len(payload) >= 0xFFFF:
+        raise ValueError(f"слишком большое сообщение: {len(payload)} байт")
+    return FRAME_HEAD.pack(len(payload) + 1, msg) + payload
+
+
+def split_frames(buf):
+    """Вынуть из bytearray все целые кадры: [(тип, тело), ...].
+
+    Кадр с нулевой длиной (без типа) — ValueError: границы следующих
+    кадров после него уже не восстановить.
+    """
+    out = []
+    pos, n = 0, len(buf)
+    while n - pos >= 3:
+        size = buf[pos] | buf[pos + 1] << 8
+        if not size:
+            raise ValueError("кадр нулевой длины")
+        end = pos + 2 + size
+        if end > n:
+            break
+        out.append((buf[pos + 2], bytes(buf[pos + 3:end])))
+        pos = end
+    if pos:
+        del buf[:pos]
+    return out
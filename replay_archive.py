@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""Архив повторов Рыцарей и Замков: много партий в одном файле.
+
+Формат (little-endian): заголовок, повторы подряд (как Replay.to_bytes()),
+в конце — индекс по записи на партию. Файл читается через mmap; действия
+отдаются срезами memoryview без копирования, аналитика идёт потоком и
+держит в памяти только счётчики.
+
+    python replay_archive.py pack games.kca replays/*.kcr
+    python replay_archive.py stats games.kca
+    python replay_archive.py extract games.kca 17 game17.kcr
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+from collections import Counter
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # архиву окно не нужно
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import knights_and_castles as kc
+
+ARCHIVE_MAGIC = b"KCRA"
+ARCHIVE_VERSION = 1
+# magic, версия, партий, смещение индекса
+_HEAD = struct.Struct("<4sHIQ")
+# смещение повтора, длина, действий, ходов, кто ходил первым, победитель (0 — нет)
+_ENTRY = struct.Struct("<QIIIBB")
+
+
+class ArchiveWriter:
+    """Дописывает повторы в архив; индекс пишется при close()."""
+
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "wb")
+        self._f.write(_HEAD.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, 0, 0))
+        self._index = []
+
+    def add(self, replay):
+        """Добавить Replay; возвращает id партии в архиве."""
+        s = replay.summary()
+        data = replay.to_bytes()
+        self._index.append(_ENTRY.pack(self._f.tell(), len(data), s["actions"], s["turns"],
+                                       s["first_player"], s["winner"]))
+        self._f.write(data)
+        return len(self._index) - 1
+
+    def close(self):
+        if self._f.closed:
+            return
+        index_at = self._f.tell()
+        self._f.write(b"".join(self._index))
+        self._f.seek(0)
+        self._f.write(_HEAD.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, len(self._index), index_at))
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ReplayArchive:
+    """Архив только для чтения поверх mmap."""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buf = memoryview(self._mm)
+        if len(self._buf) < _HEAD.size:
+            raise ValueError("архив обрезан")
+        magic, version, self._count, index_at = _HEAD.unpack_from(self._buf)
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError("это не архив повторов")
+        if version != ARCHIVE_VERSION:
+            raise ValueError(f"версия архива {version} не поддерживается")
+        self._index = self._buf[index_at:index_at + self._count * _ENTRY.size]
+        if len(self._index) != self._count * _ENTRY.size:
+            raise ValueError("индекс архива обрезан")
+
+    def __len__(self):
+        return self._count
+
+    def close(self):
+        """Закрыть архив. Ещё живые срезы raw() и недочитанные итераторы
+        держат отображение сами — оно закроется вместе с последним из них."""
+        for view in (self._index, self._buf):
+            try:
+                view.release()
+            except BufferError:
+                pass
+        try:
+            self._mm.close()
+        except BufferError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        try:
+            self.close()
+        except Exception:
+            # Ошибка закрытия не должна подменять ошибку из тела with
+            if exc_type is None:
+                raise
+
+    def entry(self, game_id):
+        """Сводка партии из индекса: словарь без чтения самого повтора."""
+        if not 0 <= game_id < self._count:
+            raise IndexError(f"нет партии {game_id}")
+        off, size, actions, turns, first, winner = _ENTRY.unpack_from(
+            self._index, game_id * _ENTRY.size)
+        return {"id": game_id, "offset": off, "size": size, "actions": actions,
+                "turns": turns, "first_player": first, "winner": winner}
+
+    def entries(self):
+        for i, row in enumerate(_ENTRY.iter_unpack(self._index)):
+            off, size, actions, turns, first, winner = row
+            yield {"id": i, "offset": off, "size": size, "actions": actions,
+                   "turns": turns, "first_player": first, "winner": winner}
+
+    def raw(self, game_id):
+        """Сериализованный повтор партии — срез mmap без копирования."""
+        e = self.entry(game_id)
+        return self._buf[e["offset"]:e["offset"] + e["size"]]
+
+    def replay(self, game_id):
+        """Партия по id как Replay (можно перематывать и смотреть)."""
+        return kc.Replay.from_bytes(self.raw(game_id))
+
+    def actions(self, game_id):
+        """Действия партии (код, a, b) прямо из mmap."""
+        return kc.ACTION_RECORD.iter_unpack(kc.Replay.split(self.raw(game_id))[1])
+
+
+# ========================== АНАЛИТИКА ==========================
+
+def iter_actions(archive):
+    """Поток (id партии, код, a, b) по всему архиву."""
+    for game_id in range(len(archive)):
+        for code, a, b in archive.actions(game_id):
+            yield game_id, code, a, b
+
+
+def summarize(archive):
+    """Агрегаты по архиву за один проход, память — O(1) от числа партий."""
+    games = finished = first_wins = actions = turns = 0
+    for e in archive.entries():
+        games += 1
+        actions += e["actions"]
+        turns += e["turns"]
+        if e["winner"]:
+            finished += 1
+            first_wins += e["winner"] == e["first_player"]
+    spells, crafts = Counter(), Counter()
+    for _, code, a, _ in iter_actions(archive):
+        if code == kc.ACT_SPELL:
+            spells[kc.SPELL_RECIPES[a]["name"]] += 1
+        elif code == kc.ACT_CRAFT:
+            crafts[kc.WEAPON_RECIPES[a]["name"]] += 1
+    return {"games": games, "finished": finished,
+            "first_mover_win_rate": first_wins / finished if finished else None,
+            "avg_actions": actions / games if games else 0,
+            "avg_turns": turns / games if games else 0,
+            "spells": spells.most_common(), "crafts": crafts.most_common()}
+
+
+# ========================== CLI ==========================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Архив повторов")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("pack", help="собрать архив из файлов .kcr")
+    p.add_argument("archive")
+    p.add_argument("replays", nargs="+")
+    p = sub.add_parser("stats", help="сводка по архиву")
+    p.add_argument("archive")
+    p = sub.add_parser("extract", help="достать одну партию в .kcr")
+    p.add_argument("archive")
+    p.add_argument("id", type=int)
+    p.add_argument("out")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "pack":
+        with ArchiveWriter(args.archive) as w:
+            for path in args.replays:
+                w.add(kc.Replay.load(path))
+        print(f"{len(args.replays)} партий -> {args.archive}")
+    elif args.cmd == "stats":
+        with ReplayArchive(args.archive) as a:
+            for k, v in summarize(a).items():
+                print(f"{k}: {v}")
+    elif args.cmd == "extract":
+        with ReplayArchive(args.archive) as a, open(args.out, "wb") as f:
+            f.write(a.raw(args.id))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
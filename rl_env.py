@@ -0,0 +1,189 @@
+"""Векторная среда для обучения с подкреплением (в духе Gym).
+
+VectorEnv ведёт n партий сразу: reset(seed) и step(actions) принимают и
+возвращают массивы NumPy по всем партиям. Пространство действий
+дискретное и фиксированное для размера поля:
+
+    код * клеток + r * cols + c   для ACT_SELECT, ACT_MOVE, ACT_JUMP, ACT_SHOOT
+    далее по одному номеру: ACT_DRAW, заклинания, оружие, ACT_NEXT,
+    ACT_END, ACT_DESELECT (сдачи в пространстве нет)
+
+Наблюдения пишутся в заранее выделенные буферы — каждый шаг возвращает
+те же самые массивы, без копий (копируйте сами, если нужно хранить):
+
+    board      int16 (n, BOARD_PLANES, rows, cols) — плоскости PLANE_*
+    inventory  int16 (n, 2, артефактов) — свой, затем соперника
+    fire_shield  bool (n, 2) — свой, соперника
+    player     int8  (n,) — чей ход
+    mask       bool  (n, n_actions) — допустимые действия
+
+Всё дано с точки зрения того, чей ход: PLANE_OWNER — 1 свой, 2 чужой.
+Рельеф (terrain, из модуля terrain) одинаков для всех партий и считается
+один раз.
+
+Против opponent="ai" агент играет первым игроком, ход второго делает
+AIPlayer внутри step. При opponent="self" агент ходит за обоих.
+Награда: +1 за победу того, кто сделал действие, -1 за поражение.
+Закончившаяся партия сразу начинается заново со следующим зерном.
+
+    env = VectorEnv(64)
+    obs = env.reset(seed=0)
+    obs, rewards, terminated, truncated, info = env.step(actions)
+"""
+
+import os
+
+import numpy as np
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # окно не открывается
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import knights_and_castles as kc
+# TERRAIN_* — значения плоскости env.terrain
+from terrain import (TERRAIN_CASTLE1, TERRAIN_CASTLE2, TERRAIN_GROUND, TERRAIN_RUINS,
+                     TERRAIN_TOWER, terrain)
+
+(PLANE_TYPE, PLANE_OWNER, PLANE_HP, PLANE_ARMOR, PLANE_DAMAGE, PLANE_MOVES,
+ PLANE_DONE, PLANE_SELECTED) = range(8)
+BOARD_PLANES = 8
+CELL_CODES = (kc.ACT_SELECT, kc.ACT_MOVE, kc.ACT_JUMP, kc.ACT_SHOOT)
+MAX_TURNS = 500
+
+
+def action_table(rows, cols):
+    """Номер действия -> (код, a, b) для поля rows x cols."""
+    table = [(code, r, c) for code in CELL_CODES for r in range(rows) for c in range(cols)]
+    table.append((kc.ACT_DRAW, 0, 0))
+    table += [(kc.ACT_SPELL, i, 0) for i in range(len(kc.SPELL_RECIPES))]
+    table += [(kc.ACT_CRAFT, i, 0) for i in range(len(kc.WEAPON_RECIPES))]
+    table += [(kc.ACT_NEXT, 0, 0), (kc.ACT_END, 0, 0), (kc.ACT_DESELECT, 0, 0)]
+    return table
+
+
+class VectorEnv:
+    """n партий с общим буфером наблюдений и масок."""
+
+    def __init__(self, n, rows=kc.ROWS, cols=kc.COLS, opponent="ai", max_turns=MAX_TURNS):
+        if opponent not in ("ai", "self"):
+            raise ValueError(f"opponent: 'ai' или 'self', а не {opponent!r}")
+        self.n = n
+        self.rows, self.cols = rows, cols
+        self.opponent = opponent
+        self.max_turns = max_turns
+        self.actions = action_table(rows, cols)
+        self.n_actions = len(self.actions)
+        self._index = {a: i for i, a in enumerate(self.actions)}
+        self._cells = rows * cols
+
+        self.board = np.zeros((n, BOARD_PLANES, rows, cols), np.int16)
+        self.inventory = np.zeros((n, 2, len(kc.ARTIFACT_NAMES)), np.int16)
+        self.fire_shield = np.zeros((n, 2), bool)
+        self.player = np.zeros(n, np.int8)
+        self.mask = np.zeros((n, self.n_actions), bool)
+        self.rewards = np.zeros(n, np.float32)
+        self.terminated = np.zeros(n, bool)
+        self.truncated = np.zeros(n, bool)
+        self.illegal = np.zeros(n, bool)
+        self.obs = {"board": self.board, "inventory": self.inventory,
+                    "fire_shield": self.fire_shield, "player": self.player,
+                    "mask": self.mask}
+
+        self.games = [None] * n
+        self.turns = [0] * n
+        self.seed = 0
+        self.episodes = 0
+        self.terrain = None
+
+    # -------------------- Партии --------------------
+
+    def _new_game(self, i):
+        ai_sides = (2,) if self.opponent == "ai" else ()
+        game = kc.Game(rows=self.rows, cols=self.cols, seed=self.seed + self.episodes,
+                       ai_sides=ai_sides, headless=True)
+        self.episodes += 1
+        self.games[i] = game
+        self.turns[i] = 0
+        if self.terrain is None:
+            self.terrain = terrain(game.board)
+        self._observe(i)
+
+    def reset(self, seed=None):
+        """Начать все n партий; партия i получает зерно seed + i."""
+        if seed is not None:
+            self.seed = seed
+        self.episodes = 0
+        for i in range(self.n):
+            self._new_game(i)
+        self.rewards[:] = 0
+        self.terminated[:] = False
+        self.truncated[:] = False
+        return self.obs
+
+    def step(self, actions):
+        """Применить по одному действию в каждой партии.
+
+        Недопустимое действие (маска False) не выполняется: партия стоит,
+        info["illegal"] для неё True. Возвращает (obs, rewards, terminated,
+        truncated, info); массивы — одни и те же от шага к шагу.
+        """
+        table = self.actions
+        rewards, terminated, truncated = self.rewards, self.terminated, self.truncated
+        for i, a in enumerate(actions.tolist() if hasattr(actions, "tolist") else actions):
+            game = self.games[i]
+            rewards[i] = 0.0
+            terminated[i] = truncated[i] = False
+            self.illegal[i] = not self.mask[i, a]
+            if self.illegal[i]:
+                continue
+            player = game.current_player
+            game.apply_action(table[a])
+            if game.current_player != player:
+                self.turns[i] += 1
+                if game.is_ai_turn():
+                    game.play_out()
+                    self.turns[i] += 1
+            if game.state == "game_over":
+                terminated[i] = True
+                if game.winner is not None:
+                    rewards[i] = 1.0 if game.winner == player else -1.0
+            elif self.turns[i] >= self.max_turns:
+                truncated[i] = True
+            if terminated[i] or truncated[i]:
+                self._new_game(i)
+            else:
+                self._observe(i)
+        return self.obs, rewards, terminated, truncated, {"illegal": self.illegal}
+
+    # -------------------- Наблюдения --------------------
+
+    def _observe(self, i):
+        game = self.games[i]
+        me = game.current_player
+        self.player[i] = me
+        units = game.board.units
+        planes = self.board[i]
+        planes[:] = 0
+        if units:
+            sel = game.selected_unit
+            rows = [u.row for u in units]
+            cols = [u.col for u in units]
+            planes[:, rows, cols] = np.array(
+                [[kc.UNIT_TYPE_IDS[u.unit_type] + 1 for u in units],
+                 [1 if u.player == me else 2 for u in units],
+                 [u.hp for u in units],
+                 [u.armor for u in units],
+                 [u.damage for u in units],
+                 [u.moves_left for u in units],
+                 [u.done for u in units],
+                 [u is sel for u in units]], np.int16)
+        inv = self.inventory[i]
+        for k, p in enumerate((me, 3 - me)):
+            packed = game.inventory[p].packed
+            inv[k] = [(packed >> (kc.INV_LANE * j)) & kc.INV_MAX
+                      for j in range(len(kc.ARTIFACT_NAMES))]
+            self.fire_shield[i, k] = game.fire_shield[p]
+        mask = self.mask[i]
+        mask[:] = False
+        index = self._index
+        mask[[index[a] for a in game.legal_actions()]] = True
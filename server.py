@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""Сетевой сервер: много партий в одном процессе на asyncio.
+
+Каждая партия — безоконная Game; клиенты присылают только действия
+(код, a, b). Сервер проверяет их по правилам, применяет у себя и пересылает
+сопернику — тот применяет то же действие к своей копии партии. Копии
+сверяются по контрольным суммам; состояние целиком уходит клиенту только
+после отклонённого действия или расхождения суммы.
+
+Зрители получают снимок при входе и дельту на каждое действие
+(spectate.py); дельта кодируется один раз на всех зрителей партии.
+
+Формат сообщений — protocol.py.
+
+    python server.py --port 7777
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import sys
+import time
+import zlib
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # окно не открывается
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import knights_and_castles as kc
+import spectate
+from protocol import (MSG_JOIN, MSG_START, MSG_ACTION, MSG_REJECT, MSG_STATE,
+                      MSG_END, MSG_CHECK, MSG_DESYNC, MSG_SYNCED, MSG_WATCH,
+                      MSG_SNAPSHOT, MSG_DELTA, CHECK_EVERY, PORT, JOIN, START, END,
+                      STATE, CHECK, WATCH, frame, split_frames)
+
+WATCH_BUFFER = 16 * 1024  # сколько байт дельт копится у медленного зрителя
+WATCH_SNDBUF = 32 * 1024  # буфер ядра на зрителя: тысячи зрителей — не гигабайты
+
+
+# ========================== ПАРТИИ ==========================
+
+class Match:
+    """Партия на сервере: правила, два подключения (индексы 1 и 2) и
+    зрители. encoder есть, только пока есть зрители."""
+
+    __slots__ = ("id", "game", "conns", "count", "watchers", "encoder", "snap", "pending")
+
+    def __init__(self, match_id, rows, cols, seed):
+        self.id = match_id
+        self.game = kc.Game(rows=rows, cols=cols, seed=seed, headless=True)
+        self.conns = [None, None, None]
+        self.count = 0         # принятых действий
+        self.watchers = {}     # подключение -> None (упорядоченное множество)
+        self.encoder = None
+        self.snap = None       # (count, кадр снимка) — общий для входящих зрителей
+        self.pending = []      # кадры для зрителей до конца итерации цикла
+
+
+class Server:
+    """Подбор соперников и обработка действий всех партий."""
+
+    def __init__(self, rows=kc.ROWS, cols=kc.COLS):
+        self.rows, self.cols = rows, cols
+        self.matches = {}
+        self.waiting = {}      # код -> подключение, ждущее соперника
+        self._next_id = 1
+        self.actions = 0
+        self.busy = 0.0        # секунд внутри обработки действий
+        self.finished = 0
+        self.resyncs = 0
+        self.deltas = 0        # закодировано дельт
+        self.fanout = 0        # записей в сокеты зрителей (пачка дельт — одна запись)
+        self.dropped = 0       # пачек не отправлено медленным зрителям
+        self.snapshots = 0
+        self._watch_rr = 0
+
+    # -------------------- Подбор --------------------
+
+    def join(self, conn, code):
+        other = self.waiting.pop(code, None)
+        if other is None or other.transport.is_closing():
+            self.waiting[code] = conn
+            return
+        match = Match(self._next_id, self.rows, self.cols, kc.new_seed())
+        self._next_id += 1
+        self.matches[match.id] = match
+        for player, c in ((1, other), (2, conn)):
+            match.conns[player] = c
+            c.match, c.player = match, player
+            c.transport.write(frame(MSG_START, START.pack(
+                match.id, player, self.rows, self.cols, match.game.seed)))
+
+    def leave(self, conn):
+        if self.waiting.get(conn.code) is conn:
+            del self.waiting[conn.code]
+        if conn.watching is not None:
+            self.unwatch(conn)
+        match = conn.match
+        if match is None or match.id not in self.matches:
+            return
+        # Ушедший проигрывает
+        game = match.game
+        if game.state != "game_over":
+            game.winner = 2 if conn.player == 1 else 1
+            game.state = "game_over"
+        self.finish(match)
+
+    def finish(self, match):
+        del self.matches[match.id]
+        self.finished += 1
+        end = frame(MSG_END, END.pack(match.game.winner or 0))
+        for c in match.conns[1:]:
+            if not c.transport.is_closing():
+                c.transport.write(end)
+            c.match = None
+        if match.pending:
+            self.flush(match)
+        for w in match.watchers:
+            w.transport.write(end)
+            w.watching = None
+        match.watchers = {}
+        match.encoder = None
+
+    # -------------------- Зрители --------------------
+
+    def watch(self, conn, match_id):
+        """Подключить зрителя к партии match_id (0 — к любой, по кругу)."""
+        match = self.matches.get(match_id)
+        if match is None and match_id == 0 and self.matches:
+            live = list(self.matches.values())
+            match = live[self._watch_rr % len(live)]
+            self._watch_rr += 1
+        if match is None:
+            conn.transport.write(frame(MSG_END, END.pack(0)))
+            return
+        if conn.watching is not match:
+            if conn.watching is not None:
+                self.unwatch(conn)
+            if match.pending:
+                self.flush(match)   # старые дельты — только тем, у кого они по порядку
+            conn.watching = match
+            conn.transport.set_write_buffer_limits(high=WATCH_BUFFER)
+            sock = conn.transport.get_extra_info("socket")
+            if sock is not None:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, WATCH_SNDBUF)
+            if match.encoder is None:
+                match.encoder = spectate.DeltaEncoder(match.game)
+            match.watchers[conn] = None
+        self.bootstrap(conn)
+
+    def unwatch(self, conn):
+        match = conn.watching
+        conn.watching = None
+        match.watchers.pop(conn, None)
+        if not match.watchers:
+            match.encoder = None   # без зрителей дельты не считаем
+
+    def bootstrap(self, conn):
+        """Снимок партии для нового или отставшего зрителя."""
+        match = conn.watching
+        conn.stale = False
+        if match.pending:
+            self.flush(match)       # снимок должен идти после всех дельт
+        if match.snap is None or match.snap[0] != match.count:
+            match.snap = (match.count, frame(MSG_SNAPSHOT, WATCH.pack(match.id)
+                                             + spectate.snapshot(match.game, match.count)))
+            self.snapshots += 1
+        conn.transport.write(match.snap[1])
+
+    def broadcast(self, match, data):
+        """Отправить кадры зрителям. Кадры копятся до конца итерации цикла
+        событий: действия хода приходят пачкой, и зритель получает их одной
+        записью в сокет."""
+        if not match.pending:
+            asyncio.get_running_loop().call_soon(self.flush, match)
+        match.pending.append(data)
+
+    def flush(self, match):
+        """Одни и те же байты всем зрителям. Кто не успевает читать,
+        пропускает дельты и после разгрузки получает свежий снимок."""
+        data = b"".join(match.pending)
+        match.pending = []
+        for w in match.watchers:
+            if w.paused:
+                w.stale = True
+                self.dropped += 1
+            else:
+                w.transport.write(data)
+        self.fanout += len(match.watchers)
+
+    # -------------------- Действия --------------------
+
+    def act(self, conn, body):
+        if conn.resyncing:
+            return   # сделано на разошедшемся состоянии
+        t = time.perf_counter()
+        match = conn.match
+        game = match.game
+        action = kc.ACTION_RECORD.unpack(body)
+        if game.current_player != conn.player or not game.is_legal(action):
+            conn.transport.write(frame(MSG_REJECT, body))
+            self.resync(conn)
+        elif game.apply_action(action) is not False:
+            other = match.conns[3 - conn.player]
+            match.count += 1
+            check = b""
+            if match.count % CHECK_EVERY:
+                other.transport.write(frame(MSG_ACTION, body))
+            else:
+                check = frame(MSG_CHECK, CHECK.pack(match.count, game.checksum()))
+                other.transport.write(frame(MSG_ACTION, body) + check)
+                conn.transport.write(check)
+            if match.watchers:
+                self.deltas += 1
+                self.broadcast(match, frame(MSG_DELTA, match.encoder.encode(game, match.count))
+                               + check)
+            if game.state == "game_over":
+                self.finish(match)
+        self.actions += 1
+        self.busy += time.perf_counter() - t
+
+    def resync(self, conn):
+        """Отдать клиенту состояние целиком; до MSG_SYNCED его действия
+        отбрасываются."""
+        match = conn.match
+        conn.resyncing = True
+        self.resyncs += 1
+        conn.transport.write(frame(MSG_STATE, STATE.pack(match.count)
+                                   + zlib.compress(match.game.save_state())))
+
+    def stats(self):
+        per = self.busy / self.actions * 1e6 if self.actions else 0.0
+        return (f"партий: {len(self.matches)}, ждут: {len(self.waiting)}, "
+                f"завершено: {self.finished}, действий: {self.actions} "
+                f"({per:.1f} мкс на действие), пересинхронизаций: {self.resyncs}, "
+                f"зрителей: {sum(len(m.watchers) for m in self.matches.values())}, "
+                f"дельт: {self.deltas} (записей зрителям {self.fanout}, пропущено {self.dropped}), "
+                f"снимков: {self.snapshots}")
+
+
+class Connection(asyncio.Protocol):
+    """Одно подключение клиента."""
+
+    def __init__(self, server):
+        self.server = server
+        self.transport = None
+        self.buf = bytearray()
+        self.match = None
+        self.player = 0
+        self.code = None
+        self.resyncing = False
+        self.watching = None   # партия, которую смотрит зритель
+        self.paused = False    # буфер отправки переполнен
+        self.stale = False     # пропустил дельты — нужен снимок
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buf += data
+        try:
+            frames = split_frames(self.buf)
+        except ValueError:
+            self.transport.close()   # поток сбит — кадры дальше не разобрать
+            return
+        for msg, body in frames:
+            if msg == MSG_ACTION and self.match is not None \
+                    and len(body) == kc.ACTION_RECORD.size:
+                self.server.act(self, body)
+            elif msg == MSG_DESYNC and self.match is not None and not self.resyncing:
+                self.server.resync(self)
+            elif msg == MSG_SYNCED:
+                self.resyncing = False
+            elif msg == MSG_WATCH and self.match is None and len(body) == WATCH.size:
+                self.server.watch(self, WATCH.unpack(body)[0])
+            elif msg == MSG_JOIN and self.code is None and len(body) == JOIN.size:
+                self.code = JOIN.unpack(body)[0]
+                self.server.join(self, self.code)
+
+    def connection_lost(self, exc):
+        self.server.leave(self)
+
+    # Клиент не читает — перестаём читать и его сообщения
+    def pause_writing(self):
+        self.paused = True
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self.paused = False
+        self.transport.resume_reading()
+        if self.stale and self.watching is not None:
+            self.server.bootstrap(self)
+
+
+async def serve(host, port, rows=kc.ROWS, cols=kc.COLS, stats_every=0):
+    server = Server(rows, cols)
+    loop = asyncio.get_running_loop()
+    srv = await loop.create_server(lambda: Connection(server), host, port)
+    stop = loop.create_future()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.cancel)
+        except NotImplementedError:
+            break   # Windows: Ctrl+C придёт как KeyboardInterrupt в main
+    print(f"сервер слушает {host}:{port}", file=sys.stderr)
+    try:
+        async with srv:
+            while not stop.done():
+                await asyncio.wait([stop], timeout=stats_every or None)
+                if stats_every and not stop.done():
+                    print(server.stats(), file=sys.stderr)
+    finally:
+        print(server.stats(), file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сервер сетевой игры")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--rows", type=int, default=kc.ROWS)
+    parser.add_argument("--cols", type=int, default=kc.COLS)
+    parser.add_argument("--stats", type=float, default=0, metavar="SEC",
+                        help="печатать статистику каждые SEC секунд")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.rows, args.cols, args.stats))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
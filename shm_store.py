@@ -0,0 +1,180 @@
+"""Общая память для параллельного поиска: позиции и таблица транспозиций.
+
+Процессы пула не пересылают друг другу партии через pickle: родитель
+кладёт сохранения (save_state()) в PositionStore, воркеру передаётся
+только имя блока и номер слота. Воркер читает позицию без копии
+(memoryview прямо в общую память, её понимает Game.load_state) и пишет
+результат в тот же слот.
+
+Слот PositionStore (фиксированный размер):
+    <I длина сохранения, <i счёт, <Q узлов, <BHH лучшее действие,
+    затем сохранение (до capacity байт).
+
+TranspositionTable — открытая адресация без блокировок: запись из трёх
+<Q (проверка, данные, действие), где проверка = ключ ^ данные ^ действие.
+Разорванную одновременной записью запись проверка не пропустит — она
+читается как промах.
+
+    with PositionStore.for_game(game, slots=64) as store:
+        store.put(0, game.save_state())
+        pool.map(work, [(store.name, i) for i in range(n)])
+        score, nodes, action = store.result(0)
+"""
+
+import hashlib
+import struct
+from multiprocessing import shared_memory
+
+import knights_and_castles as kc
+
+_SLOT_LEN = struct.Struct("<I")
+_SLOT_RESULT = struct.Struct("<iQBHH")
+_SLOT_HEAD = _SLOT_LEN.size + _SLOT_RESULT.size
+_TT_ENTRY = struct.Struct("<QQQ")
+_SCORE_BIAS = 1 << 31          # счёт хранится со сдвигом — без знака
+NO_ACTION = (0xFF, 0, 0)       # «лучшего действия нет» в слоте
+# Границы счёта в таблице транспозиций
+BOUND_EXACT, BOUND_LOWER, BOUND_UPPER = 0, 1, 2
+
+
+def position_key(state):
+    """64-битный ключ позиции по сохранению; флаги ИИ не учитываются
+    (как в Game.checksum)."""
+    at = kc._SAVE_FLAGS_AT
+    h = hashlib.blake2b(state[:at], digest_size=8)
+    h.update(bytes((state[at] & (kc._FLAG_SHIELD1 | kc._FLAG_SHIELD2),)))
+    h.update(state[at + 1:])
+    return int.from_bytes(h.digest(), "little")
+
+
+def _open(name, size=0):
+    """Создать блок на size байт (name=None) или подключиться к существующему."""
+    if name is None:
+        return shared_memory.SharedMemory(create=True, size=size), True
+    # Процессы пула (fork и spawn) делят трекер ресурсов с создателем:
+    # повторная регистрация ничего не меняет, удаляет блок только владелец
+    return shared_memory.SharedMemory(name=name), False
+
+
+class _Shared:
+    """Общее для хранилищ: владение блоком и закрытие."""
+
+    def close(self):
+        """Закрыть блок; владелец его и удаляет. Живые представления
+        из state() не мешают: отображение уйдёт вместе с последним из них."""
+        try:
+            self.buf.release()
+            try:
+                self.shm.close()
+            except BufferError:
+                # Отображение держат чужие представления — оставляем его им,
+                # а дескриптор закрываем сейчас
+                self.shm._mmap = None
+                self.shm.close()
+        finally:
+            if self.owner:
+                self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def name(self):
+        return self.shm.name
+
+
+# ========================== ПОЗИЦИИ ==========================
+
+class PositionStore(_Shared):
+    """slots слотов по capacity байт сохранения в одном блоке общей памяти.
+
+    PositionStore(slots, capacity) создаёт блок;
+    PositionStore(name=...) подключается к нему в воркере.
+    """
+
+    def __init__(self, slots=0, capacity=0, name=None):
+        if name is not None:
+            self.shm, self.owner = _open(name)
+            slots, capacity = struct.unpack_from("<II", self.shm.buf)
+        else:
+            self.shm, self.owner = _open(None, 8 + slots * (_SLOT_HEAD + capacity))
+            struct.pack_into("<II", self.shm.buf, 0, slots, capacity)
+        self.slots, self.capacity = slots, capacity
+        self.stride = _SLOT_HEAD + capacity
+        self.buf = self.shm.buf[8:8 + slots * self.stride]
+
+    @classmethod
+    def for_game(cls, game, slots):
+        """Хранилище, куда поместится любая позиция этой партии: юнитов
+        по ходу партии не прибавляется."""
+        return cls(slots, len(game.save_state()))
+
+    def put(self, slot, state):
+        """Положить позицию в слот и сбросить его результат."""
+        if len(state) > self.capacity:
+            raise ValueError(f"позиция {len(state)} байт, слот — {self.capacity}")
+        off = slot * self.stride
+        _SLOT_LEN.pack_into(self.buf, off, len(state))
+        _SLOT_RESULT.pack_into(self.buf, off + _SLOT_LEN.size, 0, 0, *NO_ACTION)
+        self.buf[off + _SLOT_HEAD:off + _SLOT_HEAD + len(state)] = state
+
+    def state(self, slot):
+        """Позиция слота — memoryview без копирования."""
+        off = slot * self.stride + _SLOT_HEAD
+        return self.buf[off:off + _SLOT_LEN.unpack_from(self.buf, off - _SLOT_HEAD)[0]]
+
+    def publish(self, slot, score, nodes, action=NO_ACTION):
+        """Записать результат поиска по позиции слота."""
+        _SLOT_RESULT.pack_into(self.buf, slot * self.stride + _SLOT_LEN.size,
+                               score, nodes, *action)
+
+    def result(self, slot):
+        """(счёт, узлов, действие или None)."""
+        score, nodes, code, a, b = _SLOT_RESULT.unpack_from(
+            self.buf, slot * self.stride + _SLOT_LEN.size)
+        return score, nodes, None if code == NO_ACTION[0] else (code, a, b)
+
+
+# ========================== ТАБЛИЦА ТРАНСПОЗИЦИЙ ==========================
+
+class TranspositionTable(_Shared):
+    """Кэш поиска на 2**bits записей в общей памяти, общий для всех
+    процессов. Запись: ключ позиции, счёт, глубина, вид границы и лучшее
+    действие. Для той же позиции остаётся более глубокий поиск; другая
+    позиция в той же ячейке всегда вытесняет прежнюю (замена «всегда»)."""
+
+    def __init__(self, bits=16, name=None):
+        if name is not None:
+            self.shm, self.owner = _open(name)
+            bits = self.shm.buf[0]
+        else:
+            self.shm, self.owner = _open(None, 8 + (_TT_ENTRY.size << bits))
+            self.shm.buf[0] = bits
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.buf = self.shm.buf[8:8 + (_TT_ENTRY.size << bits)]
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        """(счёт, глубина, граница, действие) или None."""
+        check, data, move = _TT_ENTRY.unpack_from(self.buf, (key & self.mask) * _TT_ENTRY.size)
+        if check ^ data ^ move != key or not data:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return ((data & 0xFFFFFFFF) - _SCORE_BIAS, data >> 32 & 0xFF, data >> 40 & 0xFF,
+                (move & 0xFF, move >> 8 & 0xFFFFFF, move >> 32))
+
+    def put(self, key, score, depth, bound=BOUND_EXACT, action=NO_ACTION):
+        off = (key & self.mask) * _TT_ENTRY.size
+        check, data, move = _TT_ENTRY.unpack_from(self.buf, off)
+        if check ^ data ^ move == key and data and (data >> 32 & 0xFF) > depth:
+            return   # та же позиция уже посчитана глубже
+        # Бит 48 — признак занятой записи (данные пустой записи — ноль)
+        data = (score + _SCORE_BIAS) | depth << 32 | bound << 40 | 1 << 48
+        code, a, b = action
+        move = code | a << 8 | b << 32
+        _TT_ENTRY.pack_into(self.buf, off, key ^ data ^ move, data, move)
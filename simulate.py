@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Пакетная симуляция: ИИ против ИИ без окна.
+
+Партии с зёрнами seed..seed+games-1 раскладываются по пулу процессов; на
+каждую партию в вывод пишется одна строка JSON, в stderr — итог и
+скорость (партий в секунду).
+
+    python simulate.py --games 1000 --seed 0 --workers 8 > results.jsonl
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # окно не открывается
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import knights_and_castles as kc
+
+MAX_TURNS = 500
+
+
+def play_game(seed, rows=kc.ROWS, cols=kc.COLS, max_turns=MAX_TURNS):
+    """Сыграть одну партию ИИ против ИИ; итог — словарь для JSONL."""
+    t = time.perf_counter()
+    game = kc.Game(seed=seed, rows=rows, cols=cols, ai_sides=(1, 2), headless=True)
+    turns = game.play_out(max_turns)
+    actions = Counter(code for code, _, _ in game.replay)
+    return {"seed": seed, "winner": game.winner, "turns": turns,
+            "actions": len(game.replay),
+            "units_left": {p: game.board.alive_count(p) for p in (1, 2)},
+            "artifacts_drawn": game.board.ruins.draws,
+            "spells_cast": actions[kc.ACT_SPELL],
+            "weapons_crafted": actions[kc.ACT_CRAFT],
+            "seconds": round(time.perf_counter() - t, 4)}
+
+
+def _play(args):
+    return play_game(*args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Симуляция партий ИИ против ИИ")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0, help="зерно первой партии")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="процессов в пуле (1 — без пула)")
+    parser.add_argument("--max-turns", type=int, default=MAX_TURNS,
+                        help="ничья, если за столько ходов нет победителя")
+    parser.add_argument("--rows", type=int, default=kc.ROWS)
+    parser.add_argument("--cols", type=int, default=kc.COLS)
+    parser.add_argument("--out", help="файл JSONL (по умолчанию stdout)")
+    args = parser.parse_args(argv)
+
+    jobs = [(seed, args.rows, args.cols, args.max_turns)
+            for seed in range(args.seed, args.seed + args.games)]
+    out = open(args.out, "w") if args.out else sys.stdout
+    wins = Counter()
+    t = time.perf_counter()
+    pool = None
+    try:
+        if args.workers > 1:
+            pool = ProcessPoolExecutor(args.workers)
+            results = pool.map(_play, jobs, chunksize=max(1, len(jobs) // (args.workers * 8)))
+        else:
+            results = map(_play, jobs)
+        for rec in results:
+            wins[rec["winner"]] += 1
+            out.write(json.dumps(rec) + "\n")
+            out.flush()
+    finally:
+        # И при ошибке или Ctrl+C: процессы пула не остаются висеть
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        if args.out:
+            out.close()
+    elapsed = time.perf_counter() - t
+    print(f"{args.games} партий за {elapsed:.1f} с ({args.games / elapsed:.1f} партий/с); "
+          f"победы P1: {wins[1]}, P2: {wins[2]}, без победителя: {wins[None]}",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
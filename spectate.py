@@ -0,0 +1,174 @@
+"""Трансляция партии зрителям: снимок для входа и дельта на каждое действие.
+
+Сервер кодирует дельту один раз и пишет одни и те же байты всем зрителям
+партии. В дельте — только то, что изменилось: юниты (по uid сервера),
+убранные юниты, инвентари, огненный щит и заголовок хода. Зритель
+поддерживает у себя копию партии: сначала снимок, затем дельты.
+
+Снимок: число действий <I, юнитов <H, их uid (<H каждый), zlib(save_state()).
+Дельта: DELTA_HEAD, изменённые юниты (uid + запись юнита сохранения),
+uid убранных, изменённые инвентари, занятость башен (если менялась).
+"""
+
+import struct
+import zlib
+from operator import attrgetter
+
+import knights_and_castles as kc
+
+NO_UNIT = 0xFFFF
+# число действий, игрок, units_acted, состояние, победитель, флаги,
+# выбранный (uid), вытянуто карт, изменённых юнитов, убранных, маска инвентарей
+DELTA_HEAD = struct.Struct("<IBBBBBHIHHB")
+_FLAG_TOWERS = 4   # флаги 1 и 2 — огненный щит, как в сохранении
+_SNAP_HEAD = struct.Struct("<IH")
+_UID = struct.Struct("<H")
+_UNIT = kc._SAVE_UNIT
+# Меняющиеся поля юнита: сравнение кортежей дешевле упаковки каждой записи
+_UNIT_STATE = attrgetter("row", "col", "hp", "max_hp", "damage", "armor", "max_armor",
+                         "max_moves", "moves_left", "done", "active")
+
+
+def _record(u):
+    return _UNIT.pack(kc.UNIT_TYPE_IDS[u.unit_type], u.player, u.row, u.col, u.hp,
+                      u.max_hp, u.damage, u.armor, u.max_armor, u.max_moves,
+                      u.moves_left,
+                      (kc._FLAG_DONE if u.done else 0) | (kc._FLAG_ACTIVE if u.active else 0))
+
+
+def _uid(unit):
+    return NO_UNIT if unit is None else unit.uid
+
+
+def snapshot(game, count):
+    """Снимок для зрителя, который входит посреди партии."""
+    uids = [u.uid for u in game.board.units]
+    return (_SNAP_HEAD.pack(count, len(uids)) + struct.pack(f"<{len(uids)}H", *uids)
+            + zlib.compress(game.save_state()))
+
+
+class DeltaEncoder:
+    """Серверная сторона: помнит, что уже отправлено, и кодирует разницу."""
+
+    __slots__ = ("units", "inv", "towers")
+
+    def __init__(self, game):
+        self.units = {u.uid: _UNIT_STATE(u) for u in game.board.units}
+        self.inv = (game.inventory[1].packed, game.inventory[2].packed)
+        self.towers = tuple(_uid(mt.occupant) for mt in game.board.mage_towers)
+
+    def encode(self, game, count):
+        b = game.board
+        prev = self.units
+        units = {}
+        changed = []
+        for u in b.units:
+            st = units[u.uid] = _UNIT_STATE(u)
+            if prev.get(u.uid) != st:
+                changed.append(_UID.pack(u.uid) + _record(u))
+        removed = [uid for uid in prev if uid not in units]
+        self.units = units
+
+        inv = (game.inventory[1].packed, game.inventory[2].packed)
+        mask = (inv[0] != self.inv[0]) | (inv[1] != self.inv[1]) << 1
+        self.inv = inv
+        towers = tuple(_uid(mt.occupant) for mt in b.mage_towers)
+        flags = ((kc._FLAG_SHIELD1 if game.fire_shield[1] else 0)
+                 | (kc._FLAG_SHIELD2 if game.fire_shield[2] else 0)
+                 | (_FLAG_TOWERS if towers != self.towers else 0))
+        self.towers = towers
+
+        parts = [DELTA_HEAD.pack(count, game.current_player, game.units_acted,
+                                 kc.GAME_STATES.index(game.state), game.winner or 0,
+                                 flags, _uid(game.selected_unit), b.ruins.draws,
+                                 len(changed), len(removed), mask)]
+        parts += changed
+        if removed:
+            parts.append(struct.pack(f"<{len(removed)}H", *removed))
+        for p in (1, 2):
+            if mask & p:
+                inv_p = game.inventory[p]
+                parts.append(kc._SAVE_INV.pack(*[inv_p[name] for name in kc.ARTIFACT_NAMES]))
+        if flags & _FLAG_TOWERS:
+            parts.append(struct.pack(f"<{len(towers)}H", *towers))
+        return b"".join(parts)
+
+
+class DeltaDecoder:
+    """Сторона зрителя: применяет снимок и дельты к своей партии."""
+
+    def __init__(self, game):
+        self.game = game
+        self.by_uid = {}   # uid на сервере -> юнит своей партии
+        self.count = 0
+
+    def load(self, body):
+        count, n = _SNAP_HEAD.unpack_from(body)
+        off = _SNAP_HEAD.size
+        uids = struct.unpack_from(f"<{n}H", body, off)
+        self.game.load_state(zlib.decompress(body[off + 2 * n:]))
+        self.by_uid = dict(zip(uids, self.game.board.units))
+        self.count = count
+
+    def apply(self, body):
+        g = self.game
+        b = g.board
+        by_uid = self.by_uid
+        (count, player, acted, state, winner, flags, selected, draws,
+         n_changed, n_removed, mask) = DELTA_HEAD.unpack_from(body)
+        off = DELTA_HEAD.size
+        changed = []
+        for _ in range(n_changed):
+            changed.append((_UID.unpack_from(body, off)[0], _UNIT.unpack_from(body, off + 2)))
+            off += 2 + _UNIT.size
+        removed = struct.unpack_from(f"<{n_removed}H", body, off)
+        off += 2 * n_removed
+
+        # Сначала убираем: на освободившуюся клетку может встать другой юнит
+        dead = [by_uid.pop(uid) for uid in removed if uid in by_uid]
+        for u in dead:
+            u.hp = 0
+        b.remove_dead(dead)
+        for uid, (t, up, r, c, hp, max_hp, dmg, armor, max_armor, max_moves,
+                  moves_left, uf) in changed:
+            u = by_uid.get(uid)
+            if u is None:
+                u = by_uid[uid] = kc.UNIT_CLASSES[kc.UNIT_TYPES[t]](up, r, c)
+                b.add_unit(u)
+            elif (u.row, u.col) != (r, c):
+                b.move(u, r, c)
+            u.hp, u.max_hp, u.damage = hp, max_hp, dmg
+            u.armor, u.max_armor = armor, max_armor
+            u.max_moves, u.moves_left = max_moves, moves_left
+            u.done, u.active = bool(uf & kc._FLAG_DONE), bool(uf & kc._FLAG_ACTIVE)
+
+        for p in (1, 2):
+            if mask & p:
+                counts = kc._SAVE_INV.unpack_from(body, off)
+                off += kc._SAVE_INV.size
+                g.inventory[p] = kc.Inventory(sum(n << (kc.INV_LANE * i)
+                                                  for i, n in enumerate(counts)))
+        if flags & _FLAG_TOWERS:
+            towers = struct.unpack_from(f"<{len(b.mage_towers)}H", body, off)
+            for mt, uid in zip(b.mage_towers, towers):
+                mt.occupant = by_uid.get(uid)
+
+        g.fire_shield = {1: bool(flags & kc._FLAG_SHIELD1), 2: bool(flags & kc._FLAG_SHIELD2)}
+        if draws != b.ruins.draws:
+            b.ruins.restore(b.ruins.seed, draws)
+        g.current_player, g.units_acted = player, acted
+        g.state = kc.GAME_STATES[state]
+        g.winner = winner or None
+        g.selected_unit = by_uid.get(selected)
+        g.move_highlights = []
+        g.attack_highlights = []
+        g.jump_targets = {}
+        g.move_costs = {}
+        g.jump_costs = {}
+        if g.state == "game_over":
+            g.message = f"ПОБЕДА ИГРОКА {winner}!" if winner else "Партия окончена"
+        else:
+            if g.selected_unit is not None and g.state == "move":
+                g.calc_moves(g.selected_unit)
+            g.update_message()
+        self.count = count
@@ -0,0 +1,23 @@
+"""Рельеф поля плоскостью NumPy: общее для rl_env и batch_eval.
+
+Отдельный модуль, чтобы оценщик не тянул за собой настройки среды
+(rl_env выключает окно и звук SDL уже при импорте).
+"""
+
+import numpy as np
+
+TERRAIN_GROUND, TERRAIN_CASTLE1, TERRAIN_CASTLE2, TERRAIN_RUINS, TERRAIN_TOWER = range(5)
+
+
+def terrain(board):
+    """Плоскость рельефа TERRAIN_* для доски."""
+    t = np.zeros((board.rows, board.cols), np.int8)
+    for castle, kind in ((board.castle1, TERRAIN_CASTLE1), (board.castle2, TERRAIN_CASTLE2)):
+        for r, c in castle.cells:
+            if board.in_bounds(r, c):
+                t[r, c] = kind
+    for r, c in board.ruins.cells:
+        t[r, c] = TERRAIN_RUINS
+    for mt in board.mage_towers:
+        t[mt.row, mt.col] = TERRAIN_TOWER
+    return t
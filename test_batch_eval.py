@@ -0,0 +1,53 @@
+"""Ядра batch_eval против скалярной оценки AIPlayer._score_move."""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pytest
+
+pytest.importorskip("numpy")
+
+import batch_eval
+import knights_and_castles as kc
+
+MAX_ACTIONS = 600
+
+
+def _positions(seed):
+    """Позиции партии ИИ против ИИ — с начала хода каждой стороны."""
+    game = kc.Game(seed=seed, headless=True, ai_sides=(1, 2))
+    while game.state != "game_over" and len(game.replay) < MAX_ACTIONS:
+        if game.selected_unit is None:
+            yield game
+        game.apply_action(game.ai_players[game.current_player].next_action())
+
+
+@pytest.mark.parametrize("seed", [0, 3])
+def test_score_unit_matches_score_move(seed):
+    checked = 0
+    for game in _positions(seed):
+        ai = kc.AIPlayer(game, game.current_player)
+        for unit in game.board.player_units(game.current_player):
+            moves, attacks = batch_eval.score_unit(game, unit)
+            for (r, c), score in moves:
+                assert score == ai._score_move(unit, r, c), (unit.unit_type, r, c)
+            for (r, c), score in attacks:
+                # Прыжок бьёт того, через кого перепрыгивает
+                target = game.board.unit_at(r, c) if unit.unit_type == "archer" \
+                    else game.board.unit_at((unit.row + r) // 2, (unit.col + c) // 2)
+                assert score == ai._score_move(unit, r, c, True, target), (unit.unit_type, r, c)
+            checked += len(moves) + len(attacks)
+    assert checked > 1000
+
+
+def test_score_unit_keeps_selected_highlights():
+    game = kc.Game(seed=3, headless=True)
+    game.apply_action((kc.ACT_SELECT, 3, 4))
+    before = (list(game.move_highlights), list(game.attack_highlights),
+              dict(game.jump_targets), dict(game.move_costs), dict(game.jump_costs))
+    batch_eval.score_unit(game, game.board.unit_at(0, 6))
+    assert (game.move_highlights, game.attack_highlights, game.jump_targets,
+            game.move_costs, game.jump_costs) == before
+    assert not game.is_legal((kc.ACT_MOVE, 0, 7))
@@ -0,0 +1,43 @@
+"""Кадры протокола: разбор и отказ от сбитого потока."""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pytest
+
+from protocol import JOIN, MSG_JOIN, MSG_SYNCED, frame, split_frames
+
+
+def test_split_frames_keeps_partial_tail():
+    data = frame(MSG_JOIN, JOIN.pack(7)) + frame(MSG_SYNCED)
+    buf = bytearray(data + data[:3])
+    assert split_frames(buf) == [(MSG_JOIN, JOIN.pack(7)), (MSG_SYNCED, b"")]
+    assert buf == data[:3]
+
+
+def test_split_frames_rejects_zero_length():
+    buf = bytearray(b"\x00\x00" + frame(MSG_SYNCED))
+    with pytest.raises(ValueError):
+        split_frames(buf)
+
+
+class _Transport:
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+    def write(self, data):
+        pass
+
+
+def test_server_closes_on_zero_length_frame():
+    import server
+
+    conn = server.Connection(server.Server())
+    conn.connection_made(_Transport())
+    conn.data_received(b"\x00\x00" + frame(MSG_JOIN, JOIN.pack(7)))
+    assert conn.transport.closed
+    assert conn.code is None
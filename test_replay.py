@@ -0,0 +1,42 @@
+"""Перемотка повтора совпадает с живой партией ИИ против ИИ."""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pytest
+
+import knights_and_castles as kc
+
+MAX_ACTIONS = 3000
+
+
+@pytest.mark.parametrize("seed", [0, 1])
+def test_seek_matches_live_game(seed):
+    game = kc.Game(seed=seed, headless=True, ai_sides=(1, 2))
+    live = [game.save_state()]
+    while game.state != "game_over" and len(game.replay) < MAX_ACTIONS:
+        game.apply_action(game.ai_players[game.current_player].next_action())
+        live.append(game.save_state())
+    replay = game.replay
+    # Снимки после выбора юнита ИИ — тот случай, что раньше расходился
+    assert len(replay) > 2 * replay.snapshot_every
+
+    viewer = kc.Game(headless=True)
+    for i, state in enumerate(live):
+        replay.seek(viewer, i)
+        assert viewer.save_state() == state, f"позиция {i}"
+
+
+def test_load_position_at_snapshot(tmp_path):
+    from analysis import load_position
+
+    game = kc.Game(seed=0, headless=True, ai_sides=(1, 2))
+    while game.state != "game_over" and len(game.replay) < MAX_ACTIONS:
+        game.apply_action(game.ai_players[game.current_player].next_action())
+    game.replay.finish(game)
+    path = tmp_path / "game.kcr"
+    path.write_bytes(game.replay.to_bytes())
+    for n, state in game.replay.snapshots[1:]:
+        assert load_position(path, n) == state
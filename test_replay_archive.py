@@ -0,0 +1,45 @@
+"""Архив повторов: закрытие при живых срезах и недочитанных итераторах."""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pytest
+
+import knights_and_castles as kc
+from replay_archive import ArchiveWriter, ReplayArchive
+
+
+@pytest.fixture
+def archive(tmp_path):
+    path = tmp_path / "games.kca"
+    with ArchiveWriter(path) as w:
+        for seed in (0, 1):
+            game = kc.Game(seed=seed, headless=True, ai_sides=(1, 2))
+            for _ in range(100):
+                game.apply_action(game.ai_players[game.current_player].next_action())
+            game.replay.finish(game)
+            w.add(game.replay)
+    return path
+
+
+def test_close_with_live_exports(archive):
+    with ReplayArchive(archive) as a:
+        raw = a.raw(0)
+        expected = bytes(raw)
+        entries = a.entries()
+        next(entries)
+        actions = a.actions(1)
+        next(actions)
+    assert bytes(raw) == expected
+    assert next(actions)
+    del raw, entries, actions
+
+
+def test_exit_keeps_body_error(archive):
+    with pytest.raises(KeyError):
+        with ReplayArchive(archive) as a:
+            actions = a.actions(0)
+            next(actions)
+            raise KeyError("тело with")
@@ -0,0 +1,29 @@
+"""is_legal для действий извне согласован с legal_actions."""
+
+import os
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pytest
+
+import knights_and_castles as kc
+
+
+@pytest.mark.parametrize("action", [
+    (kc.ACT_NEXT, 0, 0), (kc.ACT_DRAW, 0, 0), (kc.ACT_DESELECT, 0, 0),
+    (kc.ACT_SPELL, 0, 0), (kc.ACT_CRAFT, 0, 0),
+])
+def test_unit_actions_need_selection(action):
+    game = kc.Game(seed=0, headless=True)
+    assert game.selected_unit is None
+    assert action not in game.legal_actions()
+    assert not game.is_legal(action)
+
+
+def test_legal_actions_pass_is_legal():
+    game = kc.Game(seed=0, headless=True, ai_sides=(1, 2))
+    while game.state != "game_over" and len(game.replay) < 1000:
+        for action in game.legal_actions():
+            assert game.is_legal(action), action
+        game.apply_action(game.ai_players[game.current_player].next_action())
@@ -0,0 +1,44 @@
+"""Повреждённые сохранения отвергаются с ValueError."""
+
+import os
+import struct
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pytest
+
+import knights_and_castles as kc
+
+_INV_AT = kc._SAVE_HEAD.size
+_UNITS_AT = _INV_AT + 2 * kc._SAVE_INV.size
+
+
+def _corrupt(fmt, at, value):
+    data = bytearray(kc.Game(seed=0, headless=True).save_state())
+    struct.pack_into(fmt, data, at if at >= 0 else len(data) + at, value)
+    return bytes(data)
+
+
+@pytest.mark.parametrize("fmt, at, value", [
+    ("<B", _UNITS_AT, 200),                            # тип юнита
+    ("<B", _UNITS_AT + 1, 3),                          # игрок юнита
+    ("<H", _UNITS_AT + 2, 60000),                      # строка
+    ("<H", _UNITS_AT + 4, 60000),                      # столбец
+    ("<h", kc._SAVE_HEAD.size - 4, 999),               # выбранный юнит
+    ("<h", -2, 999),                                   # хозяин башни
+    ("<H", _INV_AT, kc.INV_MAX + 1),                   # счётчик артефакта
+])
+def test_corrupt_save_raises_value_error(fmt, at, value):
+    data = _corrupt(fmt, at, value)
+    with pytest.raises(ValueError):
+        kc.Game(headless=True).load_state(data)
+    with pytest.raises(ValueError):
+        kc.decode_save(data)
+
+
+def test_save_round_trip():
+    game = kc.Game(seed=0, headless=True)
+    other = kc.Game(headless=True)
+    other.load_state(game.save_state())
+    assert other.save_state() == game.save_state()
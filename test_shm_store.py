@@ -0,0 +1,34 @@
+"""Общая память: закрытие при живых представлениях из state()."""
+
+import os
+import warnings
+
+import pytest
+
+import shm_store
+
+
+def _exists(name):
+    return os.path.exists(os.path.join("/dev/shm", name.lstrip("/")))
+
+
+def test_close_with_live_state_view():
+    state = bytes(range(64))
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        with shm_store.PositionStore(2, len(state)) as store:
+            store.put(0, state)
+            view = store.state(0)
+        assert bytes(view) == state
+        if os.path.isdir("/dev/shm"):
+            assert not _exists(store.name)
+        del view
+
+
+def test_close_reraises_body_error():
+    with pytest.raises(KeyError):
+        with shm_store.PositionStore(1, 8) as store:
+            store.put(0, b"abc")
+            view = store.state(0)
+            assert len(view) == 3
+            raise KeyError("тело with")